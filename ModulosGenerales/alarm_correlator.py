@@ -0,0 +1,308 @@
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+# Event-driven cross-camera alarm correlation.
+# Detections are plain timestamped events: the correlator keeps, per camera, the
+# time its current window opened and fires the alarm as soon as every required
+# camera has fired within the window. Window and cooldown expiries are timers in a
+# hashed timer wheel that is advanced by the calls themselves (or by tick()), so no
+# thread is created per detection and nothing sleeps. The clock is injectable, so
+# the decision logic can be driven step by step. RuleCorrelator runs several
+# independent rules (sets of cameras that must fire together) side by side.
+
+logger = logging.getLogger("snow").getChild("alarm_correlator")
+
+
+class Timer:
+
+    """
+    Handle of a scheduled callback. cancel() prevents it from firing.
+
+    """
+
+    __slots__ = ("deadline", "tick", "callback", "args", "cancelled")
+
+    def __init__(self, deadline: float, tick: int, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+
+    """
+    Hashed timer wheel: timers are bucketed by their deadline tick, so scheduling
+    and cancelling are O(1) and advancing only visits the elapsed slots. Not
+    thread-safe on its own; the owner serializes the calls.
+
+    """
+
+    def __init__(self, resolution: float = 0.001, slots: int = 4096, clock: Callable[[], float] = time.monotonic):
+        self.resolution = resolution # Seconds per tick
+        self.clock = clock
+        self._slots = [[] for _ in range(slots)]
+        self._tick = math.floor(clock() / resolution) # Last tick processed
+        self._pending = 0
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+
+        """
+        Runs callback(*args) once `delay` seconds from now have elapsed (on the
+        first advance() after that).
+
+        """
+
+        deadline = self.clock() + max(0.0, delay)
+        tick = max(self._tick + 1, math.ceil(deadline / self.resolution))
+        timer = Timer(deadline, tick, callback, args)
+        self._slots[tick % len(self._slots)].append(timer)
+        self._pending += 1
+        return timer
+
+    def advance(self, now: float | None = None) -> int:
+
+        """
+        Fires every timer whose deadline has passed, in deadline order. Returns how
+        many fired.
+
+        """
+
+        now = self.clock() if now is None else now
+        target = math.floor(now / self.resolution)
+        if target <= self._tick or not self._pending:
+            self._tick = max(self._tick, target)
+            return 0
+
+        # A gap longer than one revolution visits every slot once
+        ticks = range(self._tick + 1, target + 1)
+        if len(ticks) >= len(self._slots):
+            indices = range(len(self._slots))
+        else:
+            indices = (t % len(self._slots) for t in ticks)
+
+        due = []
+        for index in indices:
+            slot = self._slots[index]
+            if not slot:
+                continue
+            keep = []
+            for timer in slot:
+                if timer.cancelled:
+                    self._pending -= 1
+                elif timer.tick <= target:
+                    due.append(timer)
+                    self._pending -= 1
+                else:
+                    keep.append(timer) # Deadline in a later revolution
+            self._slots[index] = keep
+        self._tick = target
+
+        due.sort(key=lambda timer: timer.deadline)
+        for timer in due:
+            timer.callback(*timer.args)
+        return len(due)
+
+    def __len__(self) -> int:
+        return self._pending
+
+
+@dataclass(frozen=True)
+class Alarm:
+
+    """
+    Alarm raised by the correlator.
+
+    """
+
+    camera: str # Camera that opened the window (first detection)
+    last_camera: str # Camera whose detection completed the correlation
+    first_seen: dict # Camera -> timestamp of its first detection in the window
+    timestamp: float # Time of the completing detection
+    latency: float # Seconds from the completing detection to the decision
+    rule: str = "" # Name of the correlation rule that fired
+
+
+class AlarmCorrelator:
+
+    """
+    Fires an alarm when every camera in `cameras` has detected within `window`
+    seconds. After an alarm, new alarms are suppressed for `cooldown` seconds.
+
+    detection() returns the Alarm when it completes the correlation (and passes it
+    to `on_alarm`, which must not block). All state changes happen inside the calls;
+    tick() only needs to be called to expire idle windows on time.
+
+    """
+
+    def __init__(self,
+                 cameras: list[str],
+                 window: float,
+                 cooldown: float = 0.0,
+                 on_alarm: Callable[[Alarm], None] | None = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 resolution: float = 0.001,
+                 name: str = "",
+                 slots: int = 4096):
+        self.name = name
+        self.cameras = tuple(cameras)
+        self.window = window
+        self.cooldown = cooldown
+        self.on_alarm = on_alarm
+        self.clock = clock
+        self._wheel = TimerWheel(resolution, slots, clock)
+        self._first_seen = {} # Camera -> timestamp that opened its window
+        self._expiry = {} # Camera -> Timer that closes its window
+        self._cooling = None # Timer that ends the cooldown
+        self._lock = threading.Lock()
+
+        self.alarms = 0
+        self.expired = 0
+        self.suppressed = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def detection(self, camera: str, timestamp: float | None = None) -> Alarm | None:
+
+        """
+        Registers a detection of `camera` at `timestamp` (default: now).
+
+        """
+
+        with self._lock:
+            now = self.clock()
+            timestamp = now if timestamp is None else timestamp
+            self._wheel.advance(now)
+
+            if self._cooling is not None:
+                self.suppressed += 1
+                return None
+
+            if camera not in self._first_seen:
+                remaining = self.window - (now - timestamp)
+                if remaining < 0:
+                    return None # Event older than the window
+                self._first_seen[camera] = timestamp
+                self._expiry[camera] = self._wheel.schedule(remaining, self._expire, camera)
+
+            if not all(cam in self._first_seen for cam in self.cameras):
+                return None
+
+            alarm = self._fire(camera, timestamp)
+
+        if self.on_alarm is not None:
+            self.on_alarm(alarm)
+        return alarm
+
+    def _fire(self, camera: str, timestamp: float) -> Alarm:
+        first = min(self._first_seen, key=self._first_seen.get)
+        first_seen = dict(self._first_seen)
+        for timer in self._expiry.values():
+            timer.cancel()
+        self._first_seen.clear()
+        self._expiry.clear()
+        if self.cooldown > 0:
+            self._cooling = self._wheel.schedule(self.cooldown, self._end_cooldown)
+
+        latency = self.clock() - timestamp
+        self.alarms += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        return Alarm(first, camera, first_seen, timestamp, latency, self.name)
+
+    def _expire(self, camera: str) -> None:
+        self._first_seen.pop(camera, None)
+        self._expiry.pop(camera, None)
+        self.expired += 1
+        logger.debug(f"Detection window of {camera} expired")
+
+    def _end_cooldown(self) -> None:
+        self._cooling = None
+
+    def tick(self) -> None:
+
+        """
+        Expires the windows and cooldowns that are due.
+
+        """
+
+        with self._lock:
+            self._wheel.advance()
+
+    def is_active(self, camera: str) -> bool:
+
+        """
+        Returns True while `camera` has an open detection window.
+
+        """
+
+        with self._lock:
+            self._wheel.advance()
+            return camera in self._first_seen
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "alarms": self.alarms,
+                "expired_windows": self.expired,
+                "suppressed": self.suppressed,
+                "open_windows": sorted(self._first_seen),
+                "last_latency_ms": self.last_latency * 1000,
+                "max_latency_ms": self.max_latency * 1000,
+            }
+
+
+class RuleCorrelator:
+
+    """
+    Several AlarmCorrelators, one per rule (rule name -> (cameras, window)), fed
+    from the same detections. A detection only reaches the rules that include its
+    camera; each rule has its own window and cooldown. Same interface as
+    AlarmCorrelator.
+
+    """
+
+    def __init__(self,
+                 rules: dict[str, tuple[list[str], float]],
+                 cooldown: float = 0.0,
+                 on_alarm: Callable[[Alarm], None] | None = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rules = {
+            name: AlarmCorrelator(cameras, window, cooldown, on_alarm, clock, name=name)
+            for name, (cameras, window) in rules.items()
+        }
+        self._by_camera = {}
+        for correlator in self.rules.values():
+            for camera in correlator.cameras:
+                self._by_camera.setdefault(camera, []).append(correlator)
+
+    def detection(self, camera: str, timestamp: float | None = None) -> Alarm | None:
+
+        """
+        Registers a detection of `camera` in every rule that includes it. Returns the
+        last alarm raised by it (every alarm goes to `on_alarm`).
+
+        """
+
+        alarm = None
+        for correlator in self._by_camera.get(camera, ()):
+            alarm = correlator.detection(camera, timestamp) or alarm
+        return alarm
+
+    def tick(self) -> None:
+        for correlator in self.rules.values():
+            correlator.tick()
+
+    def is_active(self, camera: str) -> bool:
+        return any(correlator.is_active(camera) for correlator in self._by_camera.get(camera, ()))
+
+    def stats(self) -> dict[str, dict]:
+        return {name: correlator.stats() for name, correlator in self.rules.items()}
@@ -0,0 +1,223 @@
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pygame
+
+from config import AUDIO_TTL_ALARM, AUDIO_TTL_EMERGENCY, AUDIO_TTL_NORMAL
+
+# In-memory sound bank and audio cue scheduler.
+# Every configured sound is decoded once at startup into a pygame Sound (PCM in
+# memory), so playing it never touches the SD card. Callers only hand a cue to the
+# scheduler and return at once; a single playback thread plays the most urgent
+# pending cue on a dedicated mixer channel. A more urgent cue cuts the clip that is
+# playing, a cue that waited past its deadline is dropped instead of played late,
+# and a cue that is already pending is merged with the new request.
+
+logger = logging.getLogger("snow").getChild("audio_service")
+
+PRIORITY_EMERGENCY = 0 # Lower value = more urgent
+PRIORITY_ALARM = 1
+PRIORITY_NORMAL = 2
+
+DEFAULT_TTL = {
+    PRIORITY_EMERGENCY: AUDIO_TTL_EMERGENCY,
+    PRIORITY_ALARM: AUDIO_TTL_ALARM,
+    PRIORITY_NORMAL: AUDIO_TTL_NORMAL,
+}
+
+
+class SoundBank:
+
+    """
+    Decodes every sound (name -> file path) once and keeps it in memory.
+
+    """
+
+    def __init__(self, sounds: dict[str, str]):
+        self.sounds = {}
+        for name, path in sounds.items():
+            if not Path(path).is_file():
+                logger.error(f"Sound '{name}' not found: {path}")
+                continue
+            try:
+                self.sounds[name] = pygame.mixer.Sound(path)
+            except Exception as e:
+                logger.error(f"Sound '{name}' could not be decoded ({path}): {e}")
+        logger.info(f"Sound bank loaded: {sorted(self.sounds)}")
+
+    def get(self, name: str) -> "pygame.mixer.Sound | None":
+        return self.sounds.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sounds
+
+
+@dataclass
+class Cue:
+
+    """
+    Pending request to play a sound.
+
+    """
+
+    name: str
+    priority: int
+    sequence: int # Arrival order among cues of equal priority
+    created: float # Monotonic time the event behind the cue happened
+    deadline: float # Monotonic time after which the cue is not worth playing
+
+
+class AudioService:
+
+    """
+    Plays sounds of a SoundBank from its own thread, most urgent cue first and
+    cues of equal priority in arrival order. play() never blocks.
+
+    Only a strictly more urgent cue preempts the clip that is playing; the cut clip
+    is not resumed. A sound already pending is never queued twice: the pending
+    cue keeps its place and takes the higher priority and later deadline.
+
+    """
+
+    def __init__(self, bank: SoundBank, channel: int = 0, alpha: float = 0.1):
+        self.bank = bank
+        self.channel = pygame.mixer.Channel(channel) # Dedicated channel: sounds never mix with each other
+        self.alpha = alpha
+        self._pending = {} # Sound name -> Cue
+        self._current = None # Cue being played
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.played = 0
+        self.preempted = 0
+        self.expired = 0
+        self.merged = 0
+        self.mean_latency = None # Event to playback start, in seconds
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="AUDIO-SERVICE", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        with self._cond:
+            self._pending.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(2)
+            self._thread = None
+        self.channel.stop()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def play(self, name: str, priority: int = PRIORITY_NORMAL,
+             created: float | None = None, ttl: float | None = None) -> bool:
+
+        """
+        Schedules sound `name` and returns immediately. `created` is the monotonic
+        time of the event the cue reports (default: now) and `ttl` how long after it
+        the cue is still worth playing (default: by priority). Returns False if the
+        sound is not in the bank or the cue is already stale.
+
+        """
+
+        if name not in self.bank:
+            logger.warning(f"Sound '{name}' is not loaded")
+            return False
+
+        now = time.monotonic()
+        created = now if created is None else created
+        deadline = created + (DEFAULT_TTL.get(priority, AUDIO_TTL_NORMAL) if ttl is None else ttl)
+
+        with self._cond:
+            if deadline <= now:
+                self.expired += 1
+                logger.debug(f"Cue '{name}' dropped: stale on arrival")
+                return False
+            cue = self._pending.get(name)
+            if cue is not None:
+                cue.priority = min(cue.priority, priority)
+                cue.deadline = max(cue.deadline, deadline)
+                self.merged += 1
+            else:
+                self._pending[name] = Cue(name, priority, next(self._sequence), created, deadline)
+            self._cond.notify_all()
+        return True
+
+    def _next(self, now: float) -> Cue | None:
+        # Called with the condition held: drops stale cues and takes the most urgent one
+        for name, cue in list(self._pending.items()):
+            if cue.deadline <= now:
+                del self._pending[name]
+                self.expired += 1
+                logger.warning(f"Cue '{name}' dropped: {now - cue.created:.2f}s old, past its deadline")
+        if not self._pending:
+            return None
+        cue = min(self._pending.values(), key=lambda c: (c.priority, c.sequence))
+        del self._pending[cue.name]
+        return cue
+
+    def _outranked(self, cue: Cue, now: float) -> bool:
+        # Called with the condition held
+        return any(other.priority < cue.priority and other.deadline > now for other in self._pending.values())
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stop_event.is_set())
+                if self._stop_event.is_set():
+                    break
+                cue = self._next(time.monotonic())
+                if cue is None:
+                    continue
+                self._current = cue
+
+            sound = self.bank.get(cue.name)
+            try:
+                self.channel.play(sound)
+            except Exception as e:
+                logger.error(f"Error playing '{cue.name}': {e}")
+                self._current = None
+                continue
+
+            start = time.monotonic()
+            latency = start - cue.created
+            self.played += 1
+            self.mean_latency = latency if self.mean_latency is None else (
+                self.mean_latency + self.alpha * (latency - self.mean_latency)
+            )
+            logger.debug(f"Playing '{cue.name}' (priority {cue.priority}, {latency * 1000:.1f} ms after the event)")
+
+            # Wait for the end of the clip, woken up early by new cues to check for preemption
+            end = start + sound.get_length()
+            with self._cond:
+                while not self._stop_event.is_set():
+                    now = time.monotonic()
+                    if now >= end:
+                        break
+                    if self._outranked(cue, now):
+                        self.channel.stop()
+                        self.preempted += 1
+                        logger.info(f"Cue '{cue.name}' preempted by a more urgent cue")
+                        break
+                    self._cond.wait(end - now)
+                self._current = None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "playing": self._current.name if self._current else None,
+                "played": self.played,
+                "preempted": self.preempted,
+                "expired": self.expired,
+                "merged": self.merged,
+                "mean_latency_ms": (self.mean_latency or 0.0) * 1000,
+            }
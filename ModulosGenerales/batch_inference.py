@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from ModulosGenerales.inference_backend import roi_input_shape
+
+# Batched detection over every ROI of a tick.
+# All ROI crops are gathered, letterboxed to the same input size and sent to the
+# model in a single call, so preprocessing, NMS and the Python call overhead are
+# paid once per tick instead of once per camera.
+# With rect=True the batch uses a rectangular input size instead of imgsz x imgsz:
+# the smallest stride-aligned shape that holds the rectangular size of every ROI,
+# so there is still a single model call per tick.
+
+logger = logging.getLogger("snow").getChild("batch_inference")
+
+
+def batch_input_shape(sizes: list[tuple[int, int]], imgsz: int, rect: bool) -> int | tuple[int, int]:
+
+    """
+    Input size shared by every crop of a batch. `sizes` are the (height, width) of
+    the crops. Returns `imgsz` (square) or, when `rect`, the (height, width) holding
+    the rectangular size of every crop: the two default ROIs, (640, 320) and
+    (640, 416) on their own, share (640, 416).
+
+    """
+
+    if not rect:
+        return imgsz
+    shapes = [roi_input_shape(w, h, imgsz) for h, w in sizes]
+    return (max(shape[0] for shape in shapes), max(shape[1] for shape in shapes))
+
+
+class BatchDetector:
+
+    """
+    Runs one model call for all the ROI crops of a tick and splits the results
+    back by camera name. Keeps per-batch latency statistics. Calls from several
+    threads are serialized: the model holds state and is not thread-safe.
+
+    """
+
+    def __init__(self, model, imgsz: int = 640, rect: bool = False, alpha: float = 0.1):
+        self.model = model
+        self.imgsz = imgsz # Every crop is letterboxed to this size so they stack into one batch tensor
+        self.rect = rect # Rectangular batch input size instead of imgsz x imgsz (see batch_input_shape)
+        self.alpha = alpha
+        self.batches = 0
+        self.last_latency = 0.0
+        self.mean_latency = None # Exponential moving average, in seconds
+        self._lock = threading.Lock()
+
+    def detect(self, crops: dict[str, np.ndarray]) -> dict[str, list]:
+
+        """
+        Runs the model once over `crops` (camera name -> ROI image) and returns
+        camera name -> results, in the same format as calling the model on a
+        single crop (a list whose first element holds the boxes).
+
+        """
+
+        if not crops:
+            return {}
+
+        with self._lock:
+            start = time.perf_counter()
+            names = list(crops)
+            shape = batch_input_shape([crops[name].shape[:2] for name in names], self.imgsz, self.rect)
+            results = self.model([crops[name] for name in names], imgsz=shape, verbose=False)
+            detections = {name: [result] for name, result in zip(names, results)}
+            latency = time.perf_counter() - start
+
+            self.batches += 1
+            self.last_latency = latency
+            self.mean_latency = latency if self.mean_latency is None else (
+                self.mean_latency + self.alpha * (latency - self.mean_latency)
+            )
+        logger.debug(f"Batch of {len(crops)} ROIs processed in {latency * 1000:.1f} ms")
+
+        return detections
+
+    def close(self) -> None:
+
+        """
+        Nothing to release: the model belongs to the caller. Kept so BatchDetector
+        and InferenceWorker can be used interchangeably.
+
+        """
+
+    def stats(self) -> dict:
+
+        """
+        Returns the number of batches and the last / average batch latency in milliseconds.
+
+        """
+
+        return {
+            "batches": self.batches,
+            "last_latency_ms": self.last_latency * 1000,
+            "mean_latency_ms": (self.mean_latency or 0.0) * 1000,
+        }
@@ -0,0 +1,174 @@
+import logging
+import queue
+import threading
+import time
+import weakref
+from collections import deque
+
+# Bounded queue for the communication between modules.
+# Drop-in replacement for queue.Queue with a capacity limit and an overflow policy,
+# so a slow consumer can never make the producer pile up frames until the process
+# runs out of memory. Every queue keeps its own metrics (depth, drops, wait time)
+# and registers itself by name, so all of them can be inspected from one place.
+
+logger = logging.getLogger("snow").getChild("bounded_queue")
+
+DROP_OLDEST = "drop_oldest" # Full queue: discard the oldest item to make room for the new one
+KEEP_LATEST = "keep_latest" # Every put discards whatever is still queued: only the newest item is kept
+BLOCK = "block" # Full queue: wait up to `timeout` for room, then discard the new item
+
+POLICIES = (DROP_OLDEST, KEEP_LATEST, BLOCK)
+
+_queues = weakref.WeakValueDictionary() # Name -> queue, for queue_stats()
+
+
+class BoundedQueue:
+
+    """
+    Thread-safe FIFO with a capacity limit and a selectable overflow policy.
+
+    put() returns False when the item (or an older one, depending on the policy)
+    was dropped instead of raising queue.Full. get() behaves like queue.Queue.get().
+
+    """
+
+    def __init__(self, name: str, maxsize: int, policy: str = DROP_OLDEST, timeout: float | None = 1.0,
+                 alpha: float = 0.1):
+        if maxsize < 1:
+            raise ValueError("A bounded queue needs maxsize >= 1")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {POLICIES}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.timeout = timeout # Longest wait of a put with the BLOCK policy (None = forever)
+        self.alpha = alpha
+        self._items = deque() # (enqueue time, item)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        self.puts = 0
+        self.gets = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.mean_wait = 0.0 # Average time an item spent queued, in seconds
+        self.mean_put_wait = 0.0 # Average time a producer was blocked, in seconds
+
+        _queues[name] = self
+
+    def put(self, item, block: bool = True, timeout: float | None = None) -> bool:
+
+        """
+        Queues `item` applying the overflow policy. `block` and `timeout` only
+        matter for the BLOCK policy (`timeout` defaults to the queue timeout).
+        Returns True if the item was queued without dropping anything.
+
+        """
+
+        with self._lock:
+            self.puts += 1
+            queued = True
+
+            if self.policy == KEEP_LATEST and self._items:
+                self.dropped += len(self._items)
+                self._items.clear()
+                queued = False
+            elif len(self._items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                    queued = False
+                else:
+                    start = time.monotonic()
+                    wait = (self.timeout if timeout is None else timeout) if block else 0
+                    has_room = self._not_full.wait_for(lambda: len(self._items) < self.maxsize, wait)
+                    self.mean_put_wait += self.alpha * ((time.monotonic() - start) - self.mean_put_wait)
+                    if not has_room:
+                        self.dropped += 1
+                        logger.debug(f"Queue '{self.name}' full, item dropped after {wait} s")
+                        return False
+
+            self._items.append((time.monotonic(), item))
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._not_empty.notify()
+            return queued
+
+    def put_nowait(self, item) -> bool:
+        return self.put(item, block=False)
+
+    def get(self, block: bool = True, timeout: float | None = None):
+
+        """
+        Removes and returns the oldest item. Raises queue.Empty like queue.Queue.
+
+        """
+
+        with self._lock:
+            if not block:
+                if not self._items:
+                    raise queue.Empty
+            elif not self._not_empty.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+
+            queued_at, item = self._items.popleft()
+            self.gets += 1
+            self.mean_wait += self.alpha * ((time.monotonic() - queued_at) - self.mean_wait)
+            self._not_full.notify()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        return self.qsize() >= self.maxsize
+
+    def clear(self) -> int:
+
+        """
+        Discards every queued item (e.g. on shutdown) and returns how many there were.
+
+        """
+
+        with self._lock:
+            count = len(self._items)
+            self._items.clear()
+            self._not_full.notify_all()
+            return count
+
+    def stats(self) -> dict:
+
+        """
+        Returns the metrics of this queue. Wait times are in milliseconds.
+
+        """
+
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "maxsize": self.maxsize,
+                "depth": len(self._items),
+                "max_depth": self.max_depth,
+                "puts": self.puts,
+                "gets": self.gets,
+                "dropped": self.dropped,
+                "mean_wait_ms": self.mean_wait * 1000,
+                "mean_put_wait_ms": self.mean_put_wait * 1000,
+            }
+
+
+def queue_stats() -> dict[str, dict]:
+
+    """
+    Returns the metrics of every live bounded queue, by name.
+
+    """
+
+    return {name: q.stats() for name, q in list(_queues.items())}
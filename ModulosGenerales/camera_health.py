@@ -0,0 +1,258 @@
+import logging
+import threading
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from config import (
+    HEALTH_FRAME_SIZE,
+    HEALTH_CALIBRATION_FRAMES,
+    HEALTH_MIN_FRAMES,
+    FROZEN_CHANGE_THRESHOLD,
+    OBSTRUCTION_CHANGE_THRESHOLD,
+    DARK_LUMINANCE,
+    DARK_RATIO,
+    BLUR_RATIO,
+    COVERED_SPREAD,
+)
+
+# Camera health metrics engine.
+# Runs on the frames the pipeline already captured: each frame is shrunk to a small
+# grayscale thumbnail and every health signal (luminance, blur, histogram spread and
+# frame-to-frame change) is computed from it in one vectorized pass. Results are
+# folded into per-camera running statistics and compared against baselines that
+# are calibrated automatically, so checking a camera is a lookup that never pauses
+# the loop.
+
+logger = logging.getLogger("snow").getChild("camera_health")
+
+
+def downsample_gray(frame: np.ndarray, size: tuple[int, int] = HEALTH_FRAME_SIZE) -> np.ndarray:
+
+    """
+    Shrinks a BGR frame to `size` (width, height) and converts it to grayscale.
+    Resizing first keeps the color conversion on a few thousand pixels only.
+
+    """
+
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+@dataclass(frozen=True)
+class HealthMetrics:
+
+    """
+    Health signals of one frame. Every value is on the 0-255 grayscale of the thumbnail.
+
+    """
+
+    luminance: float # Mean brightness
+    sharpness: float # Variance of the Laplacian (low = blurred)
+    spread: float # Distance between the 5th and 95th luminance percentiles (low = lens covered)
+    change: float | None # Mean absolute change per pixel against the previous thumbnail
+
+
+def compute_metrics(gray: np.ndarray, previous: np.ndarray | None = None) -> HealthMetrics:
+
+    """
+    Computes every health signal of a grayscale thumbnail.
+
+    """
+
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    cdf = np.cumsum(hist)
+    low, high = np.searchsorted(cdf, (0.05 * cdf[-1], 0.95 * cdf[-1]))
+    luminance = float(np.dot(hist, np.arange(256)) / cdf[-1])
+    change = None if previous is None else float(cv2.absdiff(gray, previous).mean())
+
+    return HealthMetrics(
+        luminance=luminance,
+        sharpness=float(cv2.Laplacian(gray, cv2.CV_16S).var()),
+        spread=float(high - low),
+        change=change,
+    )
+
+
+class RunningStat:
+
+    """
+    Exponentially weighted mean and variance of a scalar signal.
+
+    """
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.mean = None
+        self.var = 0.0
+
+    def update(self, value: float) -> float:
+        if self.mean is None:
+            self.mean = value
+            return self.mean
+        delta = value - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1 - self.alpha) * (self.var + self.alpha * delta * delta)
+        return self.mean
+
+
+class _CameraState:
+
+    def __init__(self, alpha: float):
+        self.previous = None # Last thumbnail, used for the frame-to-frame change
+        self.luminance = RunningStat(alpha)
+        self.sharpness = RunningStat(alpha)
+        self.spread = RunningStat(alpha)
+        self.change = RunningStat(alpha)
+        self.baseline = {} # Calibrated reference values of a healthy view
+        self.calibration = [] # Metrics collected until the baseline is set
+        self.frames = 0
+        self.streaks = {"dark": 0, "blurred": 0, "covered": 0, "frozen": 0, "still": 0}
+        self.problems = frozenset()
+        self.last = None
+
+
+class CameraHealthMonitor:
+
+    """
+    Keeps running health statistics for every camera and reports its problems.
+
+    Problems (each must persist for `min_frames` consecutive frames):
+      - "dark":      luminance below DARK_LUMINANCE or far below the calibrated baseline
+      - "blurred":   sharpness far below the calibrated baseline
+      - "covered":   histogram spread below COVERED_SPREAD (uniform image)
+      - "frozen":    frames are identical, the device is returning the same buffer
+      - "obstructed": almost no change between frames (covered lens or no signal)
+
+    The baseline of each camera is the median of its first `calibration_frames`
+    frames and afterwards slowly follows the camera while it is healthy.
+
+    """
+
+    def __init__(self,
+                 calibration_frames: int = HEALTH_CALIBRATION_FRAMES,
+                 min_frames: int = HEALTH_MIN_FRAMES,
+                 alpha: float = 0.1,
+                 baseline_alpha: float = 0.01):
+        self.calibration_frames = calibration_frames
+        self.min_frames = min_frames
+        self.alpha = alpha
+        self.baseline_alpha = baseline_alpha
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, cam_name: str, frame: np.ndarray) -> frozenset[str]:
+
+        """
+        Folds a new frame of `cam_name` into its statistics and returns the set of
+        problems currently reported for that camera.
+
+        """
+
+        gray = downsample_gray(frame)
+
+        with self._lock:
+            state = self._states.get(cam_name)
+            if state is None:
+                state = self._states[cam_name] = _CameraState(self.alpha)
+
+            metrics = compute_metrics(gray, state.previous)
+            state.previous = gray
+            state.last = metrics
+            state.frames += 1
+
+            state.luminance.update(metrics.luminance)
+            state.sharpness.update(metrics.sharpness)
+            state.spread.update(metrics.spread)
+            if metrics.change is not None:
+                state.change.update(metrics.change)
+
+            self._calibrate(state, metrics)
+            self._evaluate(cam_name, state, metrics)
+            return state.problems
+
+    def _calibrate(self, state: _CameraState, metrics: HealthMetrics) -> None:
+        if not state.baseline:
+            state.calibration.append(metrics)
+            if len(state.calibration) >= self.calibration_frames:
+                state.baseline = {
+                    "luminance": float(np.median([m.luminance for m in state.calibration])),
+                    "sharpness": float(np.median([m.sharpness for m in state.calibration])),
+                }
+                state.calibration = []
+            return
+
+        if not state.problems: # Only a healthy view may move the baseline
+            for key in state.baseline:
+                value = getattr(metrics, key)
+                state.baseline[key] += self.baseline_alpha * (value - state.baseline[key])
+
+    def _evaluate(self, cam_name: str, state: _CameraState, metrics: HealthMetrics) -> None:
+        baseline = state.baseline
+        conditions = {
+            "dark": metrics.luminance < DARK_LUMINANCE
+                    or (bool(baseline) and metrics.luminance < baseline["luminance"] * DARK_RATIO),
+            "blurred": bool(baseline) and metrics.sharpness < baseline["sharpness"] * BLUR_RATIO,
+            "covered": metrics.spread < COVERED_SPREAD,
+            "frozen": metrics.change is not None and metrics.change < FROZEN_CHANGE_THRESHOLD,
+            "still": metrics.change is not None and metrics.change < OBSTRUCTION_CHANGE_THRESHOLD,
+        }
+        for name, active in conditions.items():
+            state.streaks[name] = state.streaks[name] + 1 if active else 0
+
+        problems = {name for name, streak in state.streaks.items() if streak >= self.min_frames}
+        if "still" in problems:
+            problems.discard("still")
+            problems.add("obstructed")
+        problems = frozenset(problems)
+
+        if problems != state.problems:
+            for problem in problems - state.problems:
+                logger.warning(f"Camera '{cam_name}' reports '{problem}'")
+            for problem in state.problems - problems:
+                logger.info(f"Camera '{cam_name}' no longer reports '{problem}'")
+            state.problems = problems
+
+    def problems(self, cam_name: str) -> frozenset[str]:
+
+        """
+        Returns the problems currently reported for a camera (empty if healthy or unknown).
+
+        """
+
+        with self._lock:
+            state = self._states.get(cam_name)
+            return frozenset() if state is None else state.problems
+
+    def is_obstructed(self, cam_name: str) -> bool:
+
+        """
+        Returns True when the camera view is unusable (obstructed, covered or frozen).
+
+        """
+
+        return bool(self.problems(cam_name) & {"obstructed", "covered", "frozen"})
+
+    def state(self, cam_name: str) -> dict | None:
+
+        """
+        Returns the current statistics of a camera, or None if it has no frames yet.
+
+        """
+
+        with self._lock:
+            state = self._states.get(cam_name)
+            if state is None:
+                return None
+            return {
+                "obstructed": bool(state.problems & {"obstructed", "covered", "frozen"}),
+                "problems": sorted(state.problems),
+                "calibrated": bool(state.baseline),
+                "frames": state.frames,
+                "luminance": state.luminance.mean,
+                "sharpness": state.sharpness.mean,
+                "spread": state.spread.mean,
+                "change": state.change.mean,
+                "baseline": dict(state.baseline),
+            }
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+import cv2
+
+from config import CAMERA_RECONNECT_BASE_DELAY, CAMERA_RECONNECT_MAX_DELAY, CAMERA_STALL_TIMEOUT
+from ModulosGenerales.error_buffer import add_error
+from ModulosGenerales.frame_capture import CaptureSubsystem, FrameMultiplexer, RoiView
+
+# Per-device processing lanes.
+# Every capture device gets its own lane: a reader thread that keeps its newest
+# frame and a worker thread that cuts the device ROIs and hands them to the
+# processing callback. Devices no longer wait for each other in a single loop, so
+# the work of N cameras spreads over the available cores (OpenCV and the inference
+# process release the GIL).
+# A device that cannot be opened or stops delivering frames is released and
+# reopened from its own lane with exponential backoff; the other lanes keep their
+# full frame rate meanwhile. Degraded cameras are reported to the error buffer.
+
+logger = logging.getLogger("snow").getChild("camera_lanes")
+
+RUNNING = "running"
+DEGRADED = "degraded"
+
+
+class DeviceFeed:
+
+    """
+    Frames of one device as ROI views. Opens the device on demand; when opening
+    fails or no frame arrives for `stall_timeout` seconds the device is released
+    and reopened after a backoff delay that doubles up to `max_delay`. tick() never
+    blocks longer than its timeout, whatever the state of the device.
+
+    """
+
+    def __init__(self, name: str, rois: dict[str, tuple[int, int, int, int]],
+                 open_device: Callable[[], "cv2.VideoCapture"],
+                 reference_size: tuple[int, int] = (640, 480),
+                 stall_timeout: float = CAMERA_STALL_TIMEOUT,
+                 base_delay: float = CAMERA_RECONNECT_BASE_DELAY,
+                 max_delay: float = CAMERA_RECONNECT_MAX_DELAY):
+        self.name = name
+        self.rois = rois
+        self.open_device = open_device
+        self.reference_size = reference_size # Resolution the ROIs are given for
+        self.stall_timeout = stall_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = None # RUNNING or DEGRADED once the first open was attempted
+        self.cap = None
+        self.capture = None
+        self.multiplexer = None
+        self._resolution = None # Reapplied after every reconnection
+        self._delay = base_delay
+        self._next_attempt = 0.0
+        self._last_frame = 0.0
+
+        self.outages = 0
+        self.failed_attempts = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.state == RUNNING
+
+    def tick(self, timeout: float = 1.0) -> dict[str, RoiView]:
+
+        """
+        Returns ROI name -> RoiView of the next frame, or {} if none arrived within
+        `timeout` (or the device is down and waiting for its next attempt).
+
+        """
+
+        if self.capture is None:
+            wait = self._next_attempt - time.monotonic()
+            if wait > 0:
+                time.sleep(min(wait, timeout))
+                return {}
+            if not self._connect():
+                return {}
+
+        views = self.multiplexer.tick(timeout=timeout)
+        now = time.monotonic()
+        if views:
+            self._last_frame = now
+        elif now - self._last_frame > self.stall_timeout:
+            self._degrade(f"no frames for {now - self._last_frame:.1f}s")
+        return views
+
+    def _connect(self) -> bool:
+        try:
+            cap = self.open_device()
+        except Exception as e:
+            self.failed_attempts += 1
+            first = self.state is None
+            if self.state == DEGRADED:
+                self._delay = min(self._delay * 2, self.max_delay) # Consecutive failure: back off further
+            self._retry_later()
+            if first:
+                self.outages += 1
+                self._report(f"could not be opened ({e})")
+            else:
+                logger.debug(f"Camera '{self.name}' still down ({e}), next attempt in {self._delay:.0f}s")
+            return False
+
+        self.cap = cap
+        self.capture = CaptureSubsystem()
+        reader = self.capture.add_camera(self.name, cap) # The reader is named after the device
+        for roi in self.rois:
+            self.capture.add_camera(roi, cap) # Every ROI shares that single reader
+        if self._resolution is not None:
+            reader.set_resolution(*self._resolution)
+        self.multiplexer = FrameMultiplexer(self.capture, self.rois, self.reference_size)
+        self._last_frame = time.monotonic()
+        if self.state == DEGRADED:
+            logger.warning(f"Camera '{self.name}' recovered")
+        self.state = RUNNING
+        self._delay = self.base_delay
+        return True
+
+    def _degrade(self, reason: str) -> None:
+        self.release()
+        self.outages += 1
+        self._delay = self.base_delay
+        self._retry_later()
+        self._report(reason)
+
+    def _retry_later(self) -> None:
+        self.state = DEGRADED
+        self._next_attempt = time.monotonic() + self._delay
+
+    def _report(self, reason: str) -> None:
+        message = f"Camera '{self.name}' degraded: {reason}"
+        logger.warning(f"{message}; reopening it in the background")
+        add_error(message)
+
+    def set_resolution(self, width: int, height: int) -> None:
+        self._resolution = (width, height)
+        if self.capture is not None:
+            for reader in self.capture.devices():
+                reader.set_resolution(width, height)
+
+    def release(self) -> None:
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+            self.multiplexer = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "outages": self.outages,
+            "failed_attempts": self.failed_attempts,
+            "capture": self.capture.stats().get(self.name) if self.capture is not None else None,
+        }
+
+
+class DeviceLane:
+
+    """
+    Capture + processing worker of one device. `handler(device, views)` is called
+    from the lane thread with ROI name -> RoiView for every new frame, at most once
+    every `period` seconds. The device is (re)opened by the lane itself, so a
+    camera that is down never blocks start() nor the other lanes.
+
+    """
+
+    def __init__(self, name: str, rois: dict[str, tuple[int, int, int, int]],
+                 open_device: Callable[[], "cv2.VideoCapture"],
+                 handler: Callable[[str, dict[str, RoiView]], None],
+                 reference_size: tuple[int, int] = (640, 480),
+                 period: float = 0.0, timeout: float = 1.0, **feed_options):
+        self.name = name
+        self.handler = handler
+        self.period = period # Minimum seconds between two calls of the handler (0 = every frame)
+        self.timeout = timeout
+        self.feed = DeviceFeed(name, rois, open_device, reference_size, **feed_options)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.cycles = 0
+        self.errors = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.feed.healthy
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"CARRIL-{self.name}", daemon=True)
+        self._thread.start()
+        logger.info(f"Lane '{self.name}' started with ROIs {sorted(self.feed.rois)}")
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.feed.release()
+
+    def is_alive(self) -> bool:
+
+        """
+        Returns True while the lane thread runs, also while its camera is being
+        reopened (see `healthy`).
+
+        """
+
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_resolution(self, width: int, height: int) -> None:
+        self.feed.set_resolution(width, height)
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            views = self.feed.tick(timeout=self.timeout)
+            if not views:
+                continue
+            try:
+                self.handler(self.name, views)
+                self.cycles += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Lane '{self.name}' failed processing a frame: {e}")
+            self._stop_event.wait(max(0.0, self.period - (time.monotonic() - start)))
+
+    def stats(self) -> dict:
+        return {"cycles": self.cycles, "errors": self.errors, **self.feed.stats()}
@@ -0,0 +1,168 @@
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+
+from config import SYSTEM_CONFIG_PATH
+
+# Camera registry.
+# Describes every capture device, the ROIs watched on each one and the correlation
+# rules (which ROIs must detect together to raise an alarm), so adding a camera or
+# a path only means editing the configuration. Nothing in the systems refers to a
+# camera by name any more.
+
+logger = logging.getLogger("snow").getChild("camera_registry")
+
+DEFAULT_ROIS = {"camara1": (400, 0, 640, 480), "camara2": (0, 0, 300, 480)}
+
+
+def load_system_config(path: str | Path = SYSTEM_CONFIG_PATH) -> dict:
+
+    """
+    Reads config_sistema.json, shared by every entry point. Returns {} if it does
+    not exist, so the registry falls back to its defaults.
+
+    """
+
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        logger.warning(f"{path} not found, using the default cameras")
+        return {}
+
+
+@dataclass(frozen=True)
+class DeviceSpec:
+
+    """
+    A physical capture device and the names of the ROIs cut from its frames.
+
+    """
+
+    name: str
+    source: int | str # Device index or video path, as accepted by cv2.VideoCapture
+    width: int
+    height: int
+    fps: int
+    rois: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class CorrelationRule:
+
+    """
+    Raises an alarm when every ROI in `rois` has detected within `window` seconds.
+
+    """
+
+    name: str
+    rois: tuple[str, ...]
+    window: float
+
+
+class CameraRegistry:
+
+    """
+    Devices, ROIs (x1, y1, x2, y2 at the device resolution) and correlation rules.
+
+    """
+
+    def __init__(self, devices: list[DeviceSpec], rois: dict[str, tuple[int, int, int, int]],
+                 rules: list[CorrelationRule]):
+        self.devices = {device.name: device for device in devices}
+        self.rois = {name: tuple(roi) for name, roi in rois.items()}
+        self.rules = list(rules)
+        self._device_of = {roi: device.name for device in devices for roi in device.rois}
+
+        missing = [roi for roi in self.rois if roi not in self._device_of]
+        if missing:
+            raise ValueError(f"ROIs without a device: {missing}")
+        for rule in self.rules:
+            unknown = [roi for roi in rule.rois if roi not in self.rois]
+            if unknown:
+                raise ValueError(f"Correlation rule '{rule.name}' uses unknown ROIs: {unknown}")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "CameraRegistry":
+
+        """
+        Builds the registry from config_sistema.json. The "camaras" section maps a
+        device name to {"fuente", "ancho", "alto", "fps", "rois": {name: [x1, y1, x2, y2]}}
+        and "reglas_correlacion" maps a rule name to {"rois": [...], "ventana": s}.
+
+        Without "camaras", the ROIs of the "rois" key are all cut from device 0, as
+        before. Without rules, a single rule requires every ROI within "ventana_tiempo".
+
+        """
+
+        resolution = config.get('resolucion_camara', {})
+        width = resolution.get('ancho', 640)
+        height = resolution.get('alto', 480)
+        fps = config.get('fps_camara', 15)
+        window = config.get('ventana_tiempo', 5)
+
+        devices = []
+        rois = {}
+        cameras = config.get('camaras')
+        if cameras:
+            for name, options in cameras.items():
+                device_rois = {roi: tuple(box) for roi, box in options.get('rois', {}).items()}
+                devices.append(DeviceSpec(
+                    name,
+                    options.get('fuente', 0),
+                    options.get('ancho', width),
+                    options.get('alto', height),
+                    options.get('fps', fps),
+                    tuple(device_rois)
+                ))
+                rois.update(device_rois)
+        else:
+            rois = {roi: tuple(box) for roi, box in config.get('rois', DEFAULT_ROIS).items()}
+            devices.append(DeviceSpec("camara", 0, width, height, fps, tuple(rois)))
+
+        rules = [
+            CorrelationRule(name, tuple(options['rois']), options.get('ventana', window))
+            for name, options in config.get('reglas_correlacion', {}).items()
+        ] or [CorrelationRule("todas", tuple(rois), window)]
+
+        return cls(devices, rois, rules)
+
+    def device_of(self, roi: str) -> DeviceSpec:
+        return self.devices[self._device_of[roi]]
+
+    def rois_of(self, device: str) -> dict[str, tuple[int, int, int, int]]:
+
+        """
+        Returns ROI name -> box of every ROI cut from `device`.
+
+        """
+
+        return {roi: self.rois[roi] for roi in self.devices[device].rois}
+
+    def rule_windows(self) -> dict[str, tuple[tuple[str, ...], float]]:
+
+        """
+        Returns rule name -> (ROIs, window), the format taken by RuleCorrelator.
+
+        """
+
+        return {rule.name: (rule.rois, rule.window) for rule in self.rules}
+
+    def open(self, device: str) -> "cv2.VideoCapture":
+
+        """
+        Opens and configures a device. Raises RuntimeError if it cannot be opened.
+
+        """
+
+        spec = self.devices[device]
+        cap = cv2.VideoCapture(spec.source)
+        if not cap.isOpened():
+            cap.release()
+            raise RuntimeError(f"Camera '{device}' (source {spec.source!r}) could not be opened")
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, spec.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, spec.height)
+        cap.set(cv2.CAP_PROP_FPS, spec.fps)
+        return cap
@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+# Component-level recovery.
+# The system is split into components (model, camera, audio, GPIO...) that each
+# have their own start, stop and health check. When one fails only that component
+# is restarted, with an exponential backoff between attempts, so a camera glitch
+# does not reload the model or reinitialize the audio device.
+
+logger = logging.getLogger("snow").getChild("component_recovery")
+
+
+class _Component:
+
+    def __init__(self, name: str, start: Callable[[], None], stop: Callable[[], None] | None,
+                 check: Callable[[], bool] | None):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.check = check
+        self.healthy = False
+        self.failures = 0 # Consecutive failed restarts
+        self.restarts = 0 # Successful restarts since the system started
+        self.next_attempt = 0.0
+        self.last_error = None
+        self.recovery_time = None # Duration of the last successful restart, in seconds
+
+
+class ComponentSupervisor:
+
+    """
+    Keeps the health state of every registered component and restarts only the
+    failed ones. After the n-th failed restart of a component the next attempt is
+    delayed base_delay * 2**(n-1) seconds, capped at max_delay. A component that
+    fails max_failures restarts in a row is reported by exhausted().
+
+    """
+
+    def __init__(self,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 max_failures: int = 5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_failures = max_failures
+        self.clock = clock
+        self._components = {} # Insertion order is the start order
+        self._lock = threading.RLock()
+
+    def register(self, name: str, start: Callable[[], None], stop: Callable[[], None] | None = None,
+                 check: Callable[[], bool] | None = None) -> None:
+
+        """
+        Registers a component. `start` must raise if the component cannot start,
+        `check` returns False when a running component is no longer healthy.
+
+        """
+
+        with self._lock:
+            self._components[name] = _Component(name, start, stop, check)
+
+    def start_all(self) -> None:
+
+        """
+        Starts every component in registration order. Raises on the first failure.
+        A component that starts but fails its check is left to recover().
+
+        """
+
+        with self._lock:
+            for component in self._components.values():
+                component.start()
+                component.healthy = component.check is None or self._is_healthy(component)
+                if not component.healthy:
+                    component.next_attempt = self.clock()
+                    logger.warning(f"Component '{component.name}' started unhealthy")
+
+    def stop_all(self) -> None:
+
+        """
+        Stops every component in reverse registration order.
+
+        """
+
+        with self._lock:
+            for component in reversed(self._components.values()):
+                self._stop(component)
+                component.healthy = False
+
+    def mark_failed(self, name: str, error: Exception | str | None = None) -> None:
+
+        """
+        Reports a failure of `name` seen from outside (e.g. a read that raised).
+
+        """
+
+        with self._lock:
+            component = self._components[name]
+            if error is not None:
+                component.last_error = str(error)
+            if component.healthy:
+                component.healthy = False
+                component.next_attempt = self.clock()
+                logger.warning(f"Component '{name}' failed: {component.last_error}")
+
+    def check(self) -> list[str]:
+
+        """
+        Runs the health check of every healthy component and returns the names of
+        the components currently failed.
+
+        """
+
+        with self._lock:
+            for component in self._components.values():
+                if component.healthy and component.check is not None and not self._is_healthy(component):
+                    self.mark_failed(component.name, component.last_error or "health check failed")
+            return [c.name for c in self._components.values() if not c.healthy]
+
+    def recover(self) -> list[str]:
+
+        """
+        Restarts the failed components whose backoff has expired. Returns the names
+        of the components that are still failed afterwards.
+
+        """
+
+        with self._lock:
+            now = self.clock()
+            for component in self._components.values():
+                if component.healthy or now < component.next_attempt:
+                    continue
+                self._restart(component)
+            return [c.name for c in self._components.values() if not c.healthy]
+
+    def _restart(self, component: _Component) -> None:
+        start = time.monotonic()
+        self._stop(component)
+        try:
+            component.start()
+            if component.check is not None and not self._is_healthy(component):
+                raise RuntimeError(component.last_error or "health check failed after restart")
+        except Exception as e:
+            component.failures += 1
+            component.last_error = str(e)
+            delay = min(self.max_delay, self.base_delay * 2 ** (component.failures - 1))
+            component.next_attempt = self.clock() + delay
+            logger.error(f"Restart of '{component.name}' failed ({component.failures}/{self.max_failures}), "
+                         f"next attempt in {delay:.1f} s: {e}")
+            return
+
+        component.healthy = True
+        component.failures = 0
+        component.restarts += 1
+        component.recovery_time = time.monotonic() - start
+        logger.info(f"Component '{component.name}' recovered in {component.recovery_time:.2f} s")
+
+    def _stop(self, component: _Component) -> None:
+        if component.stop is None:
+            return
+        try:
+            component.stop()
+        except Exception as e:
+            logger.warning(f"Error stopping '{component.name}': {e}")
+
+    def _is_healthy(self, component: _Component) -> bool:
+        try:
+            return bool(component.check())
+        except Exception as e:
+            component.last_error = str(e)
+            return False
+
+    def exhausted(self) -> list[str]:
+
+        """
+        Returns the components that failed `max_failures` restarts in a row.
+
+        """
+
+        with self._lock:
+            return [c.name for c in self._components.values() if c.failures >= self.max_failures]
+
+    def state(self) -> dict[str, dict]:
+
+        """
+        Returns the health state of every component.
+
+        """
+
+        with self._lock:
+            return {
+                c.name: {
+                    "healthy": c.healthy,
+                    "failures": c.failures,
+                    "restarts": c.restarts,
+                    "last_error": c.last_error,
+                    "recovery_time": c.recovery_time,
+                }
+                for c in self._components.values()
+            }
@@ -0,0 +1,91 @@
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+
+# Vectorized detection post-processing.
+# The confidence threshold of every box of a result is chosen with one array lookup
+# (per-class thresholds, overridden per camera) and compared in one mask. Only the
+# best box that passes is kept, so each camera emits at most one detection event per
+# frame, whatever the number of boxes above the threshold.
+
+logger = logging.getLogger("snow").getChild("detection_filter")
+
+
+@dataclass(frozen=True)
+class DetectionEvent:
+
+    """
+    Best detection of one camera in one frame.
+
+    """
+
+    camera: str
+    conf: float
+    cls: int
+    xyxy: tuple[float, float, float, float] # In the coordinates of the ROI crop
+    count: int # Boxes of the frame above their threshold
+
+
+class DetectionFilter:
+
+    """
+    Applies confidence thresholds to whole result arrays and reduces them to one event.
+
+    Thresholds are resolved in this order: camera + class, camera, class, default.
+    `class_thresholds` maps class id -> threshold and `camera_thresholds` maps
+    camera name -> threshold or -> {class id: threshold}.
+
+    """
+
+    def __init__(self,
+                 default_threshold: float,
+                 class_thresholds: dict[int, float] | None = None,
+                 camera_thresholds: dict[str, float | dict[int, float]] | None = None):
+        self.default_threshold = default_threshold
+        self.class_thresholds = {int(k): v for k, v in (class_thresholds or {}).items()}
+        self.camera_thresholds = camera_thresholds or {}
+        self._tables = {} # Camera name -> threshold per class id (numpy lookup table)
+
+    def _table(self, camera: str, max_cls: int) -> np.ndarray:
+        table = self._tables.get(camera)
+        if table is not None and len(table) > max_cls:
+            return table
+
+        size = max(max_cls + 1, max(self.class_thresholds, default=-1) + 1)
+        table = np.full(size, self.default_threshold, dtype=np.float32)
+        for cls, threshold in self.class_thresholds.items():
+            table[cls] = threshold
+
+        override = self.camera_thresholds.get(camera)
+        if isinstance(override, dict):
+            for cls, threshold in override.items():
+                if int(cls) < size:
+                    table[int(cls)] = threshold
+        elif override is not None:
+            table[:] = override
+
+        self._tables[camera] = table
+        return table
+
+    def select(self, camera: str, boxes) -> DetectionEvent | None:
+
+        """
+        Returns the highest-confidence box of `boxes` (with .conf, .cls and .xyxy
+        arrays) that passes its threshold, or None if no box passes.
+
+        """
+
+        if boxes is None or len(boxes) == 0:
+            return None
+
+        conf = np.asarray(boxes.conf, dtype=np.float32).reshape(-1)
+        cls = np.asarray(boxes.cls).reshape(-1).astype(np.int64)
+        passed = conf > self._table(camera, int(cls.max()))[cls]
+        count = int(np.count_nonzero(passed))
+        if not count:
+            return None
+
+        best = int(np.argmax(np.where(passed, conf, -1.0)))
+        xyxy = np.asarray(boxes.xyxy, dtype=np.float32).reshape(-1, 4)[best]
+        return DetectionEvent(camera, float(conf[best]), int(cls[best]), tuple(float(v) for v in xyxy), count)
@@ -0,0 +1,327 @@
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    EVENT_STORE_BATCH_SIZE,
+    EVENT_STORE_FLUSH_INTERVAL,
+    EVENT_STORE_PATH,
+    EVENT_STORE_QUEUE_SIZE,
+    EVENT_STORE_RETENTION_DAYS,
+)
+from ModulosGenerales.bounded_queue import DROP_OLDEST, BoundedQueue
+
+# Detection event store.
+# Detections and alarms are typed rows of a SQLite database in WAL mode instead of
+# free-text log lines. Callers only enqueue the event; a writer thread inserts the
+# queued events in one transaction per batch and prunes the rows older than the
+# retention period. Both tables are indexed on time and on camera + time, so
+# time-range aggregates ("alarms per hour on camara2 last week") are answered from
+# the indexes, also while the writer is running (WAL readers never block it).
+#   python -m ModulosGenerales.event_store alarms --camera camara2 --since 7d --bucket 3600
+
+logger = logging.getLogger("snow").getChild("event_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    camera TEXT NOT NULL,
+    cls INTEGER NOT NULL,
+    conf REAL NOT NULL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    alarm_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS detections_ts ON detections (ts);
+CREATE INDEX IF NOT EXISTS detections_camera_ts ON detections (camera, ts);
+CREATE TABLE IF NOT EXISTS alarms (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    rule TEXT NOT NULL,
+    camera TEXT NOT NULL,
+    last_camera TEXT NOT NULL,
+    latency REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alarms_ts ON alarms (ts);
+CREATE INDEX IF NOT EXISTS alarms_camera_ts ON alarms (camera, ts);
+"""
+
+TABLES = ("detections", "alarms")
+
+
+def _wall_time(timestamp: float | None) -> float:
+    # Event timestamps are monotonic; the store keeps wall-clock epoch seconds
+    if timestamp is None:
+        return time.time()
+    return time.time() - (time.monotonic() - timestamp)
+
+
+def connect(path: str | Path = EVENT_STORE_PATH) -> sqlite3.Connection:
+
+    """
+    Opens the database (creating it and its schema if needed) in WAL mode.
+
+    """
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=5.0, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL") # WAL keeps the database consistent; only the last commits can be lost on power cut
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def aggregate(connection: sqlite3.Connection, table: str, start: float, end: float,
+              bucket: float = 3600, camera: str | None = None) -> list[dict]:
+
+    """
+    Counts the rows of `table` per camera and per `bucket` seconds between `start`
+    and `end` (epoch seconds). Detections also report their mean and max confidence.
+
+    """
+
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}', expected one of {TABLES}")
+    extra = ", AVG(conf), MAX(conf)" if table == "detections" else ""
+    query = (
+        f"SELECT CAST(ts / ? AS INTEGER) * ? AS bucket, camera, COUNT(*){extra} FROM {table} "
+        f"WHERE ts >= ? AND ts < ?{' AND camera = ?' if camera else ''} "
+        f"GROUP BY bucket, camera ORDER BY bucket, camera"
+    )
+    params = [bucket, bucket, start, end] + ([camera] if camera else [])
+
+    rows = []
+    for row in connection.execute(query, params):
+        entry = {"start": row[0], "camera": row[1], "count": row[2]}
+        if extra:
+            entry["mean_conf"] = row[3]
+            entry["max_conf"] = row[4]
+        rows.append(entry)
+    return rows
+
+
+class EventStore:
+
+    """
+    Writes detections and alarms to the database from its own thread. The record
+    methods never block: when the writer falls behind, the oldest queued events are
+    dropped (and counted by the queue).
+
+    Alarm ids are assigned when the alarm is recorded; the detections of the alarm
+    window (its cameras, from their first detection to the alarm) get that id.
+
+    """
+
+    def __init__(self, path: str | Path = EVENT_STORE_PATH,
+                 batch_size: int = EVENT_STORE_BATCH_SIZE,
+                 flush_interval: float = EVENT_STORE_FLUSH_INTERVAL,
+                 retention_days: float = EVENT_STORE_RETENTION_DAYS,
+                 queue_size: int = EVENT_STORE_QUEUE_SIZE,
+                 name: str | None = None):
+        self.path = Path(path)
+        self.name = name or f"eventos:{self.path}" # Name of its queue in queue_stats()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval # Longest time an event waits for its batch
+        self.retention = retention_days * 86400
+        self.queue = BoundedQueue(self.name, queue_size, DROP_OLDEST)
+        self._connection = connect(self.path)
+        last_alarm = self._connection.execute("SELECT COALESCE(MAX(id), 0) FROM alarms").fetchone()[0]
+        self._alarm_ids = itertools.count(last_alarm + 1)
+        self._ids_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+
+        self.written = 0
+        self.batches = 0
+        self.pruned = 0
+        self.mean_batch_time = 0.0 # Seconds per transaction
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="EVENT-STORE", daemon=True)
+        self._thread.start()
+        logger.info(f"Event store writing to {self.path}")
+
+    def stop(self, timeout: float = 2.0) -> None:
+
+        """
+        Writes the queued events, waiting at most `timeout` seconds, and closes
+        the database.
+
+        """
+
+        deadline = time.monotonic() + timeout
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Event store writer did not stop; {self.queue.qsize()} events not written")
+                return
+            self._thread = None
+        try:
+            while not self.queue.empty() and time.monotonic() < deadline:
+                self._write_pending()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing events to {self.path}: {e}")
+        if not self.queue.empty():
+            logger.warning(f"{self.queue.qsize()} events not written at shutdown")
+        self._connection.close()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def record_detection(self, event, timestamp: float | None = None) -> None:
+
+        """
+        Queues a DetectionEvent seen at `timestamp` (monotonic, default: now).
+
+        """
+
+        x1, y1, x2, y2 = event.xyxy
+        self.queue.put_nowait(("detection", (
+            _wall_time(timestamp), event.camera, int(event.cls), float(event.conf),
+            float(x1), float(y1), float(x2), float(y2)
+        )))
+
+    def record_alarm(self, alarm) -> int:
+
+        """
+        Queues an Alarm of the correlator and returns its id.
+
+        """
+
+        with self._ids_lock:
+            alarm_id = next(self._alarm_ids)
+        first_seen = {camera: _wall_time(ts) for camera, ts in alarm.first_seen.items()}
+        self.queue.put_nowait(("alarm", (
+            alarm_id, _wall_time(alarm.timestamp), alarm.rule, alarm.camera, alarm.last_camera, alarm.latency
+        ), first_seen))
+        return alarm_id
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self._write_pending(self.flush_interval)
+                if time.monotonic() - self._last_prune > 3600:
+                    self.prune()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing events to {self.path}: {e}")
+                self._stop_event.wait(1.0)
+
+    def _write_pending(self, timeout: float | None = None) -> None:
+        # Takes one batch (waiting up to `timeout` for its first event) and writes it in one transaction
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+
+        start = time.monotonic()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO detections (ts, camera, cls, conf, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [item[1] for item in batch if item[0] == "detection"]
+            )
+            for item in batch:
+                if item[0] != "alarm":
+                    continue
+                alarm_id, ts = item[1][0], item[1][1]
+                self._connection.execute(
+                    "INSERT INTO alarms (id, ts, rule, camera, last_camera, latency) VALUES (?, ?, ?, ?, ?, ?)", item[1]
+                )
+                for camera, first in item[2].items():
+                    self._connection.execute(
+                        "UPDATE detections SET alarm_id = ? WHERE camera = ? AND ts >= ? AND ts <= ? AND alarm_id IS NULL",
+                        (alarm_id, camera, first - 0.001, ts + 0.001) # Margin for the clock conversion
+                    )
+        self.written += len(batch)
+        self.batches += 1
+        self.mean_batch_time += 0.1 * ((time.monotonic() - start) - self.mean_batch_time)
+
+    def prune(self) -> int:
+
+        """
+        Deletes the rows older than the retention period. Returns how many.
+
+        """
+
+        self._last_prune = time.monotonic()
+        cutoff = time.time() - self.retention
+        with self._connection:
+            deleted = sum(
+                self._connection.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,)).rowcount for table in TABLES
+            )
+        if deleted:
+            self.pruned += deleted
+            logger.info(f"Pruned {deleted} events older than {self.retention / 86400:.0f} days")
+        return deleted
+
+    def aggregate(self, table: str, start: float, end: float, bucket: float = 3600, camera: str | None = None) -> list[dict]:
+
+        """
+        Same as aggregate(), on a separate read connection.
+
+        """
+
+        connection = connect(self.path)
+        try:
+            return aggregate(connection, table, start, end, bucket, camera)
+        finally:
+            connection.close()
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "batches": self.batches,
+            "pruned": self.pruned,
+            "mean_batch_ms": self.mean_batch_time * 1000,
+            "queue": self.queue.stats(),
+        }
+
+
+def _parse_time(value: str) -> float:
+    # Epoch seconds, an ISO date/time or a span back from now: 30m, 12h, 7d
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if value[-1:] in units and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+# Time-range aggregates from the command line, e.g.:
+#   python -m ModulosGenerales.event_store alarms --camera camara2 --since 7d --bucket 3600
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate detections or alarms of the event store")
+    parser.add_argument("table", choices=TABLES)
+    parser.add_argument("--db", default=EVENT_STORE_PATH)
+    parser.add_argument("--camera")
+    parser.add_argument("--since", default="24h", help="Epoch, ISO date or span back from now (30m, 12h, 7d)")
+    parser.add_argument("--until", default=None)
+    parser.add_argument("--bucket", type=float, default=3600, help="Seconds per bucket")
+    args = parser.parse_args()
+
+    connection = connect(args.db)
+    start = time.perf_counter()
+    rows = aggregate(
+        connection, args.table, _parse_time(args.since),
+        _parse_time(args.until) if args.until else time.time(), args.bucket, args.camera
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    for row in rows:
+        row["start"] = datetime.datetime.fromtimestamp(row["start"]).isoformat(timespec="minutes")
+    print(json.dumps(rows, indent=4))
+    print(f"{len(rows)} buckets in {elapsed:.1f} ms")
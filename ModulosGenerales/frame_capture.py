@@ -0,0 +1,355 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+# Threaded camera capture.
+# Each cv2.VideoCapture is drained by its own reader thread, which only keeps
+# the newest frame in a single-slot mailbox. The detection loop never waits on
+# the camera frame interval and never receives stale frames from the V4L2 buffer.
+
+logger = logging.getLogger("snow").getChild("frame_capture")
+
+
+@dataclass(frozen=True)
+class CapturedFrame:
+
+    """
+    A frame published by a reader thread.
+
+    `timestamp` comes from time.monotonic() and `seq` increases by one for every
+    frame read from the device, so consumers can tell a new frame from a repeated one.
+
+    """
+
+    frame: np.ndarray
+    timestamp: float
+    seq: int
+    source: str
+
+
+class FrameMailbox:
+
+    """
+    Single-slot mailbox. Publishing a frame replaces the previous one; a frame that
+    is replaced before anybody took it is counted as dropped.
+
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._item = None
+        self._taken = True
+        self._dropped = 0
+        self._listeners = [] # Events set on every put (consumers waiting on several mailboxes)
+
+    def put(self, item: CapturedFrame) -> None:
+        with self._condition:
+            if not self._taken:
+                self._dropped += 1 # The previous frame was never consumed
+            self._item = item
+            self._taken = False
+            self._condition.notify_all()
+            for event in self._listeners:
+                event.set()
+
+    def add_listener(self, event: threading.Event) -> None:
+        with self._condition:
+            self._listeners.append(event)
+
+    def latest(self) -> CapturedFrame | None:
+
+        """
+        Returns the newest frame without blocking (None if nothing was published yet).
+
+        """
+
+        with self._condition:
+            self._taken = True
+            return self._item
+
+    def wait_newer(self, seq: int, timeout: float) -> CapturedFrame | None:
+
+        """
+        Returns the newest frame if its sequence number is greater than `seq`.
+        Only waits when the consumer is already faster than the camera; returns
+        None if no newer frame arrives within `timeout` seconds.
+
+        """
+
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._item is not None and self._item.seq > seq,
+                timeout=timeout
+            )
+            if self._item is None or self._item.seq <= seq:
+                return None
+            self._taken = True
+            return self._item
+
+    @property
+    def dropped(self) -> int:
+        with self._condition:
+            return self._dropped
+
+
+class CameraReader:
+
+    """
+    Reads a cv2.VideoCapture in a dedicated thread and publishes every frame to a
+    FrameMailbox together with a monotonic timestamp and a sequence number.
+
+    """
+
+    def __init__(self, name: str, cap: "cv2.VideoCapture", retry_delay: float = 0.05):
+        self.name = name
+        self.cap = cap
+        self.retry_delay = retry_delay # Pause after a failed read so a dead camera does not spin the CPU
+        self.mailbox = FrameMailbox()
+        self._seq = 0
+        self._failed_reads = 0
+        self._pending_resolution = None # Applied by the reader thread between two reads
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # With a reader draining the device continuously, a deep driver buffer only adds latency
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"CAPTURA-{self.name}",
+            daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Reader thread for '{self.name}' started")
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info(f"Reader thread for '{self.name}' stopped")
+
+    def set_resolution(self, width: int, height: int) -> None:
+
+        """
+        Requests a new capture resolution. The reader thread applies it before its
+        next read, so the device is never reconfigured in the middle of a read.
+
+        """
+
+        self._pending_resolution = (width, height)
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            resolution, self._pending_resolution = self._pending_resolution, None
+            if resolution is not None:
+                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+                logger.info(f"Camera '{self.name}' resolution set to {resolution[0]}x{resolution[1]}")
+            ret, frame = self.cap.read()
+            if not ret:
+                self._failed_reads += 1
+                time.sleep(self.retry_delay)
+                continue
+            self._seq += 1
+            self.mailbox.put(CapturedFrame(frame, time.monotonic(), self._seq, self.name))
+
+    def latest(self) -> CapturedFrame | None:
+        return self.mailbox.latest()
+
+    def wait_newer(self, seq: int, timeout: float = 1.0) -> CapturedFrame | None:
+        return self.mailbox.wait_newer(seq, timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> dict:
+
+        """
+        Returns the capture counters of this camera.
+
+        """
+
+        return {
+            "frames": self._seq,
+            "dropped": self.mailbox.dropped,
+            "failed_reads": self._failed_reads,
+        }
+
+
+class CaptureSubsystem:
+
+    """
+    Owns one CameraReader per physical cv2.VideoCapture. Registering the same
+    capture object under several names (e.g. two ROIs of one camera) shares a
+    single reader instead of reading the device twice.
+
+    """
+
+    def __init__(self):
+        self._readers = {} # name -> CameraReader
+        self._by_device = {} # id(cap) -> CameraReader
+
+    def add_camera(self, name: str, cap: "cv2.VideoCapture") -> CameraReader:
+        reader = self._by_device.get(id(cap))
+        if reader is None:
+            reader = CameraReader(name, cap)
+            self._by_device[id(cap)] = reader
+            reader.start()
+        self._readers[name] = reader
+        return reader
+
+    def reader(self, name: str) -> CameraReader:
+        return self._readers[name]
+
+    def latest_frames(self) -> dict[str, CapturedFrame | None]:
+
+        """
+        Returns the freshest frame of every registered camera without blocking.
+
+        """
+
+        return {name: reader.latest() for name, reader in self._readers.items()}
+
+    def dropped_frames(self) -> dict[str, int]:
+        return {name: reader.mailbox.dropped for name, reader in self._readers.items()}
+
+    def devices(self) -> dict[CameraReader, list[str]]:
+
+        """
+        Returns every physical reader together with the names registered on it.
+
+        """
+
+        groups = {}
+        for name, reader in self._readers.items():
+            groups.setdefault(reader, []).append(name)
+        return groups
+
+    def stats(self) -> dict[str, dict]:
+        return {reader.name: reader.stats() for reader in self._by_device.values()}
+
+    def stop(self) -> None:
+        for reader in self._by_device.values():
+            reader.stop()
+        self._readers.clear()
+        self._by_device.clear()
+
+
+@dataclass(frozen=True)
+class RoiView:
+
+    """
+    What a ROI consumer receives on every tick: the full frame of its device and
+    its ROI coordinates. The frame is shared with every other consumer of the same
+    device and is read-only; call writable() before drawing on it.
+
+    """
+
+    name: str
+    frame: np.ndarray
+    roi: tuple[int, int, int, int]
+    captured: CapturedFrame
+
+    @property
+    def crop(self) -> np.ndarray:
+
+        """
+        Returns the ROI as a read-only view of the shared frame (no copy).
+
+        """
+
+        x1, y1, x2, y2 = self.roi
+        return self.frame[y1:y2, x1:x2]
+
+    def writable(self) -> np.ndarray:
+
+        """
+        Returns a private copy of the full frame that the consumer may draw on.
+
+        """
+
+        return self.frame.copy()
+
+
+class FrameMultiplexer:
+
+    """
+    Fans out one capture per physical device to every ROI consumer on that device.
+    Each tick reads every device once and hands out read-only views, so two ROIs of
+    the same camera neither read the device twice nor copy the frame.
+
+    ROIs are given for `reference_size` (width, height); when a device delivers
+    another resolution the ROIs of its views are scaled to it. A device that stops
+    delivering frames does not delay the others: a tick returns as soon as any
+    device has a new frame.
+
+    """
+
+    def __init__(self, capture: CaptureSubsystem, rois: dict[str, tuple[int, int, int, int]],
+                 reference_size: tuple[int, int] = (640, 480)):
+        self.capture = capture
+        self.rois = {name: tuple(roi) for name, roi in rois.items()}
+        self.reference_size = reference_size
+        self._scaled = {} # (name, width, height) -> scaled ROI
+        self._devices = capture.devices()
+        self._last_seq = {reader: 0 for reader in self._devices}
+        self._ready = threading.Event() # Set by every device on each new frame
+        for reader in self._devices:
+            reader.mailbox.add_listener(self._ready)
+
+    def roi_for(self, name: str, width: int, height: int) -> tuple[int, int, int, int]:
+
+        """
+        Returns the ROI of `name` in the coordinates of a width x height frame.
+
+        """
+
+        key = (name, width, height)
+        roi = self._scaled.get(key)
+        if roi is None:
+            sx = width / self.reference_size[0]
+            sy = height / self.reference_size[1]
+            x1, y1, x2, y2 = self.rois[name]
+            roi = self._scaled[key] = (round(x1 * sx), round(y1 * sy), round(x2 * sx), round(y2 * sy))
+        return roi
+
+    def tick(self, timeout: float = 1.0) -> dict[str, RoiView]:
+
+        """
+        Returns a RoiView for every consumer whose device published a new frame.
+        Waits up to `timeout` for the first new frame of any device; the devices
+        without a new frame at that point are left out of this tick.
+
+        """
+
+        deadline = time.monotonic() + timeout
+        while True:
+            self._ready.clear()
+            views = self._collect()
+            remaining = deadline - time.monotonic()
+            if views or remaining <= 0:
+                return views
+            self._ready.wait(remaining)
+
+    def _collect(self) -> dict[str, RoiView]:
+        views = {}
+        for reader, names in self._devices.items():
+            captured = reader.wait_newer(self._last_seq[reader], 0)
+            if captured is None:
+                continue
+            self._last_seq[reader] = captured.seq
+            frame = captured.frame
+            frame.flags.writeable = False # Shared by every consumer of this device
+            height, width = frame.shape[:2]
+            for name in names:
+                if name in self.rois:
+                    views[name] = RoiView(name, frame, self.roi_for(name, width, height), captured)
+        return views
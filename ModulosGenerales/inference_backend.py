@@ -0,0 +1,397 @@
+import hashlib
+import importlib.util
+import json
+import logging
+import shutil
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Interchangeable CPU inference backends.
+# Every backend is called like the YOLO model it replaces: backend(images) returns a
+# list of Detections (one per image) whose `boxes` expose numpy `xyxy`, `conf` and
+# `cls` arrays. The PyTorch backend wraps ultralytics; the ONNX Runtime and
+# OpenVINO backends run a model exported once and cached next to the weights, so
+# they never import torch.
+
+logger = logging.getLogger("snow").getChild("inference_backend")
+
+# Preference order when the backend is "auto": fastest CPU runtime first
+BACKEND_ORDER = ("openvino", "onnxruntime", "torch")
+
+
+class Boxes:
+
+    """
+    Detected boxes of one image as numpy arrays, in the coordinates of that image.
+    Iterating yields one Boxes object per box, so `box.conf[0]` keeps working.
+
+    """
+
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray):
+        self.xyxy = xyxy.reshape(-1, 4).astype(np.float32, copy=False)
+        self.conf = conf.reshape(-1).astype(np.float32, copy=False)
+        self.cls = cls.reshape(-1).astype(np.int32, copy=False)
+
+    def __len__(self) -> int:
+        return len(self.conf)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Boxes(self.xyxy[i], self.conf[i:i + 1], self.cls[i:i + 1])
+
+
+class Detections:
+
+    """
+    Detection result of one image.
+
+    """
+
+    def __init__(self, orig_img: np.ndarray, boxes: Boxes, names: dict[int, str]):
+        self.orig_img = orig_img
+        self.boxes = boxes
+        self.names = names
+
+    def plot(self) -> np.ndarray:
+
+        """
+        Returns a copy of the image with the boxes and labels drawn on it.
+
+        """
+
+        annotated = self.orig_img.copy()
+        for (x1, y1, x2, y2), conf, cls in zip(self.boxes.xyxy.astype(int), self.boxes.conf, self.boxes.cls):
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            label = f"{self.names.get(int(cls), int(cls))} {conf:.2f}"
+            cv2.putText(annotated, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        return annotated
+
+
+@lru_cache(maxsize=64)
+def roi_input_shape(width: int, height: int, imgsz: int, stride: int = 32) -> tuple[int, int]:
+
+    """
+    Rectangular inference size (height, width) for a width x height ROI: the long
+    side becomes `imgsz` and the short side keeps the ROI aspect ratio, rounded up
+    to a multiple of `stride`. A 240x480 ROI at imgsz=640 gives (640, 320) instead
+    of letterboxing it into 640x640, so the model does not process the padding.
+
+    """
+
+    scale = imgsz / max(width, height)
+    return (
+        max(stride, int(np.ceil(height * scale / stride)) * stride),
+        max(stride, int(np.ceil(width * scale / stride)) * stride),
+    )
+
+
+@lru_cache(maxsize=64)
+def letterbox_params(height: int, width: int, new_shape: tuple[int, int]) -> tuple[float, tuple[int, int], tuple[int, int, int, int]]:
+
+    """
+    Precomputed letterbox of a height x width image into `new_shape` (height, width):
+    returns the scale, the resized (width, height) and the (top, bottom, left, right) padding.
+    Cached, since every ROI always has the same size.
+
+    """
+
+    scale = min(new_shape[0] / height, new_shape[1] / width)
+    new_w, new_h = round(width * scale), round(height * scale)
+    left = (new_shape[1] - new_w) // 2
+    top = (new_shape[0] - new_h) // 2
+    return scale, (new_w, new_h), (top, new_shape[0] - new_h - top, left, new_shape[1] - new_w - left)
+
+
+def letterbox(img: np.ndarray, new_shape: tuple[int, int], color: int = 114) -> tuple[np.ndarray, float, tuple[int, int]]:
+
+    """
+    Resizes `img` to fit `new_shape` (height, width) keeping its aspect ratio and
+    pads the rest. Returns the padded image, the scale and the (left, top) padding.
+
+    """
+
+    h, w = img.shape[:2]
+    scale, (new_w, new_h), (top, bottom, left, right) = letterbox_params(h, w, tuple(new_shape))
+
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    padded = cv2.copyMakeBorder(
+        img, top, bottom, left, right,
+        cv2.BORDER_CONSTANT, value=(color, color, color)
+    )
+    return padded, scale, (left, top)
+
+
+class InferenceBackend:
+
+    """
+    Base class. Subclasses implement _predict(images, imgsz, conf) -> list[Detections].
+
+    """
+
+    name = "base"
+
+    def __init__(self, imgsz: int = 640, conf: float = 0.25, iou: float = 0.45):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.names = {}
+
+    def __call__(self, source, imgsz: int | tuple[int, int] | None = None, conf: float | None = None, verbose: bool = False) -> list[Detections]:
+        images = source if isinstance(source, (list, tuple)) else [source]
+        return self._predict(list(images), imgsz or self.imgsz, self.conf if conf is None else conf)
+
+    def _predict(self, images: list[np.ndarray], imgsz: int, conf: float) -> list[Detections]:
+        raise NotImplementedError
+
+    def warmup(self) -> float:
+
+        """
+        Runs one dummy inference so the first real frame does not pay the
+        initialization cost. Returns the elapsed time in seconds.
+
+        """
+
+        start = time.perf_counter()
+        self(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8))
+        return time.perf_counter() - start
+
+
+class TorchBackend(InferenceBackend):
+
+    """
+    PyTorch backend through ultralytics. Imports torch, used as the fallback.
+
+    """
+
+    name = "torch"
+
+    def __init__(self, weights: str | Path, imgsz: int = 640, conf: float = 0.25, iou: float = 0.45):
+        super().__init__(imgsz, conf, iou)
+        from ultralytics import YOLO
+        self.model = YOLO(str(weights))
+        self.names = dict(self.model.names)
+
+    def _predict(self, images, imgsz, conf):
+        imgsz = list(imgsz) if isinstance(imgsz, tuple) else imgsz # ultralytics takes [height, width]
+        results = self.model(images, imgsz=imgsz, conf=conf, iou=self.iou, verbose=False)
+        detections = []
+        for image, result in zip(images, results):
+            boxes = result.boxes
+            detections.append(Detections(image, Boxes(
+                boxes.xyxy.cpu().numpy(),
+                boxes.conf.cpu().numpy(),
+                boxes.cls.cpu().numpy(),
+            ), self.names))
+        return detections
+
+
+class _ExportedBackend(InferenceBackend):
+
+    """
+    Shared pre/post-processing for exported YOLO models (output: batch x (4 + classes) x anchors).
+
+    """
+
+    def __init__(self, model_path: str | Path, imgsz: int = 640, conf: float = 0.25, iou: float = 0.45):
+        super().__init__(imgsz, conf, iou)
+        self.model_path = Path(model_path)
+        metadata = json.loads(metadata_path(self.model_path).read_text(encoding="utf-8"))
+        self.names = {int(k): v for k, v in metadata["names"].items()}
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _predict(self, images, imgsz, conf):
+        shape = imgsz if isinstance(imgsz, (tuple, list)) else (imgsz, imgsz)
+        batch = np.empty((len(images), 3, shape[0], shape[1]), dtype=np.float32)
+        transforms = []
+        for i, image in enumerate(images):
+            padded, scale, pad = letterbox(image, tuple(shape))
+            batch[i] = padded[:, :, ::-1].transpose(2, 0, 1) # BGR HWC -> RGB CHW
+            transforms.append((scale, pad))
+        batch *= 1 / 255.0
+
+        output = self._run(batch)
+        return [
+            Detections(image, self._postprocess(pred, scale, pad, image.shape, conf), self.names)
+            for image, pred, (scale, pad) in zip(images, output, transforms)
+        ]
+
+    def _postprocess(self, pred: np.ndarray, scale: float, pad: tuple[int, int], shape: tuple, conf: float) -> Boxes:
+        pred = pred.T # anchors x (4 + classes)
+        scores = pred[:, 4:]
+        cls = scores.argmax(axis=1)
+        best = scores[np.arange(len(cls)), cls]
+        keep = best > conf
+        if not keep.any():
+            return Boxes(np.empty((0, 4)), np.empty(0), np.empty(0))
+
+        xywh, best, cls = pred[keep, :4], best[keep], cls[keep]
+        xyxy = np.empty_like(xywh)
+        xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+        xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+        # Class-aware NMS: offset each class so boxes of different classes never overlap
+        offset = cls[:, None].astype(np.float32) * 4096
+        nms_boxes = np.concatenate([xyxy[:, :2] + offset, xywh[:, 2:]], axis=1)
+        indices = np.asarray(cv2.dnn.NMSBoxes(nms_boxes.tolist(), best.tolist(), conf, self.iou), dtype=int).reshape(-1)
+        xyxy, best, cls = xyxy[indices], best[indices], cls[indices]
+
+        # Undo the letterbox
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / scale
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / scale
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+        return Boxes(xyxy, best, cls)
+
+
+class OnnxRuntimeBackend(_ExportedBackend):
+
+    name = "onnxruntime"
+
+    def __init__(self, model_path, imgsz=640, conf=0.25, iou=0.45):
+        super().__init__(model_path, imgsz, conf, iou)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(self.model_path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoBackend(_ExportedBackend):
+
+    name = "openvino"
+
+    def __init__(self, model_path, imgsz=640, conf=0.25, iou=0.45):
+        super().__init__(model_path, imgsz, conf, iou)
+        import openvino as ov
+        core = ov.Core()
+        self.compiled = core.compile_model(core.read_model(str(self.model_path)), "CPU")
+        self.output = self.compiled.output(0)
+
+    def _run(self, batch):
+        return self.compiled(batch)[self.output]
+
+
+_BACKENDS = {
+    "onnxruntime": (OnnxRuntimeBackend, "onnx"),
+    "openvino": (OpenVinoBackend, "openvino"),
+}
+
+
+def weights_hash(weights: str | Path) -> str:
+
+    """
+    Returns a short SHA-256 of the weights file, used to key the exported models.
+
+    """
+
+    digest = hashlib.sha256()
+    with open(weights, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def cached_model_path(weights: str | Path, imgsz: int, fmt: str) -> Path:
+
+    """
+    Path of the exported model for these weights and input size, next to the weights.
+    e.g. best.pt -> best.3f2a9c1e0b7d.640.onnx / best.3f2a9c1e0b7d.640.openvino/best.xml
+
+    """
+
+    weights = Path(weights)
+    stem = f"{weights.stem}.{weights_hash(weights)}.{imgsz}"
+    if fmt == "openvino":
+        return weights.with_name(f"{stem}.openvino") / f"{weights.stem}.xml"
+    return weights.with_name(f"{stem}.{fmt}")
+
+
+def metadata_path(model_path: Path) -> Path:
+    return model_path.with_suffix(".json")
+
+
+def export_model(weights: str | Path, imgsz: int, fmt: str) -> Path:
+
+    """
+    Returns the cached export of `weights`, exporting it first if it does not exist.
+    Exporting needs ultralytics (and torch), but only the first time.
+
+    """
+
+    target = cached_model_path(weights, imgsz, fmt)
+    if target.exists() and metadata_path(target).exists():
+        return target
+
+    from ultralytics import YOLO
+    logger.info(f"Exporting {weights} to {fmt} (imgsz={imgsz}), this only happens once")
+    model = YOLO(str(weights))
+    exported = Path(model.export(format=fmt, imgsz=imgsz, dynamic=True))
+
+    if fmt == "openvino": # ultralytics exports a directory: keep it under the cached name
+        if target.parent.exists():
+            shutil.rmtree(target.parent)
+        shutil.move(str(exported), str(target.parent))
+        xml = next(target.parent.glob("*.xml"))
+        if xml != target:
+            xml.rename(target)
+            xml.with_suffix(".bin").rename(target.with_suffix(".bin"))
+    else:
+        shutil.move(str(exported), str(target))
+
+    metadata_path(target).write_text(json.dumps({
+        "weights": str(weights),
+        "imgsz": imgsz,
+        "names": {str(k): v for k, v in model.names.items()},
+    }), encoding="utf-8")
+    return target
+
+
+def available_backends() -> list[str]:
+
+    """
+    Returns the backends whose runtime is installed, in preference order.
+
+    """
+
+    modules = {"openvino": "openvino", "onnxruntime": "onnxruntime", "torch": "ultralytics"}
+    return [name for name in BACKEND_ORDER if importlib.util.find_spec(modules[name]) is not None]
+
+
+def load_backend(weights: str | Path = "best.pt", imgsz: int = 640, preferred: str = "auto",
+                 conf: float = 0.25, iou: float = 0.45) -> InferenceBackend:
+
+    """
+    Loads the inference backend. With preferred="auto" the fastest available runtime
+    is used (see BACKEND_ORDER); a backend that fails to load falls back to the next.
+
+    """
+
+    candidates = available_backends()
+    if preferred != "auto":
+        candidates = [preferred] + [name for name in candidates if name != preferred]
+
+    for name in candidates:
+        try:
+            start = time.perf_counter()
+            if name == "torch":
+                backend = TorchBackend(weights, imgsz, conf, iou)
+            else:
+                backend_class, fmt = _BACKENDS[name]
+                backend = backend_class(export_model(weights, imgsz, fmt), imgsz, conf, iou)
+            backend.warmup()
+            logger.info(f"Inference backend '{name}' ready in {time.perf_counter() - start:.1f} s")
+            return backend
+        except Exception as e:
+            logger.warning(f"Inference backend '{name}' not available: {e}")
+
+    raise RuntimeError("No inference backend could be loaded")
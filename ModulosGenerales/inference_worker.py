@@ -0,0 +1,335 @@
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ModulosGenerales.batch_inference import batch_input_shape
+from ModulosGenerales.inference_backend import Boxes, Detections, load_backend
+
+# Out-of-process inference.
+# The model lives in a dedicated worker process, so inference never competes for
+# the GIL with capture, drawing, audio or GPIO threads. Crops travel through a
+# shared-memory ring of preallocated slots (pixels are never pickled); only the
+# slot index, the crop shape and the resulting boxes go through the queues.
+
+logger = logging.getLogger("snow").getChild("inference_worker")
+
+SLOT_SHAPE = (480, 640, 3) # Largest crop a slot can hold (height, width, channels)
+
+
+def load_configured_backend(options: dict):
+
+    """
+    Loads the backend described by `options` (keys: weights, imgsz, preferred, int8,
+    threshold, tolerance, calibration_dir, min_boxes). INT8 is used only if its gate
+    passes; any error while building or validating it falls back to FP32.
+
+    """
+
+    backend = None
+    if options.get("int8"):
+        try:
+            from ModulosGenerales.quantization import MIN_REFERENCE_BOXES, load_quantized_backend
+            backend = load_quantized_backend(
+                options.get("weights", "best.pt"),
+                options.get("imgsz", 640),
+                threshold=options.get("threshold", 0.83),
+                tolerance=options.get("tolerance", 0.02),
+                calibration_dir=options.get("calibration_dir"),
+                min_boxes=options.get("min_boxes", MIN_REFERENCE_BOXES),
+            )
+        except Exception as e:
+            logger.warning(f"INT8 model unavailable ({type(e).__name__}: {e}), using FP32")
+            backend = None
+    if backend is None:
+        backend = load_backend(
+            options.get("weights", "best.pt"),
+            imgsz=options.get("imgsz", 640),
+            preferred=options.get("preferred", "auto"),
+        )
+    return backend
+
+
+def _worker_main(shm_name: str, slots: int, options: dict, requests, results) -> None:
+
+    """
+    Entry point of the worker process.
+
+    """
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray((slots,) + SLOT_SHAPE, dtype=np.uint8, buffer=shm.buf)
+    try:
+        try:
+            backend = load_configured_backend(options)
+        except Exception as e:
+            results.put(("error", None, str(e)))
+            return
+        results.put(("ready", backend.name, backend.names))
+
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            job_id, imgsz, rect, items = request # items: [(name, slot, height, width), ...]
+            try:
+                shape = batch_input_shape([(h, w) for _, _, h, w in items], imgsz, rect)
+                detections = backend([ring[slot, :h, :w] for _, slot, h, w in items], imgsz=shape)
+                payload = {
+                    name: (d.boxes.xyxy, d.boxes.conf, d.boxes.cls)
+                    for (name, _, _, _), d in zip(items, detections)
+                }
+                results.put(("ok", job_id, payload))
+            except Exception as e:
+                results.put(("error", job_id, str(e)))
+    finally:
+        del ring
+        shm.close()
+
+
+class InferenceWorker:
+
+    """
+    Parent-side handle of the inference process. detect() has the same interface
+    as BatchDetector.detect(): camera name -> crop in, camera name -> results out.
+    Calls from several threads are serialized; use an InferencePool to run them
+    in parallel.
+
+    `slots` must cover the largest number of crops of one call (e.g. the ROI count
+    of the registry). The slots of a job that timed out stay reserved until the
+    worker answers it, since the worker may still be reading them.
+
+    """
+
+    def __init__(self, options: dict, slots: int = 4, timeout: float = 5.0, alpha: float = 0.1):
+        self.imgsz = options.get("imgsz", 640)
+        self.rect = options.get("rect", False) # Rectangular batch input size (see batch_input_shape)
+        self.timeout = timeout
+        self.name = "worker"
+        self.names = {}
+        self._slots = slots
+        self._alpha = alpha
+        self._job_id = 0
+        self._lock = threading.Lock() # One job in flight: answers are matched by job id
+        self._free = queue.SimpleQueue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._stale = {} # Job id of a timed-out job -> slots the worker may still be reading
+
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * int(np.prod(SLOT_SHAPE)))
+        self._ring = np.ndarray((slots,) + SLOT_SHAPE, dtype=np.uint8, buffer=self._shm.buf)
+
+        # "spawn": forking a process that already runs capture/audio threads is not safe
+        context = mp.get_context("spawn")
+        self._requests = context.Queue()
+        self._results = context.Queue()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(self._shm.name, slots, options, self._requests, self._results),
+            name="INFERENCIA",
+            daemon=True
+        )
+
+        self.batches = 0
+        self.last_latency = 0.0
+        self.mean_latency = None
+        self.latency_var = 0.0
+
+    def start(self, timeout: float = 120.0) -> None:
+
+        """
+        Starts the worker and waits until its model is loaded and warmed up.
+
+        """
+
+        self._process.start()
+        try:
+            status, backend_name, names = self._results.get(timeout=timeout)
+        except queue.Empty:
+            self.close()
+            raise RuntimeError("Inference worker did not start in time")
+        if status != "ready":
+            self.close()
+            raise RuntimeError(f"Inference worker could not load the model: {names}")
+        self.name = f"worker/{backend_name}"
+        self.names = names
+        logger.info(f"Inference worker started (pid {self._process.pid}, backend {backend_name})")
+
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def detect(self, crops: dict[str, np.ndarray]) -> dict[str, list]:
+
+        """
+        Copies every crop into a free slot of the ring, waits for the worker and
+        returns camera name -> [Detections] in the crop coordinates.
+
+        """
+
+        if not crops:
+            return {}
+        if len(crops) > self._slots:
+            raise ValueError(f"{len(crops)} crops do not fit in a ring of {self._slots} slots")
+
+        with self._lock:
+            start = time.perf_counter()
+            self._drain_stale()
+            if self._free.qsize() < len(crops):
+                raise RuntimeError("Ring slots still held by a timed-out job, inference worker not answering")
+
+            items = []
+            try:
+                for name, crop in crops.items():
+                    h, w = crop.shape[:2]
+                    if h > SLOT_SHAPE[0] or w > SLOT_SHAPE[1]:
+                        raise ValueError(f"Crop {name} ({w}x{h}) does not fit in a ring slot")
+                    slot = self._free.get_nowait()
+                    self._ring[slot, :h, :w] = crop
+                    items.append((name, slot, h, w))
+            except Exception:
+                for _, slot, _, _ in items:
+                    self._free.put(slot)
+                raise
+
+            self._job_id += 1
+            self._requests.put((self._job_id, self.imgsz, self.rect, items))
+
+            try:
+                while True:
+                    status, job_id, payload = self._results.get(timeout=self.timeout)
+                    if job_id == self._job_id:
+                        break
+                    self._release(job_id) # Late answer of a timed-out job: its slots are free again
+            except queue.Empty:
+                self._stale[self._job_id] = [slot for _, slot, _, _ in items]
+                raise RuntimeError("Inference worker not answering")
+            for _, slot, _, _ in items:
+                self._free.put(slot)
+
+            if status != "ok":
+                raise RuntimeError(f"Inference worker error: {payload}")
+
+            self._record(time.perf_counter() - start)
+        return {
+            name: [Detections(crops[name], Boxes(*payload[name]), self.names)]
+            for name in crops
+        }
+
+    def _release(self, job_id: int) -> None:
+        for slot in self._stale.pop(job_id, ()):
+            self._free.put(slot)
+
+    def _drain_stale(self) -> None:
+        # Frees the slots of the timed-out jobs the worker has answered since
+        while self._stale:
+            try:
+                _, job_id, _ = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._release(job_id)
+
+    def _record(self, latency: float) -> None:
+        self.batches += 1
+        self.last_latency = latency
+        if self.mean_latency is None:
+            self.mean_latency = latency
+            return
+        delta = latency - self.mean_latency
+        self.mean_latency += self._alpha * delta
+        self.latency_var = (1 - self._alpha) * (self.latency_var + self._alpha * delta * delta)
+
+    def stats(self) -> dict:
+
+        """
+        Returns the end-to-end latency (copy + inference + answer) and its jitter in milliseconds.
+
+        """
+
+        return {
+            "batches": self.batches,
+            "last_latency_ms": self.last_latency * 1000,
+            "mean_latency_ms": (self.mean_latency or 0.0) * 1000,
+            "jitter_ms": self.latency_var ** 0.5 * 1000,
+            "stale_jobs": len(self._stale), # Timed-out jobs whose slots are still reserved
+        }
+
+    def close(self) -> None:
+
+        """
+        Stops the worker process and releases the shared memory.
+
+        """
+
+        if self._shm is None:
+            return
+        if self._process.is_alive():
+            self._requests.put(None)
+            self._process.join(5)
+            if self._process.is_alive():
+                self._process.terminate()
+        self._ring = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        logger.info("Inference worker stopped")
+
+
+class InferencePool:
+
+    """
+    Several InferenceWorker processes behind the same interface. Each detect() call
+    takes an idle worker, so camera lanes calling it at the same time run on
+    different cores instead of waiting for each other.
+
+    """
+
+    def __init__(self, options: dict, workers: int = 2, **kwargs):
+        self.workers = [InferenceWorker(options, **kwargs) for _ in range(max(1, workers))]
+        self.timeout = self.workers[0].timeout
+        self.name = "pool"
+        self._idle = queue.SimpleQueue()
+
+    @property
+    def imgsz(self) -> int:
+        return self.workers[0].imgsz
+
+    @imgsz.setter
+    def imgsz(self, value: int) -> None:
+        for worker in self.workers:
+            worker.imgsz = value
+
+    def start(self, timeout: float = 120.0) -> None:
+        try:
+            for worker in self.workers:
+                worker.start(timeout)
+                self._idle.put(worker)
+        except Exception:
+            self.close()
+            raise
+        self.name = f"pool/{len(self.workers)}x{self.workers[0].name}"
+
+    def is_alive(self) -> bool:
+        return all(worker.is_alive() for worker in self.workers)
+
+    def detect(self, crops: dict[str, np.ndarray]) -> dict[str, list]:
+        if not crops:
+            return {}
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError("No idle inference worker")
+        try:
+            return worker.detect(crops)
+        finally:
+            self._idle.put(worker)
+
+    def stats(self) -> dict:
+        return {f"worker{i}": worker.stats() for i, worker in enumerate(self.workers)}
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.close()
@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import cv2
+
+from config import (
+    MJPEG_FPS,
+    MJPEG_QUALITY,
+    MJPEG_MIN_QUALITY,
+    MJPEG_MIN_SCALE,
+    MJPEG_ENCODE_BUDGET_MS,
+)
+from ModulosGenerales.preview import PreviewRenderer, compose
+
+# On-demand MJPEG preview server.
+# Serves the annotated camera views over HTTP (a multipart MJPEG stream and single
+# snapshots) so the system can be watched from a browser without a local display.
+# The encoder thread only runs while at least one client is connected; each new
+# frame is encoded once and the same JPEG bytes are sent to every client. Quality,
+# then size, go down when encoding exceeds its time budget and back up when there
+# is room. With no clients nothing is published, drawn or encoded.
+
+logger = logging.getLogger("snow").getChild("mjpeg_server")
+
+BOUNDARY = "frame"
+
+INDEX_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SADA</title></head>
+<body style="background:#111;color:#ddd;font-family:sans-serif">
+{views}
+</body></html>
+"""
+
+
+class MjpegServer:
+
+    """
+    HTTP server of the annotated views published in a PreviewRenderer.
+
+    Endpoints: "/" (index), "/stream/<camera>" (MJPEG) and "/snapshot/<camera>.jpg".
+
+    """
+
+    def __init__(self, preview: PreviewRenderer, host: str = "127.0.0.1", port: int = 8080,
+                 fps: float = MJPEG_FPS, budget_ms: float = MJPEG_ENCODE_BUDGET_MS,
+                 cameras: list[str] | None = None):
+        self.preview = preview
+        self.cameras = list(cameras or []) # Views listed in the index before their first frame
+        self.host = host
+        self.port = port
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self.budget = budget_ms / 1000
+        self.quality = MJPEG_QUALITY
+        self.scale = 1.0
+        self.mean_encode = None # Exponential moving average of the encoding time, in seconds
+
+        self._jpegs = {} # Camera name -> (sequence, JPEG bytes)
+        self._seq = 0
+        self._clients = 0
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._server = None
+        self._threads = []
+        self.encoded = 0
+
+    def start(self) -> None:
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        for target, name in ((self._server.serve_forever, "MJPEG-HTTP"), (self._encode_loop, "MJPEG-ENCODER")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"MJPEG preview available at http://{self.host}:{self.port}/")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join(2)
+        self._threads = []
+
+    # Clients -------------------------------------------------------------------
+
+    def _connect(self) -> None:
+        with self._cond:
+            self._clients += 1
+            if self._clients == 1:
+                self.preview.add_viewer()
+                logger.info("First MJPEG client connected, encoder running")
+            self._cond.notify_all()
+
+    def _disconnect(self) -> None:
+        with self._cond:
+            self._clients -= 1
+            if self._clients == 0:
+                self.preview.remove_viewer()
+                self._jpegs.clear()
+                logger.info("Last MJPEG client disconnected, encoder idle")
+
+    def wait_jpeg(self, camera: str, after: int, timeout: float = 2.0) -> tuple[int, bytes] | None:
+
+        """
+        Waits for a JPEG of `camera` newer than sequence `after`. Returns (sequence, bytes)
+        or None on timeout or shutdown.
+
+        """
+
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stop_event.is_set() or self._jpegs.get(camera, (0, None))[0] > after,
+                timeout
+            )
+            item = self._jpegs.get(camera)
+            return item if item is not None and item[0] > after else None
+
+    # Encoder -------------------------------------------------------------------
+
+    def _encode_loop(self) -> None:
+        encoded_versions = {}
+        while not self._stop_event.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self._clients > 0 or self._stop_event.is_set())
+            if self._stop_event.is_set():
+                break
+
+            start = time.monotonic()
+            for camera, (frame, roi, results, version) in self.preview.latest().items():
+                if encoded_versions.get(camera) == version:
+                    continue
+                try:
+                    jpeg = self._encode(compose(frame, roi, results))
+                except Exception as e:
+                    logger.error(f"Error encoding preview of {camera}: {e}")
+                    continue
+                encoded_versions[camera] = version
+                with self._cond:
+                    self._seq += 1
+                    self._jpegs[camera] = (self._seq, jpeg)
+                    self._cond.notify_all()
+
+            self._stop_event.wait(max(0.0, self.period - (time.monotonic() - start)))
+
+    def _encode(self, image) -> bytes:
+        start = time.perf_counter()
+        if self.scale < 1.0:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        self._adapt(time.perf_counter() - start)
+        self.encoded += 1
+        return buffer.tobytes()
+
+    def _adapt(self, elapsed: float) -> None:
+        self.mean_encode = elapsed if self.mean_encode is None else self.mean_encode + 0.2 * (elapsed - self.mean_encode)
+        if self.mean_encode > self.budget:
+            if self.quality > MJPEG_MIN_QUALITY:
+                self.quality = max(MJPEG_MIN_QUALITY, self.quality - 10)
+            elif self.scale > MJPEG_MIN_SCALE:
+                self.scale = max(MJPEG_MIN_SCALE, self.scale - 0.1)
+        elif self.mean_encode < self.budget / 2:
+            if self.scale < 1.0:
+                self.scale = min(1.0, self.scale + 0.1)
+            elif self.quality < MJPEG_QUALITY:
+                self.quality = min(MJPEG_QUALITY, self.quality + 5)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "clients": self._clients,
+                "encoded": self.encoded,
+                "quality": self.quality,
+                "scale": round(self.scale, 2),
+                "mean_encode_ms": (self.mean_encode or 0.0) * 1000,
+            }
+
+    # HTTP ----------------------------------------------------------------------
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.client_address[0]} {format % args}")
+
+            def do_GET(self):
+                path = unquote(self.path.split("?", 1)[0])
+                if path == "/":
+                    self._index()
+                elif path.startswith("/stream/"):
+                    self._stream(path[len("/stream/"):])
+                elif path.startswith("/snapshot/") and path.endswith(".jpg"):
+                    self._snapshot(path[len("/snapshot/"):-len(".jpg")])
+                else:
+                    self.send_error(404)
+
+            def _index(self):
+                cameras = sorted(set(server.cameras) | set(server.preview.latest()))
+                views = "\n".join(f'<h3>{c}</h3><img src="/stream/{c}">' for c in cameras) or \
+                    '<p>Waiting for frames... reload the page once the cameras are running.</p>'
+                body = INDEX_PAGE.format(views=views).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _snapshot(self, camera):
+                server._connect()
+                try:
+                    item = server.wait_jpeg(camera, 0)
+                finally:
+                    server._disconnect()
+                if item is None:
+                    self.send_error(503, "No frame available")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(item[1])))
+                self.end_headers()
+                self.wfile.write(item[1])
+
+            def _stream(self, camera):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                server._connect()
+                seq = 0
+                try:
+                    while not server._stop_event.is_set():
+                        item = server.wait_jpeg(camera, seq)
+                        if item is None:
+                            continue
+                        seq, jpeg = item
+                        self.wfile.write(
+                            f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode()
+                        )
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server._disconnect()
+
+        return Handler
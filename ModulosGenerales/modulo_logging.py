@@ -1,13 +1,25 @@
+import atexit
 import logging 
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
 import sys 
-from config import DEBUG, CONSOLE_LOG, FILE_LOG
+import threading
+import time
+from config import DEBUG, CONSOLE_LOG, FILE_LOG, ASYNC_LOG, LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_TIMEOUT
 from ModulosGenerales.error_buffer import add_error
 
 
 
 # In order to use the logging system in any module, it is necessary to write
 # logging.getLogger(“snow”).getChild(“Yerik”)
+#
+# In asynchronous mode the file and console handlers sit behind a queue: logging a
+# record only merges its message and enqueues it, and a single listener thread
+# formats the records and writes them to the SD card in batches, flushing once per
+# batch. The error buffer handler stays synchronous so errors show up at once.
+
+_listener = None # BatchQueueListener of the asynchronous mode
+_queue_handler = None # DroppingQueueHandler feeding it
 
 class ErrorBufferHandler(logging.Handler):
 
@@ -30,7 +42,133 @@ class ErrorBufferHandler(logging.Handler):
             except Exception:
                 self.handleError(record) # Handle any exceptions that occur during logging
 
-def setup_logging(app_name: str = "snow"):
+class BatchFileHandler(RotatingFileHandler):
+
+        """
+        RotatingFileHandler that leaves the written records in the file buffer until
+        flush_batch() is called, instead of flushing after every record.
+
+        """
+
+        def flush(self) -> None:
+            pass # Called by emit() after every record
+
+        def flush_batch(self) -> None:
+            super().flush()
+
+        def close(self) -> None:
+            self.flush_batch()
+            super().close()
+
+class DroppingQueueHandler(QueueHandler):
+
+        """
+        Queue handler that never blocks the caller for long: when the queue is full,
+        records below `block_level` are dropped and counted, and more severe records
+        wait up to `block_timeout` seconds for room.
+
+        """
+
+        def __init__(self, log_queue: queue.Queue, block_level: int = logging.WARNING, block_timeout: float = 0.1):
+            super().__init__(log_queue)
+            self.block_level = block_level
+            self.block_timeout = block_timeout
+            self.dropped = 0
+
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            """
+            Freezes the message arguments in the caller thread and leaves the
+            formatting to the listener (the record never leaves this process).
+            """
+
+            record.msg = record.getMessage()
+            record.args = None
+            return record
+
+        def enqueue(self, record: logging.LogRecord) -> None:
+            try:
+                if record.levelno >= self.block_level:
+                    self.queue.put(record, timeout=self.block_timeout)
+                else:
+                    self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+class BatchQueueListener(QueueListener):
+
+        """
+        Queue listener that takes up to `batch_size` records at a time, passes them
+        to the handlers and then flushes every handler once. Keeps the time from
+        the log call to the write and the time spent in the handlers.
+
+        """
+
+        def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, batch_size: int = LOG_BATCH_SIZE,
+                     alpha: float = 0.1):
+            super().__init__(log_queue, *handlers, respect_handler_level=True)
+            self.batch_size = batch_size
+            self.alpha = alpha
+            self.handled = 0
+            self.batches = 0
+            self.mean_latency = 0.0 # Seconds from the log call to the write
+            self.max_latency = 0.0
+            self.mean_batch_time = 0.0 # Seconds spent in the handlers per batch
+
+        def start(self) -> None:
+            self._thread = threading.Thread(target=self._monitor, name="LOG-LISTENER", daemon=True)
+            self._thread.start()
+
+        def _monitor(self) -> None:
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = self._sentinel in batch
+                records = [record for record in batch if record is not self._sentinel]
+                start = time.time()
+                for record in records:
+                    self.handle(record)
+                for handler in self.handlers:
+                    getattr(handler, "flush_batch", handler.flush)()
+                end = time.time()
+
+                if records:
+                    self.handled += len(records)
+                    self.batches += 1
+                    self.mean_batch_time += self.alpha * ((end - start) - self.mean_batch_time)
+                    for record in records:
+                        latency = end - record.created
+                        self.mean_latency += self.alpha * (latency - self.mean_latency)
+                        self.max_latency = max(self.max_latency, latency)
+                if stop:
+                    return
+
+        def stop(self, timeout: float = LOG_FLUSH_TIMEOUT) -> bool:
+
+            """
+            Writes the pending records and stops the listener, waiting at most
+            `timeout` seconds. Returns False if records were left unwritten.
+
+            """
+
+            if self._thread is None:
+                return True
+            deadline = time.monotonic() + timeout
+            try:
+                self.queue.put(self._sentinel, timeout=timeout)
+            except queue.Full:
+                return False
+            self._thread.join(max(0.0, deadline - time.monotonic()))
+            if self._thread.is_alive():
+                return False
+            self._thread = None
+            return True
+
+def setup_logging(app_name: str = "snow", asynchronous: bool = ASYNC_LOG):
 
     logger = logging.getLogger(app_name) #Logger creation
     if logger.handlers:
@@ -51,7 +189,7 @@ def setup_logging(app_name: str = "snow"):
 
     #file handler creation
     # This only will send info logs or higher to 'sistema_log_snow.log'
-    file_handler = RotatingFileHandler(
+    file_handler = (BatchFileHandler if asynchronous else RotatingFileHandler)(
         'sistema_log_snow.log',
         maxBytes=1_000_000, # Maximum file size of 1MB
         backupCount=5,      # Keep up to 5 backup files
@@ -61,15 +199,25 @@ def setup_logging(app_name: str = "snow"):
     file_handler.setLevel(logging.DEBUG if DEBUG else FILE_LOG) # Set the file handler to log INFO level and above
     file_handler.setFormatter(formatter) # Set the formatter for the file handler
 
-    logger.addHandler(file_handler) # Add the file handler to the root logger
-
     #Stream handler creation
     # This will send Wargning or higher logs to the console
     stream_handler = logging.StreamHandler(sys.stdout) 
     stream_handler.setLevel(logging.DEBUG if DEBUG else CONSOLE_LOG) # Set the stream handler to log WARNING level and above
     stream_handler.setFormatter(formatter) # Set the formatter for the stream handler
 
-    logger.addHandler(stream_handler) # Add the stream handler to the root logger
+    if asynchronous:
+        # The file and console writes happen in the listener thread
+        global _listener, _queue_handler
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _queue_handler.setLevel(min(file_handler.level, stream_handler.level)) # Lower records are never enqueued
+        logger.addHandler(_queue_handler)
+        _listener = BatchQueueListener(log_queue, file_handler, stream_handler)
+        _listener.start()
+        atexit.register(shutdown_logging) # Bounded flush of the pending records on exit
+    else:
+        logger.addHandler(file_handler) # Add the file handler to the root logger
+        logger.addHandler(stream_handler) # Add the stream handler to the root logger
 
     logging.info("Logging setup complete. INFO and higher logs will be written to 'sistema_log_snow.log' but only WARNING and higher logs will be displayed in the console.")
 
@@ -77,6 +225,43 @@ def setup_logging(app_name: str = "snow"):
 
     return logger 
 
+def shutdown_logging(timeout: float = LOG_FLUSH_TIMEOUT) -> None:
+
+    """
+    Writes the records still queued in asynchronous mode, waiting at most `timeout`
+    seconds, and closes the handlers. Safe to call more than once.
+
+    """
+
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    if listener.stop(timeout):
+        for handler in listener.handlers:
+            handler.close()
+    else:
+        print(f"Logging shutdown timed out with {listener.queue.qsize()} records unwritten", file=sys.stderr)
+
+def log_stats() -> dict:
+
+    """
+    Returns the counters of the asynchronous mode (empty in synchronous mode).
+
+    """
+
+    if _listener is None:
+        return {}
+    return {
+        "queued": _listener.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "handled": _listener.handled,
+        "batches": _listener.batches,
+        "mean_latency_ms": _listener.mean_latency * 1000,
+        "max_latency_ms": _listener.max_latency * 1000,
+        "mean_batch_ms": _listener.mean_batch_time * 1000,
+    }
+
 # Example usage
 if __name__ == "__main__":
     mi_logger = setup_logging()
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import (
+    MOTION_FRAME_WIDTH,
+    MOTION_PIXEL_THRESHOLD,
+    MOTION_MIN_FRACTION,
+    MOTION_BACKGROUND_ALPHA,
+    MOTION_REFRESH_INTERVAL,
+)
+from ModulosGenerales.camera_health import downsample_gray
+
+# Motion gate in front of the detector.
+# Every ROI keeps a running-average background of a small grayscale thumbnail. The
+# detector only runs on a ROI when enough of its pixels differ from the background,
+# or when the refresh interval expires, so an empty corridor costs a thumbnail
+# instead of a full inference.
+
+logger = logging.getLogger("snow").getChild("motion_gate")
+
+
+class _RoiState:
+
+    def __init__(self):
+        self.background = None # float32 running average
+        self.last_run = float("-inf")
+        self.gated = 0
+        self.executed = 0
+
+
+class MotionGate:
+
+    """
+    Decides, per ROI, whether the detector needs to run on the current crop.
+
+    """
+
+    def __init__(self,
+                 pixel_threshold: int = MOTION_PIXEL_THRESHOLD,
+                 min_fraction: float = MOTION_MIN_FRACTION,
+                 refresh_interval: float = MOTION_REFRESH_INTERVAL,
+                 alpha: float = MOTION_BACKGROUND_ALPHA,
+                 width: int = MOTION_FRAME_WIDTH):
+        self.pixel_threshold = pixel_threshold
+        self.min_fraction = min_fraction
+        self.refresh_interval = refresh_interval
+        self.alpha = alpha
+        self.width = width
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def should_run(self, roi_name: str, crop: np.ndarray, now: float | None = None) -> bool:
+
+        """
+        Updates the background of `roi_name` with `crop` and returns True if the
+        detector must run on it (motion, refresh interval expired or first frame).
+
+        """
+
+        now = time.monotonic() if now is None else now
+        h, w = crop.shape[:2]
+        gray = downsample_gray(crop, (self.width, max(1, round(self.width * h / w))))
+        gray = cv2.GaussianBlur(gray, (3, 3), 0)
+
+        with self._lock:
+            state = self._states.get(roi_name)
+            if state is None:
+                state = self._states[roi_name] = _RoiState()
+
+            if state.background is None or state.background.shape != gray.shape:
+                state.background = gray.astype(np.float32)
+                moving = True
+            else:
+                diff = cv2.absdiff(gray, cv2.convertScaleAbs(state.background))
+                moving = np.count_nonzero(diff > self.pixel_threshold) >= self.min_fraction * diff.size
+                cv2.accumulateWeighted(gray, state.background, self.alpha)
+
+            run = moving or now - state.last_run >= self.refresh_interval
+            if run:
+                state.last_run = now
+                state.executed += 1
+            else:
+                state.gated += 1
+            return run
+
+    def keep_open(self, roi_name: str) -> None:
+
+        """
+        Forces the detector to run on the next crop of a ROI. Call it while the
+        detector keeps finding something, so a person standing still (slowly
+        absorbed by the background) is not gated out.
+
+        """
+
+        with self._lock:
+            state = self._states.get(roi_name)
+            if state is not None:
+                state.last_run = float("-inf")
+
+    def stats(self) -> dict[str, dict]:
+
+        """
+        Returns, per ROI, how many inferences were gated and how many executed.
+
+        """
+
+        with self._lock:
+            return {
+                name: {"gated": state.gated, "executed": state.executed}
+                for name, state in self._states.items()
+            }
@@ -0,0 +1,213 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+from config import PIPELINE_CHANNEL_SIZE, PIPELINE_POLL_INTERVAL
+from ModulosGenerales.bounded_queue import DROP_OLDEST, BoundedQueue
+
+# Staged pipeline runtime.
+# A pipeline is a chain of stages (capture, preprocess, infer, postprocess, decide,
+# actuate...) connected by bounded channels. Every stage runs its function in its
+# own worker threads, so a slow stage can get more workers without touching the
+# others, and it keeps its own throughput and latency metrics so the slow one is
+# easy to spot. All workers stop cooperatively when the shared stop_event is set.
+
+logger = logging.getLogger("snow").getChild("pipeline")
+
+
+class Stage:
+
+    """
+    One step of a pipeline. `fn` receives an item from the input channel and returns
+    the item for the next stage, or None to drop it. A stage without input channel
+    is a source: `fn` is called with no arguments in a loop.
+
+    With more than one worker the items of a stage may leave it out of order.
+
+    """
+
+    def __init__(self, name: str, fn: Callable, workers: int = 1,
+                 input: BoundedQueue | None = None, output: BoundedQueue | None = None,
+                 alpha: float = 0.1):
+        if workers < 1:
+            raise ValueError(f"Stage '{name}' needs at least one worker")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.input = input
+        self.output = output
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self.processed = 0 # Items the function returned something for
+        self.filtered = 0 # Items the function dropped (returned None)
+        self.errors = 0
+        self.mean_latency = None # Exponential moving average of fn, in seconds
+        self.busy = 0.0 # Total time spent inside fn, in seconds
+        self._started = None
+
+    def _record(self, latency: float, forwarded: bool) -> None:
+        with self._lock:
+            if forwarded:
+                self.processed += 1
+            else:
+                self.filtered += 1
+            self.busy += latency
+            self.mean_latency = latency if self.mean_latency is None else (
+                self.mean_latency + self.alpha * (latency - self.mean_latency)
+            )
+
+    def _worker(self, stop_event: threading.Event, poll_interval: float) -> None:
+        while not stop_event.is_set():
+            if self.input is None:
+                args = ()
+            else:
+                try:
+                    args = (self.input.get(timeout=poll_interval),)
+                except queue.Empty:
+                    continue
+
+            start = time.perf_counter()
+            try:
+                result = self.fn(*args)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.error(f"Stage '{self.name}' failed: {e}")
+                continue
+            self._record(time.perf_counter() - start, result is not None)
+
+            if result is not None and self.output is not None:
+                self.output.put(result)
+
+    def start(self, stop_event: threading.Event, poll_interval: float = PIPELINE_POLL_INTERVAL) -> list[threading.Thread]:
+
+        """
+        Starts the workers of this stage and returns their threads.
+
+        """
+
+        self._started = time.monotonic()
+        threads = []
+        for i in range(self.workers):
+            name = self.name.upper() if self.workers == 1 else f"{self.name.upper()}-{i}"
+            thread = threading.Thread(target=self._worker, args=(stop_event, poll_interval), name=name, daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def stats(self) -> dict:
+
+        """
+        Returns the throughput (items per second), mean latency (ms) and utilization
+        of this stage, plus the metrics of its input channel.
+
+        """
+
+        with self._lock:
+            elapsed = time.monotonic() - self._started if self._started else 0.0
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "filtered": self.filtered,
+                "errors": self.errors,
+                "throughput": (self.processed + self.filtered) / elapsed if elapsed else 0.0,
+                "mean_latency_ms": (self.mean_latency or 0.0) * 1000,
+                "utilization": self.busy / (elapsed * self.workers) if elapsed else 0.0,
+                "input": self.input.stats() if self.input is not None else None,
+            }
+
+
+class Pipeline:
+
+    """
+    Chain of stages. Each add_stage() connects the new stage to the previous one with
+    a bounded channel, unless an explicit `input` channel is given (e.g. a queue
+    created in main.py) or the stage is a source. The last stage may push into an
+    external `output` channel; several sources may share the same one.
+
+    """
+
+    def __init__(self, name: str, poll_interval: float = PIPELINE_POLL_INTERVAL):
+        self.name = name
+        self.poll_interval = poll_interval # Longest wait of a worker before checking stop_event
+        self.stages = []
+        self._threads = []
+
+    def add_stage(self, name: str, fn: Callable, workers: int = 1,
+                  input: BoundedQueue | None = None, output: BoundedQueue | None = None,
+                  maxsize: int = PIPELINE_CHANNEL_SIZE, policy: str = DROP_OLDEST,
+                  source: bool = False) -> Stage:
+
+        """
+        Appends a stage. `maxsize` and `policy` configure the channel created between
+        the previous stage and this one. A `source` stage has no input and is never
+        connected to the previous stage.
+
+        """
+
+        if input is None and self.stages and not source:
+            previous = self.stages[-1]
+            if previous.output is None:
+                previous.output = BoundedQueue(f"{self.name}.{name}", maxsize, policy)
+            input = previous.output
+
+        stage = Stage(name, fn, workers, input=input, output=output)
+        self.stages.append(stage)
+        return stage
+
+    def start(self, stop_event: threading.Event) -> None:
+
+        """
+        Starts the workers of every stage.
+
+        """
+
+        for stage in self.stages:
+            self._threads.extend(stage.start(stop_event, self.poll_interval))
+        logger.info(f"Pipeline '{self.name}' started: " +
+                    ", ".join(f"{stage.name} x{stage.workers}" for stage in self.stages))
+
+    def join(self, timeout: float | None = None) -> None:
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run(self, stop_event: threading.Event, report_interval: float | None = None,
+            on_report: Callable[[], None] | None = None) -> None:
+
+        """
+        Starts the pipeline and blocks until stop_event is set and every worker has
+        finished. Logs the stage metrics every `report_interval` seconds if given,
+        and then also calls `on_report` (e.g. to log other metrics of the owner).
+
+        """
+
+        self.start(stop_event)
+        while not stop_event.wait(report_interval or self.poll_interval):
+            if report_interval:
+                logger.debug(f"Pipeline '{self.name}': {self.stats()}")
+                if on_report is not None:
+                    on_report()
+        self.join()
+        logger.info(f"Pipeline '{self.name}' stopped")
+
+    def stats(self) -> dict[str, dict]:
+
+        """
+        Returns the metrics of every stage, by stage name.
+
+        """
+
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def bottleneck(self) -> str | None:
+
+        """
+        Returns the stage with the highest utilization (the one worth more workers).
+
+        """
+
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda stage: stage.stats()["utilization"]).name
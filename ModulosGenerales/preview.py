@@ -0,0 +1,168 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import PREVIEW_FPS
+
+# Preview rendering off the detection path.
+# The detection loop only publishes references to its latest frame and results
+# (no copy, no drawing). A dedicated thread wakes up at most PREVIEW_FPS times per
+# second, annotates the newest state of every camera and shows it; that thread owns
+# every HighGUI call, including waitKey. In headless mode nothing is published and
+# no annotated frame is ever allocated.
+
+logger = logging.getLogger("snow").getChild("preview")
+
+
+def display_available() -> bool:
+
+    """
+    Returns True if there is a display to open windows on. SADA_HEADLESS=1 in the
+    environment (set by the systemd service) forces headless mode even when
+    DISPLAY is set.
+
+    """
+
+    if os.environ.get("SADA_HEADLESS") == "1":
+        return False
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
+
+
+def annotate(frame: np.ndarray, roi: tuple[int, int, int, int], results) -> tuple[np.ndarray, np.ndarray | None]:
+
+    """
+    Draws the ROI on a copy of the full frame and the detections on the ROI crop.
+    Returns (full frame, annotated ROI or None if there are no results).
+
+    """
+
+    full = frame.copy() # The captured frame is shared and read-only
+    x1, y1, x2, y2 = roi
+    cv2.rectangle(full, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    roi_view = results[0].plot() if results else None
+    return full, roi_view
+
+
+def compose(frame: np.ndarray, roi: tuple[int, int, int, int], results) -> np.ndarray:
+
+    """
+    Returns one image with the ROI and its detections drawn on a copy of the full frame.
+
+    """
+
+    full, roi_view = annotate(frame, roi, results)
+    if roi_view is not None:
+        x1, y1, x2, y2 = roi
+        full[y1:y2, x1:x2] = roi_view
+        cv2.rectangle(full, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    return full
+
+
+class PreviewRenderer:
+
+    """
+    Keeps the latest (frame, ROI, results) of every camera and, unless headless,
+    shows them from its own thread at a capped rate. Other viewers (e.g. the MJPEG
+    server) register with add_viewer() so the state is kept while they watch, even
+    in headless mode.
+
+    """
+
+    def __init__(self, fps: float = PREVIEW_FPS, headless: bool | None = None):
+        self.headless = not display_available() if headless is None else headless
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self._latest = {} # Camera name -> (frame, roi, results, version)
+        self._version = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._quit = threading.Event() # ESC pressed in a preview window
+        self._thread = None
+        self._viewers = 0
+        self.rendered = 0
+
+    def start(self) -> None:
+        if self.headless:
+            logger.info("Headless mode: preview disabled")
+            return
+        self._thread = threading.Thread(target=self._run, name="PREVIEW", daemon=True)
+        self._thread.start()
+        logger.info(f"Preview started at up to {1 / self.period if self.period else 'unlimited'} FPS")
+
+    def publish(self, name: str, frame: np.ndarray, roi: tuple[int, int, int, int], results) -> None:
+
+        """
+        Stores references to the newest state of a camera. Never copies or draws.
+
+        """
+
+        if self.headless and not self._viewers:
+            return
+        with self._lock:
+            self._version += 1
+            self._latest[name] = (frame, roi, results, self._version)
+
+    def add_viewer(self) -> None:
+        with self._lock:
+            self._viewers += 1
+
+    def remove_viewer(self) -> None:
+        with self._lock:
+            self._viewers = max(0, self._viewers - 1)
+            if self.headless and not self._viewers:
+                self._latest.clear() # Do not keep frames alive for nobody
+
+    def latest(self) -> dict[str, tuple]:
+
+        """
+        Returns camera name -> (frame, roi, results, version) of the newest published state.
+
+        """
+
+        with self._lock:
+            return dict(self._latest)
+
+    def quit_requested(self) -> bool:
+
+        """
+        Returns True once ESC was pressed in a preview window.
+
+        """
+
+        return self._quit.is_set()
+
+    def _run(self) -> None:
+        shown = {} # Camera name -> last version shown
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            with self._lock:
+                pending = {name: item for name, item in self._latest.items() if shown.get(name) != item[3]}
+
+            for name, (frame, roi, results, version) in pending.items():
+                try:
+                    full, roi_view = annotate(frame, roi, results)
+                    cv2.imshow(f"{name} - Frame completo", full)
+                    if roi_view is not None:
+                        cv2.imshow(f"{name} - ROI", roi_view)
+                    shown[name] = version
+                    self.rendered += 1
+                except Exception as e:
+                    logger.error(f"Error rendering preview of {name}: {e}")
+
+            if cv2.waitKey(1) & 0xFF == 27:
+                self._quit.set()
+            time.sleep(max(0.0, self.period - (time.monotonic() - start)))
+
+        cv2.destroyAllWindows()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(2)
+            self._thread = None
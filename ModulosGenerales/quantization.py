@@ -0,0 +1,241 @@
+import argparse
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from ModulosGenerales.inference_backend import (
+    OnnxRuntimeBackend,
+    cached_model_path,
+    export_model,
+    letterbox,
+    metadata_path,
+)
+
+# INT8 quantized inference mode.
+# The ONNX export of the weights is statically quantized to INT8 with a calibration
+# set of real ROI crops. Before the quantized model may be used, a gate compares it
+# with the FP32 model on held-out crops: if the recall of the FP32 detections at the
+# configured confidence threshold drops more than the allowed tolerance, or the
+# held-out crops hold too few FP32 detections to measure it, the quantized model is
+# refused and the system keeps running FP32.
+
+logger = logging.getLogger("snow").getChild("quantization")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+MIN_REFERENCE_BOXES = 20 # FP32 detections the held-out crops must contain for the gate to judge the recall
+
+
+def load_crops(directory: str | Path, held_out_every: int = 5) -> tuple[list[np.ndarray], list[np.ndarray]]:
+
+    """
+    Loads the ROI crops saved in `directory` and splits them into a calibration set
+    and a held-out set (every `held_out_every`-th image, in name order).
+
+    """
+
+    paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    calibration, held_out = [], []
+    for i, path in enumerate(paths):
+        image = cv2.imread(str(path))
+        if image is None:
+            logger.warning(f"Could not read calibration image {path}")
+            continue
+        (held_out if i % held_out_every == held_out_every - 1 else calibration).append(image)
+    return calibration, held_out
+
+
+class _CalibrationReader:
+
+    """
+    Feeds the calibration crops to onnxruntime's static quantizer, preprocessed
+    exactly like the inference backend does.
+
+    """
+
+    def __init__(self, input_name: str, crops: list[np.ndarray], imgsz: int):
+        self._batches = iter(
+            {input_name: _preprocess(crop, imgsz)} for crop in crops
+        )
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+def _preprocess(image: np.ndarray, imgsz: int) -> np.ndarray:
+    padded, _, _ = letterbox(image, (imgsz, imgsz))
+    return (padded[:, :, ::-1].transpose(2, 0, 1)[None] / 255.0).astype(np.float32)
+
+
+def quantize_model(weights: str | Path, imgsz: int, crops: list[np.ndarray]) -> Path:
+
+    """
+    Builds the INT8 model from the cached FP32 ONNX export and the calibration crops.
+    Returns the path of the quantized model, cached next to the weights.
+
+    """
+
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    fp32_path = export_model(weights, imgsz, "onnx")
+    int8_path = cached_model_path(weights, imgsz, "int8.onnx")
+    input_name = InferenceSession(str(fp32_path), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    logger.info(f"Quantizing {fp32_path.name} to INT8 with {len(crops)} calibration crops")
+    quantize_static(
+        str(fp32_path),
+        str(int8_path),
+        _CalibrationReader(input_name, crops, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    shutil.copy(metadata_path(fp32_path), metadata_path(int8_path))
+    return int8_path
+
+
+def _iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def detection_recall(reference, candidate, images: list[np.ndarray], threshold: float, iou: float = 0.5) -> tuple[float, int]:
+
+    """
+    Recall of the `candidate` model against the detections of the `reference` model:
+    the fraction of reference boxes above `threshold` that the candidate also finds
+    above `threshold` (same class, IoU >= `iou`). Returns (recall, reference boxes).
+
+    """
+
+    total = matched = 0
+    for image in images:
+        ref = reference(image)[0].boxes
+        cand = candidate(image)[0].boxes
+        ref_keep = ref.conf >= threshold
+        cand_keep = cand.conf >= threshold
+        ref_boxes, ref_cls = ref.xyxy[ref_keep], ref.cls[ref_keep]
+        cand_boxes, cand_cls = cand.xyxy[cand_keep], cand.cls[cand_keep]
+        used = np.zeros(len(cand_boxes), dtype=bool)
+
+        total += len(ref_boxes)
+        for box, cls in zip(ref_boxes, ref_cls):
+            if not len(cand_boxes):
+                break
+            overlaps = _iou(box, cand_boxes)
+            overlaps[(cand_cls != cls) | used] = 0
+            best = int(overlaps.argmax())
+            if overlaps[best] >= iou:
+                used[best] = True
+                matched += 1
+
+    return (matched / total if total else 1.0), total
+
+
+def _gate_path(int8_path: Path) -> Path:
+    return int8_path.with_name(f"{int8_path.stem}.gate.json")
+
+
+def run_gate(weights: str | Path, imgsz: int, int8_path: Path, held_out: list[np.ndarray],
+             threshold: float, tolerance: float, min_boxes: int = MIN_REFERENCE_BOXES) -> dict:
+
+    """
+    Compares the INT8 model with the FP32 model on the held-out crops and stores the
+    verdict next to the quantized model. The gate passes when the FP32 model finds at
+    least `min_boxes` boxes on them and the recall drop is within `tolerance`.
+
+    """
+
+    fp32 = OnnxRuntimeBackend(export_model(weights, imgsz, "onnx"), imgsz)
+    int8 = OnnxRuntimeBackend(int8_path, imgsz)
+    recall, reference_boxes = detection_recall(fp32, int8, held_out, threshold)
+
+    report = {
+        "threshold": threshold,
+        "tolerance": tolerance,
+        "recall": recall,
+        "reference_boxes": reference_boxes,
+        "min_boxes": min_boxes,
+        "held_out_images": len(held_out),
+        "passed": reference_boxes >= min_boxes and 1.0 - recall <= tolerance,
+    }
+    _gate_path(int8_path).write_text(json.dumps(report, indent=4), encoding="utf-8")
+    if reference_boxes < min_boxes:
+        logger.warning(f"INT8 gate refused: not enough reference boxes ({reference_boxes} < {min_boxes}) at threshold {threshold}")
+    else:
+        logger.info(f"INT8 gate: recall {recall:.3f} on {reference_boxes} boxes -> {'passed' if report['passed'] else 'refused'}")
+    return report
+
+
+def load_quantized_backend(weights: str | Path, imgsz: int, threshold: float, tolerance: float,
+                           calibration_dir: str | Path | None = None,
+                           min_boxes: int = MIN_REFERENCE_BOXES) -> OnnxRuntimeBackend | None:
+
+    """
+    Returns the INT8 backend if it exists (or can be built from `calibration_dir`) and
+    its gate passed for this threshold and tolerance. Returns None otherwise, and
+    the caller should keep the FP32 backend.
+
+    """
+
+    int8_path = cached_model_path(weights, imgsz, "int8.onnx")
+    gate_path = _gate_path(int8_path)
+
+    report = None
+    if int8_path.exists() and gate_path.exists():
+        report = json.loads(gate_path.read_text(encoding="utf-8"))
+        if (report["threshold"], report["tolerance"], report.get("min_boxes")) != (threshold, tolerance, min_boxes):
+            report = None # Gate was run for another configuration
+
+    if report is None:
+        if calibration_dir is None or not Path(calibration_dir).is_dir():
+            logger.warning("INT8 mode requested but there is no calibration set, using FP32")
+            return None
+        calibration, held_out = load_crops(calibration_dir)
+        if not calibration or not held_out:
+            logger.warning(f"Not enough crops in {calibration_dir} to build and validate the INT8 model")
+            return None
+        if not int8_path.exists():
+            quantize_model(weights, imgsz, calibration)
+        report = run_gate(weights, imgsz, int8_path, held_out, threshold, tolerance, min_boxes)
+
+    if not report["passed"]:
+        if report["reference_boxes"] < min_boxes:
+            logger.warning(f"INT8 model refused: not enough reference boxes ({report['reference_boxes']} < {min_boxes})")
+        else:
+            logger.warning(f"INT8 model refused: recall {report['recall']:.3f} exceeds the tolerance of {tolerance}")
+        return None
+
+    backend = OnnxRuntimeBackend(int8_path, imgsz)
+    backend.name = "onnxruntime-int8"
+    backend.warmup()
+    return backend
+
+
+# Builds the INT8 model and runs the gate offline, e.g.:
+#   python -m ModulosGenerales.quantization best.pt calibracion --threshold 0.83
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and validate the INT8 model")
+    parser.add_argument("weights")
+    parser.add_argument("calibration_dir")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--threshold", type=float, default=0.83)
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--min-boxes", type=int, default=MIN_REFERENCE_BOXES)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    calibration, held_out = load_crops(args.calibration_dir)
+    int8_path = quantize_model(args.weights, args.imgsz, calibration)
+    print(json.dumps(run_gate(args.weights, args.imgsz, int8_path, held_out, args.threshold, args.tolerance, args.min_boxes), indent=4))
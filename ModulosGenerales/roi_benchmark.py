@@ -0,0 +1,92 @@
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ModulosGenerales.camera_registry import CameraRegistry
+from ModulosGenerales.inference_backend import load_backend, roi_input_shape
+from ModulosGenerales.quantization import detection_recall, load_crops
+
+# Square vs ROI-shaped input benchmark.
+# Every ROI is cut from the same frames and run through the backend twice: once
+# letterboxed into imgsz x imgsz and once at its rectangular input size. The report
+# gives, per ROI, both latencies, the time saved and the recall of the rectangular
+# detections against the square ones, so the saving is only taken at equal recall.
+
+logger = logging.getLogger("snow").getChild("roi_benchmark")
+
+
+def _median_latency(backend, crops: list[np.ndarray], imgsz, repeats: int) -> float:
+    backend(crops[0], imgsz=imgsz) # Warm-up for this input shape
+    timings = []
+    for _ in range(repeats):
+        for crop in crops:
+            start = time.perf_counter()
+            backend(crop, imgsz=imgsz)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def benchmark_rois(backend, frames: list[np.ndarray], rois: dict[str, tuple[int, int, int, int]],
+                   imgsz: int, threshold: float, repeats: int = 5) -> dict:
+
+    """
+    Runs the benchmark for every ROI (name -> x1, y1, x2, y2) over `frames` and
+    returns name -> report. Latencies are the median per crop, in milliseconds.
+
+    """
+
+    report = {}
+    for name, (x1, y1, x2, y2) in rois.items():
+        crops = [frame[y1:y2, x1:x2] for frame in frames]
+        shape = roi_input_shape(x2 - x1, y2 - y1, imgsz)
+        square = _median_latency(backend, crops, imgsz, repeats)
+        rect = _median_latency(backend, crops, shape, repeats)
+        recall, boxes = detection_recall(
+            lambda crop: backend(crop, imgsz=imgsz),
+            lambda crop: backend(crop, imgsz=shape),
+            crops,
+            threshold,
+        )
+        report[name] = {
+            "roi_size": [x2 - x1, y2 - y1],
+            "square_input": [imgsz, imgsz],
+            "rect_input": list(shape),
+            "square_ms": square * 1000,
+            "rect_ms": rect * 1000,
+            "saved_ms": (square - rect) * 1000,
+            "saved_pct": 100 * (square - rect) / square if square else 0.0,
+            "recall": recall,
+            "reference_boxes": boxes,
+        }
+        logger.info(
+            f"{name}: {square * 1000:.1f} ms -> {rect * 1000:.1f} ms at {shape[1]}x{shape[0]} "
+            f"(recall {recall:.3f} on {boxes} boxes)"
+        )
+    return report
+
+
+# Compares both input sizes on saved full frames, e.g.:
+#   python -m ModulosGenerales.roi_benchmark best.pt calibracion --config config/config_sistema.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of square vs ROI-shaped inference sizes")
+    parser.add_argument("weights")
+    parser.add_argument("frames_dir")
+    parser.add_argument("--config", default="config/config_sistema.json")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--threshold", type=float, default=0.83)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    rois = CameraRegistry.from_config(json.loads(Path(args.config).read_text(encoding="utf-8"))).rois
+    calibration, held_out = load_crops(args.frames_dir)
+    frames = calibration + held_out
+    if not frames:
+        raise SystemExit(f"No frames found in {args.frames_dir}")
+    backend = load_backend(args.weights, imgsz=args.imgsz, preferred=args.backend)
+    print(json.dumps(benchmark_rois(backend, frames, rois, args.imgsz, args.threshold, args.repeats), indent=4))
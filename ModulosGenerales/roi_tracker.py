@@ -0,0 +1,183 @@
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+from config import (
+    TRACK_KEYFRAME_INTERVAL,
+    TRACK_MAX_POINTS,
+    TRACK_MIN_POINTS,
+    TRACK_MIN_QUALITY,
+    TRACK_MOTION_PIXELS,
+    TRACK_MOTION_SPIKE,
+)
+from ModulosGenerales.inference_backend import Boxes, Detections
+
+# Detect-then-track between detector keyframes.
+# After a detection, corner features are picked on the whole ROI and followed with
+# pyramidal Lucas-Kanade optical flow. Each box moves by the median displacement of
+# the features inside it and its confidence is scaled by the fraction of those
+# features still tracked. The detector runs again on the next keyframe, when a box
+# loses too many features, or when the background (features outside every box)
+# starts moving, which usually means someone new entered the ROI.
+
+logger = logging.getLogger("snow").getChild("roi_tracker")
+
+
+class _Track:
+
+    def __init__(self, gray: np.ndarray, detections: Detections, max_points: int):
+        self.gray = gray
+        self.names = detections.names
+        self.xyxy = detections.boxes.xyxy.copy()
+        self.conf = detections.boxes.conf.copy()
+        self.cls = detections.boxes.cls.copy()
+        self.frames = 0 # Frames tracked since the keyframe
+        self.quality = np.ones(len(self.conf), dtype=np.float32)
+
+        points = cv2.goodFeaturesToTrack(gray, max_points, 0.01, 5)
+        self.points = np.empty((0, 1, 2), dtype=np.float32) if points is None else points
+        self.owner = self._assign(self.points.reshape(-1, 2)) # Box index per point, -1 = background
+        self.initial = np.bincount(self.owner[self.owner >= 0], minlength=len(self.conf))
+
+    def _assign(self, points: np.ndarray) -> np.ndarray:
+        owner = np.full(len(points), -1, dtype=np.int32)
+        for i, (x1, y1, x2, y2) in enumerate(self.xyxy):
+            inside = (points[:, 0] >= x1) & (points[:, 0] <= x2) & (points[:, 1] >= y1) & (points[:, 1] <= y2)
+            owner[inside & (owner < 0)] = i
+        return owner
+
+
+class RoiTracker:
+
+    """
+    Propagates the last detections of every ROI between detector keyframes.
+
+    Usage per frame: if needs_detection() run the detector and call reset() with its
+    result, otherwise call track() and use its result as if it came from the detector.
+
+    """
+
+    def __init__(self,
+                 keyframe_interval: int = TRACK_KEYFRAME_INTERVAL,
+                 min_quality: float = TRACK_MIN_QUALITY,
+                 motion_spike: float = TRACK_MOTION_SPIKE,
+                 motion_pixels: float = TRACK_MOTION_PIXELS,
+                 max_points: int = TRACK_MAX_POINTS,
+                 min_points: int = TRACK_MIN_POINTS):
+        self.keyframe_interval = keyframe_interval
+        self.min_quality = min_quality
+        self.motion_spike = motion_spike
+        self.motion_pixels = motion_pixels
+        self.max_points = max_points
+        self.min_points = min_points
+        self._tracks = {}
+        self._stale = set() # ROIs whose last track() asked for a new detection
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def needs_detection(self, roi_name: str, crop: np.ndarray) -> bool:
+
+        """
+        Returns True if the detector must run on this crop: no track yet, keyframe
+        reached, the ROI changed size or the last tracking step lost confidence.
+
+        """
+
+        with self._lock:
+            track = self._tracks.get(roi_name)
+            return (
+                track is None
+                or roi_name in self._stale
+                or track.frames + 1 >= self.keyframe_interval
+                or track.gray.shape != crop.shape[:2]
+            )
+
+    def reset(self, roi_name: str, crop: np.ndarray, detections: Detections) -> None:
+
+        """
+        Starts tracking the boxes the detector just found on `crop`.
+
+        """
+
+        track = _Track(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), detections, self.max_points)
+        with self._lock:
+            self._tracks[roi_name] = track
+            self._stale.discard(roi_name)
+            self._count(roi_name, "detected")
+
+    def track(self, roi_name: str, crop: np.ndarray) -> list[Detections] | None:
+
+        """
+        Moves the boxes of `roi_name` to `crop` and returns them in the detector
+        result format. Returns None if there is nothing to track from.
+
+        """
+
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        with self._lock:
+            track = self._tracks.get(roi_name)
+            if track is None:
+                return None
+
+            if len(track.points):
+                moved, status, _ = cv2.calcOpticalFlowPyrLK(track.gray, gray, track.points, None)
+                ok = status.reshape(-1).astype(bool)
+                shift = (moved - track.points).reshape(-1, 2)
+            else:
+                ok = np.zeros(0, dtype=bool)
+                shift = np.zeros((0, 2), dtype=np.float32)
+
+            # Boxes follow the median motion of their own features
+            for i in range(len(track.conf)):
+                mine = ok & (track.owner == i)
+                kept = int(np.count_nonzero(mine))
+                if kept:
+                    dx, dy = np.median(shift[mine], axis=0)
+                    track.xyxy[i] += (dx, dy, dx, dy)
+                track.quality[i] = kept / track.initial[i] if track.initial[i] >= self.min_points else 0.0
+
+            # Background features that move mean something new entered the ROI
+            background = ok & (track.owner < 0)
+            moving = np.linalg.norm(shift[background], axis=1) > self.motion_pixels
+            spike = bool(background.any()) and moving.mean() > self.motion_spike
+
+            h, w = gray.shape
+            np.clip(track.xyxy, 0, (w, h, w, h), out=track.xyxy)
+            track.points = moved[ok].reshape(-1, 1, 2) if len(track.points) else track.points
+            track.owner = track.owner[ok]
+            track.gray = gray
+            track.frames += 1
+
+            if spike or (len(track.quality) and track.quality.min() < self.min_quality):
+                self._stale.add(roi_name)
+            self._count(roi_name, "tracked")
+
+            boxes = Boxes(track.xyxy.copy(), track.conf * track.quality, track.cls.copy())
+            return [Detections(crop, boxes, track.names)]
+
+    def drop(self, roi_name: str) -> None:
+
+        """
+        Forgets the track of a ROI (e.g. its crop was gated out and the boxes are stale).
+
+        """
+
+        with self._lock:
+            self._tracks.pop(roi_name, None)
+            self._stale.discard(roi_name)
+
+    def _count(self, roi_name: str, key: str) -> None:
+        counts = self._counts.setdefault(roi_name, {"detected": 0, "tracked": 0})
+        counts[key] += 1
+
+    def stats(self) -> dict[str, dict]:
+
+        """
+        Returns, per ROI, how many frames went through the detector and how many were tracked.
+
+        """
+
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
@@ -0,0 +1,47 @@
+import logging
+import queue
+
+import pygame
+
+from config import PIPELINE_POLL_INTERVAL
+from ModulosGenerales.audio_service import AudioService, SoundBank, PRIORITY_NORMAL
+from ModulosGenerales.camera_registry import load_system_config
+
+# Audio output of the staged pipeline.
+# Every sound of the "sonidos" key of config_sistema.json (ROI name or "emergencia"
+# -> file) is decoded into memory once at startup; the cues the orchestrator puts
+# in cola_audio are handed to an AudioService, which plays them from its own thread
+# by priority (preempting less urgent clips and dropping cues that went stale), so
+# this loop never waits for a sound to end.
+
+logger = logging.getLogger("snow").getChild("audio_module")
+
+
+def run(stop_event, cola_audio):
+
+    """
+    Entry point of the AUDIO thread: plays the queued cues until stop_event is set.
+
+    """
+
+    logger.info("Module 'audio_module' started")
+
+    try:
+        pygame.mixer.init()
+        service = AudioService(SoundBank(load_system_config().get("sonidos", {})))
+    except Exception as e:
+        logger.error(f"Audio device could not be initialized: {e}")
+        return
+    service.start()
+
+    while not stop_event.is_set():
+        try:
+            cue = cola_audio.get(timeout=PIPELINE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        service.play(cue["sonido"], cue.get("prioridad", PRIORITY_NORMAL), created=cue.get("creado"))
+
+    logger.info(f"Audio service: {service.stats()}")
+    service.stop()
+    pygame.mixer.quit()
+    logger.info("Module 'audio_module' stopped")
@@ -0,0 +1,66 @@
+import logging
+
+from config import PIPELINE_POLL_INTERVAL, PIPELINE_REPORT_INTERVAL
+from ModulosGenerales.camera_health import CameraHealthMonitor
+from ModulosGenerales.camera_lanes import DeviceFeed
+from ModulosGenerales.camera_registry import CameraRegistry, load_system_config
+from ModulosGenerales.pipeline import Pipeline
+
+# Capture stage of the staged pipeline.
+# Every physical device gets its own capture stage: a reader thread keeps only its
+# newest frame and a worker hands out one read-only view per ROI of that device, so
+# devices never wait for each other. A device that is down is reopened with backoff
+# by its own stage while the others keep their frame rate. Each tick (ROI name ->
+# RoiView) goes into cola_frames for the orchestrator. Camera health metrics are
+# updated here, on the frames already captured.
+
+logger = logging.getLogger("snow").getChild("cameras_module")
+
+
+def capture_stage(feed: DeviceFeed, health: CameraHealthMonitor):
+
+    """
+    Returns the source function of the capture stage of one device.
+
+    """
+
+    def stage():
+        views = feed.tick(timeout=PIPELINE_POLL_INTERVAL)
+        if not views:
+            return None
+        health.update(feed.name, next(iter(views.values())).frame)
+        return views
+
+    return stage
+
+
+def run(stop_event, cola_frames):
+
+    """
+    Entry point of the CAMERAS thread: runs the capture stages until stop_event is set.
+
+    """
+
+    logger.info("Module 'cameras_module' started")
+
+    registry = CameraRegistry.from_config(load_system_config())
+    health = CameraHealthMonitor()
+    pipeline = Pipeline("cameras")
+    feeds = []
+    for device, spec in registry.devices.items():
+        feed = DeviceFeed(
+            device,
+            registry.rois_of(device),
+            lambda device=device: registry.open(device),
+            reference_size=(spec.width, spec.height)
+        )
+        feeds.append(feed)
+        pipeline.add_stage(f"capture.{device}", capture_stage(feed, health), output=cola_frames, source=True)
+
+    try:
+        pipeline.run(stop_event, report_interval=PIPELINE_REPORT_INTERVAL)
+    finally:
+        for feed in feeds:
+            feed.release()
+
+    logger.info("Module 'cameras_module' stopped")
@@ -0,0 +1,140 @@
+import logging
+
+from config import (
+    ALARM_COOLDOWN,
+    CONFIDENCE_THRESHOLD,
+    INFERENCE_WORKERS,
+    MODEL_IMGSZ,
+    MODEL_WEIGHTS,
+    PIPELINE_REPORT_INTERVAL,
+)
+from ModulosGenerales.alarm_correlator import RuleCorrelator
+from ModulosGenerales.audio_service import PRIORITY_ALARM
+from ModulosGenerales.batch_inference import BatchDetector
+from ModulosGenerales.camera_registry import CameraRegistry, load_system_config
+from ModulosGenerales.detection_filter import DetectionFilter
+from ModulosGenerales.event_store import EventStore
+from ModulosGenerales.inference_backend import load_backend
+from ModulosGenerales.modulo_logging import log_stats
+from ModulosGenerales.motion_gate import MotionGate
+from ModulosGenerales.pipeline import Pipeline
+
+# Orchestrator of the staged pipeline.
+# Takes every capture tick from cola_frames and runs it through
+#   preprocess -> infer -> postprocess -> decide -> actuate
+# connected by bounded channels. Every tick holds the ROIs of one device. The alarm
+# goes off when every ROI of a correlation rule detects within the rule window;
+# a cue naming the ROI that detected first (the direction the person is moving) is
+# queued in cola_audio. Every detection and alarm is recorded in the event store.
+
+logger = logging.getLogger("snow").getChild("orquestador")
+
+
+def build_pipeline(cola_frames, cola_audio, events: EventStore) -> Pipeline:
+
+    """
+    Loads the model and declares the stages between cola_frames and cola_audio.
+
+    """
+
+    detector = BatchDetector(load_backend(MODEL_WEIGHTS, imgsz=MODEL_IMGSZ), imgsz=MODEL_IMGSZ, rect=True)
+    gate = MotionGate()
+    detection_filter = DetectionFilter(CONFIDENCE_THRESHOLD)
+    system_config = load_system_config()
+    registry = CameraRegistry.from_config(system_config)
+    correlator = RuleCorrelator(registry.rule_windows(), cooldown=system_config.get("enfriamiento_alarma", ALARM_COOLDOWN))
+
+    def preprocess(views):
+        # ROI crops are views of the shared frame; static ROIs do not reach the detector
+        crops = {name: view.crop for name, view in views.items() if gate.should_run(name, view.crop)}
+        return (crops, {name: view.captured.timestamp for name, view in views.items()}) if crops else None
+
+    def infer(item):
+        crops, timestamps = item
+        return detector.detect(crops), timestamps
+
+    def postprocess(item):
+        results, timestamps = item
+        events = {}
+        for name, result in results.items():
+            event = detection_filter.select(name, result[0].boxes) if result else None
+            if event is not None:
+                gate.keep_open(name) # A person standing still must keep being detected
+                events[name] = (event, timestamps[name])
+        return events or None
+
+    def decide(detections):
+        alarm = None
+        for event, timestamp in detections.values():
+            # Every frame goes to DEBUG; INFO only when the detection opens a window in its camera
+            if correlator.is_active(event.camera):
+                logger.debug(f"Detection with {event.conf * 100:.2f}% confidence in {event.camera}")
+            else:
+                logger.info(f"Detection window opened in {event.camera} ({event.conf * 100:.2f}% confidence)")
+            events.record_detection(event, timestamp)
+            alarm = correlator.detection(event.camera, timestamp) or alarm
+        return alarm
+
+    def actuate(alarm):
+        alarm_id = events.record_alarm(alarm)
+        logger.warning(f"🚨 Alarm {alarm_id} '{alarm.rule}' raised (first detection in {alarm.camera}, decided in {alarm.latency * 1000:.2f} ms)")
+        return {"camara": alarm.camera, "sonido": alarm.camera, "prioridad": PRIORITY_ALARM, "creado": alarm.timestamp}
+
+    pipeline = Pipeline("orquestador")
+    pipeline.add_stage("preprocess", preprocess, input=cola_frames)
+    pipeline.add_stage("infer", infer, workers=INFERENCE_WORKERS)
+    pipeline.add_stage("postprocess", postprocess)
+    pipeline.add_stage("decide", decide) # Stateful: always a single worker
+    pipeline.add_stage("actuate", actuate, output=cola_audio)
+    return pipeline
+
+
+class LoggingReport:
+
+    """
+    Periodic report of the asynchronous logging: a warning when records were
+    dropped since the previous report, a debug line otherwise.
+
+    """
+
+    def __init__(self):
+        self.dropped = 0
+
+    def __call__(self) -> None:
+        stats = log_stats()
+        if not stats:
+            return # Synchronous logging: nothing is queued or dropped
+        if stats["dropped"] > self.dropped:
+            logger.warning(f"{stats['dropped'] - self.dropped} log records dropped since the last report: {stats}")
+        else:
+            logger.debug(f"Logging: {stats}")
+        self.dropped = stats["dropped"]
+
+
+def run(stop_event, cola_frames, cola_audio):
+
+    """
+    Entry point of the orquestador thread: runs the pipeline until stop_event is set.
+
+    """
+
+    logger.info("Module 'orquestador' started")
+
+    events = None
+    try:
+        events = EventStore()
+        pipeline = build_pipeline(cola_frames, cola_audio, events)
+    except Exception as e:
+        logger.critical(f"Could not build the detection pipeline: {e}")
+        if events is not None:
+            events.stop()
+        stop_event.set()
+        return
+
+    events.start()
+    pipeline.run(stop_event, report_interval=PIPELINE_REPORT_INTERVAL, on_report=LoggingReport())
+    logger.info(f"Slowest stage: {pipeline.bottleneck()}")
+    events.stop() # Writes the pending events
+    logger.info(f"Event store: {events.stats()}")
+
+    logger.info("Module 'orquestador' stopped")
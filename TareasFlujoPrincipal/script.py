@@ -1,14 +1,20 @@
 import time
-import threading
-from ultralytics import YOLO
 import os
+import json
 
 import pygame
 import logging
 
 # Librerias necesarias para el manejo de las camaras
 import cv2
-import numpy as np
+from config import CONFIDENCE_THRESHOLD
+from ModulosGenerales.alarm_correlator import RuleCorrelator
+from ModulosGenerales.audio_service import AudioService, SoundBank, PRIORITY_ALARM
+from ModulosGenerales.camera_health import CameraHealthMonitor
+from ModulosGenerales.camera_registry import CameraRegistry
+from ModulosGenerales.detection_filter import DetectionFilter
+from ModulosGenerales.inference_backend import load_backend
+from ModulosGenerales.frame_capture import CaptureSubsystem, FrameMultiplexer
 
 
 # Configuracion del loggin
@@ -25,119 +31,135 @@ pygame.mixer.init()
 # Importacion del modelo YOLO
 direccion_script = os.path.dirname(os.path.abspath(__file__))
 camino_modelo = os.path.join(direccion_script, "best.pt")
-modelo = YOLO(camino_modelo)
+modelo = load_backend(camino_modelo)        # Usa el runtime mas rapido disponible (OpenVINO / ONNX Runtime / PyTorch)
 #modelo = YOLO('best.pt')  # modelo YOLO
 
 
-# Zonas de deteccion en las camaras
-rois = {"camara1": (400, 0, 640, 480),"camara2": (0, 0, 300, 480),}     # Almacena rois    --->    roi_x1, roi_y1, roi_x2, roi_y2
+# Camaras, zonas de deteccion (ROIs) y reglas de correlacion. Salen de config_sistema.json; sin archivo se usan
+# las dos ROIs de siempre sobre la webcam predeterminada
+try:
+    with open("config/config_sistema.json", "r") as f:
+        configuracion = json.load(f)
+except FileNotFoundError:
+    configuracion = {}
+registro = CameraRegistry.from_config(configuracion)
+rois = registro.rois     # Almacena rois    --->    roi_x1, roi_y1, roi_x2, roi_y2
+sound_path = configuracion.get("sonidos", {"camara1": "sonido_prueva0.mp3", "camara2": "sonido_prueva2.mp3"})     # almacena la ruta de sonido de cada ROI
 
 
-#  Variables para comprobar si nuestro sujeto se direge o se va del punto meta
-# Almacena el tiempo de la deteccion 
-ultimo_evento = {"camara1": None, "camara2": None} 
-# Almacena si se detecto algo
-detecto = {"camara1": False, "camara2": False}            
-sound_path = {"camara1": "sonido_prueva0.mp3", "camara2": "sonido_prueva2.mp3"}     # almacena la ruta de sonido        # sound_path = "sonido_prueva2.mp3"
+# Funcion para abrir una camara. Si no se puede abrir se deja cerrada (verificar_camaras la reporta)
+# en lugar de detener el script: las demas camaras siguen funcionando
+def abrir_camara(dispositivo):
+    try:
+        return registro.open(dispositivo)
+    except RuntimeError as e:
+        logging.error(e)
+        return cv2.VideoCapture()
 
 
-# Declaracion de variables. Camaras a utilizar
-camara1 = cv2.VideoCapture(0)                 # (0 = webcam predeterminada)                       
-camara2 = camara1                                # Por el momento, se comparte la misma camara para hacer pruebas     'people.mp4'
-# cap1 = cv2.VideoCapture('traffic.mp4')   # Abre la cámara (0 = webcam predeterminada)
+# Declaracion de variables. Un VideoCapture por dispositivo (0 = webcam predeterminada)
+camaras = {dispositivo: abrir_camara(dispositivo) for dispositivo in registro.devices}
+
+# Un hilo lector por dispositivo publica solo el frame mas reciente. Las ROIs del mismo dispositivo comparten el lector
+captura = CaptureSubsystem()
+for dispositivo, camara in camaras.items():
+    captura.add_camera(dispositivo, camara)
+    for cam_name in registro.devices[dispositivo].rois:
+        captura.add_camera(cam_name, camara)
+# Lee cada dispositivo una vez por ciclo y entrega vistas de solo lectura a cada ROI
+multiplexor = FrameMultiplexer(captura, rois)
 
 
 # Variables para las camaras
 
+# Camaras con problemas (cerradas u obstruidas) en el ultimo chequeo; sus ROIs no se procesan
+camaras_con_problemas = set()
+
 # Almacena el tiempo donde se hizo el ultimo chequeo de las camaras
 ultimo_chequeo = time.time() 
 # Tiempo en segundos de cada cuando se debe de hacer un chequeo de las camaras
 intervalo_chequeo = 30  
+# Metricas de salud de las camaras (oscuridad, desenfoque, lente tapada, imagen congelada).
+# Se alimentan con los frames que ya captura el bucle principal. Los umbrales estan en config.py
+salud_camaras = CameraHealthMonitor()
+
+
+# Umbral de confianza aplicado a todas las cajas de un frame a la vez; deja como maximo una deteccion por camara y frame
+filtro_detecciones = DetectionFilter(
+    configuracion.get("umbral_confianza", CONFIDENCE_THRESHOLD),
+    class_thresholds=configuracion.get("umbrales_clase"),
+    camera_thresholds=configuracion.get("umbrales_camara")
+)
+
+
+# Sonidos precargados en memoria; se reproducen en su propio hilo sin bloquear la deteccion
+servicio_audio = AudioService(SoundBank(sound_path))
+servicio_audio.start()
+
+def alarma_disparada(alarma):       # Suena la ROI que detecto primero (direccion de la persona)
+    logging.info(f"🚨 Alarma '{alarma.rule}' disparada (primera deteccion en {alarma.camera}, ultima en {alarma.last_camera})")
+    servicio_audio.play(alarma.camera, PRIORITY_ALARM, created=alarma.timestamp)
+
+# Cada regla dice que ROIs deben detectar juntas dentro de su ventana de tiempo
+correlador = RuleCorrelator(registro.rule_windows(), cooldown=configuracion.get("enfriamiento_alarma", 3), on_alarm=alarma_disparada)
 
 # Funcion para comprobar si hay obstrucciones
-def obstruccion(cam):
+def obstruccion(cam_name):
     
-    #Captura de 2 frames en distintos periodos de tiempo
-    ret1, frame1 = cam.read()
-    if not ret1:
-        return True
-    time.sleep(1)
-    ret2, frame2 = cam.read()
-    if not ret2:
+    #Consulta el estado de las metricas de salud (sin capturas extra ni pausas)
+    estado = salud_camaras.state(cam_name)
+    if estado is None:
         return True
 
-    #Calculo del cambio de valores (pixeles) entre cada frame
-    diferencia = cv2.absdiff(frame1, frame2)
-    total_cambio = np.sum(diferencia)
-
-    #Print para buscar el THRESHOLD perfecto segun las condiciones de nuestro proyecto. 
-    # Este print es temporal Y SERA ELIMINADO
-    print(f"Cambio en camara: {total_cambio}")
+    #Sirve para ajustar los umbrales de config.py segun las condiciones de nuestro proyecto
+    logging.debug(f"Salud de {cam_name}: {estado}")
 
     #Comprobacion de obstruccion
-    return 5000 > total_cambio
+    return estado['obstructed']
 
 
 
-#Funcion para revisar si hay problemas en las camaras
-def verificar_camaras(cam1,cam2):
+#Funcion para revisar si hay problemas en las camaras. Devuelve las camaras con problemas (cerradas u obstruidas);
+#las demas siguen detectando
+def verificar_camaras(camaras):
     
-    #Comprobacion de obstruccion en ambas camaras
-    obstruccion_cam1 = obstruccion(cam1)
-    obstruccion_cam2 = obstruccion(cam2)
-
-    #Error al abrir ambas camaras
-    if not cam1.isOpened() and not cam2.isOpened():
+    #Error al abrir alguna camara
+    cerradas = {dispositivo for dispositivo, camara in camaras.items() if not camara.isOpened()}
+    if len(cerradas) == len(camaras):
         logging.error("Ninguna de las camaras se pudo abrir")
-        return False
-    #Error al abrir la camara 1
-    elif not cam1.isOpened():
-        logging.warning("Camara 1 no se pudo abrir")
-        return False
-    #Error al abrir la camara 2
-    elif not cam2.isOpened():
-        logging.warning("Camara 2 no se pudo abrir")
-        return False
-    #Error de obstrucion en ambas camaras
-    elif obstruccion_cam1 and obstruccion_cam2:
-        logging.critical("Ambas camaras obstruidas")
-        return False
-    #Error de obstrucion en camara 1
-    elif obstruccion_cam1:
-        logging.error("Camara 1 obstruida")
-        return False  
-    #Error de obstrucion en camara 2
-    elif obstruccion_cam2:
-        logging.error("Camara 2 obstruida")
-        return False
-    else:
-        return True 
+    elif cerradas:
+        logging.warning(f"Camaras que no se pudieron abrir: {sorted(cerradas)}")
+
+    #Comprobacion de obstruccion en las camaras abiertas
+    obstruidas = {dispositivo for dispositivo in camaras if dispositivo not in cerradas and obstruccion(dispositivo)}
+    if obstruidas and len(obstruidas) == len(camaras):
+        logging.critical("Todas las camaras obstruidas")
+    elif obstruidas:
+        logging.error(f"Camaras obstruidas: {sorted(obstruidas)}")
+
+    return cerradas | obstruidas
     
 
 
 # Funcion para capturar frames. Para cada camara
-def toma_frame(cam1,cam2):      
-
-    # Devuelve 2 variables, ret1/2 es un valor booleano. frame1/2 almacenara el frame corresponiente a su camara
-    ret1, frame1 = cam1.read()
-    ret2, frame2 = cam2.read()
-
-    #Diccionario para almacenar los frames
-    if ret1 and ret2:
-        diccionario_frames = {         
-            "camara1": frame1,
-            "camara2": frame2
-        }
-        #Almacenamiento de frames en la cola
-        return diccionario_frames
-    # Para evitar que el codigo se rompa, regresamos un valor nulo
-    else:
-        return None
+def toma_frame(multiplexor):      
+
+    # Toma el frame mas reciente de cada dispositivo. Las ROIs de la misma camara comparten el frame (sin copias)
+    vistas = multiplexor.tick()
+
+    # Actualiza las metricas de salud de las camaras con los frames ya capturados (una vez por dispositivo)
+    for vista in {id(v.frame): v for v in vistas.values()}.values():
+        salud_camaras.update(vista.captured.source, vista.frame)
+
+    #Diccionario con los frames de las ROIs cuya camara entrego un frame nuevo. Una camara caida no frena a las demas:
+    #simplemente no aparece en el diccionario (vacio si ninguna entrego frame)
+    return {cam_name: vista.frame for cam_name, vista in vistas.items()}
    
 
 
 
 def dibujo (cam_name, cam_frame, results, roi_x1, roi_y1, roi_x2, roi_y2):      # dibuja la pantalla principal y la roi
+    cam_frame = cam_frame.copy()        # El frame es compartido y de solo lectura, solo se copia para dibujar
     cv2.rectangle(cam_frame, (roi_x1, roi_y1), (roi_x2, roi_y2), (0, 255, 0), 2)
 
     annotated_frame = results[0].plot()             # Dibuja las predicciones sobre el frame
@@ -156,68 +178,44 @@ def detecion_roi (cap, roi_x1, roi_y1, roi_x2, roi_y2):
 
 
 
-lock = threading.Lock()                                 # evitar condiciones de carrera
-def protocolo_detecion(cam_name, ventana_tiempo):       # Cordina las camaras y detecciones con audio
-    global ultimo_evento
-    global detecto
-    contador =0
-
-    otra = "camara2" if cam_name == "camara1" else "camara1"    # identifica la otra camara 
-
-    detecto[cam_name] = True
-
-    with lock:                                      # Sirve para que solo un hilo a la vez pueda modificar ultimo_evento
-        
-        while detecto[cam_name] == True and contador < ventana_tiempo:
-            time.sleep(1)
-            contador += 1
-
-            if detecto[cam_name] == True and detecto[otra] == True: 
-                logging.info(f"🚨 Alarma disparada con {contador}s (ultima deteccion en {cam_name})")
-                pygame.mixer.music.load(sound_path[cam_name])
-                pygame.mixer.music.play()
-
-                while pygame.mixer.music.get_busy():
-                    pygame.time.Clock().tick(10)
-                detecto[cam_name], detecto[otra] = False, False
-                break
-
-        detecto[cam_name], detecto[otra] = False, False
-    
-    
-
 ##############################################################################################################################################
 
 while True:
 
     if time.time() - ultimo_chequeo > intervalo_chequeo:
-        if not verificar_camaras(camara1, camara2):
+        camaras_con_problemas = verificar_camaras(camaras)
+        if len(camaras_con_problemas) == len(camaras):
+            toma_frame(multiplexor)     # Sigue alimentando el detector para notar cuando se libere la camara
             continue
         ultimo_chequeo = time.time()
 
-    cola_frames = toma_frame(camara1, camara2)
+    cola_frames = toma_frame(multiplexor)
 
-    if cola_frames is None:
+    if not cola_frames:
         logging.warning("No se pudieron capturar los frames")
+        continue
 
     for cam_name, cam_frame in cola_frames.items():
 
+        if registro.device_of(cam_name).name in camaras_con_problemas:
+            continue
+
         roi_x1, roi_y1, roi_x2, roi_y2 = rois[cam_name]
         results = detecion_roi(cam_frame, roi_x1, roi_y1, roi_x2, roi_y2)
 
         dibujo(cam_name, cam_frame, results, roi_x1, roi_y1, roi_x2, roi_y2)
 
-        for box in results[0].boxes:
-            conf = float(box.conf[0])
-            if conf > 0.83 and detecto[cam_name]==False:
-                logging.info(f"Clase detectada con {conf*100:.2f}% de confianza de  //{cam_name}")
-                t = threading.Thread(target=protocolo_detecion, args=(cam_name, 5), daemon=True) 
-                t.start()
-            # else:                                                       # Linea para comprobar errores 
-            #     if detecto[cam_name] == False:
-            #          logging.info(f"false {cam_name}")
+        # Una sola deteccion por camara y frame: la caja de mayor confianza que pasa su umbral
+        evento = filtro_detecciones.select(cam_name, results[0].boxes)
+        if evento is None:
+            continue
+        if not correlador.is_active(cam_name):
+            logging.info(f"Clase detectada con {evento.conf*100:.2f}% de confianza de  //{cam_name}")
+        correlador.detection(cam_name)
     if cv2.waitKey(1) & 0xFF == 27:  # ESC
-        camara1.release()
-        camara2.release()
+        captura.stop()
+        servicio_audio.stop()
+        for camara in camaras.values():
+            camara.release()
         cv2.destroyAllWindows()
         break
\ No newline at end of file
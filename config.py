@@ -4,6 +4,10 @@ import logging
 DEBUG = False # False for production mode, True for development mode
 CONSOLE_LOG = logging.WARNING # Only WARNING and above will be shown in console
 FILE_LOG = logging.INFO # INFO and above will be logged to file
+ASYNC_LOG = True # Callers only enqueue records; a background listener formats and writes them
+LOG_QUEUE_SIZE = 1000 # Records waiting for the listener; when full, records below WARNING are dropped
+LOG_BATCH_SIZE = 64 # Records written before the log file is flushed
+LOG_FLUSH_TIMEOUT = 2.0 # Longest wait at shutdown for the pending records to be written
 #--------------------------------------------------------------------------------------
 
 # Error buffer settings
@@ -11,7 +15,91 @@ ERROR_BUFFER_MAXLEN = 5 # Maximum number of error messages to store in the buffe
 
 #--------------------------------------------------------------------------------------
 
-# Valor de umbral para detectar obstrucciones en las camaras
-THRESHOLD = 500000
+# Camera health checks (ModulosGenerales/camera_health.py)
+# Every threshold is measured on the grayscale thumbnail, per pixel and on the 0-255 scale,
+# so it does not depend on the camera resolution.
+HEALTH_FRAME_SIZE = (80, 60) # Size (width, height) of the grayscale thumbnail used for the camera checks
+HEALTH_CALIBRATION_FRAMES = 50 # Frames used to calibrate the baseline of each camera
+HEALTH_MIN_FRAMES = 30 # Consecutive frames a problem must persist before it is reported
+OBSTRUCTION_CHANGE_THRESHOLD = 0.05 # Mean absolute change per pixel below which a frame counts as "still"
+FROZEN_CHANGE_THRESHOLD = 0.001 # Below this the frames are identical: the camera is frozen
+DARK_LUMINANCE = 15 # Mean luminance below which the view is considered dark
+DARK_RATIO = 0.3 # Also dark when luminance drops below this fraction of the baseline
+BLUR_RATIO = 0.2 # Blurred when sharpness drops below this fraction of the baseline
+COVERED_SPREAD = 10 # 5th-95th percentile luminance spread below which the lens looks covered
 
 #---------------------------------------------------------------------------------------
+
+# Motion gate in front of the detector (ModulosGenerales/motion_gate.py)
+MOTION_FRAME_WIDTH = 64 # Width of the grayscale ROI thumbnail (height keeps the ROI aspect ratio)
+MOTION_PIXEL_THRESHOLD = 20 # Change (0-255) against the background for a pixel to count as moving
+MOTION_MIN_FRACTION = 0.01 # Fraction of moving pixels needed to run the detector
+MOTION_BACKGROUND_ALPHA = 0.05 # Learning rate of the background model
+MOTION_REFRESH_INTERVAL = 2.0 # Seconds after which the detector runs even without motion
+
+#---------------------------------------------------------------------------------------
+
+# Detect-then-track between detector keyframes (ModulosGenerales/roi_tracker.py)
+TRACK_KEYFRAME_INTERVAL = 5 # The detector runs at least once every this many frames per ROI
+TRACK_MAX_POINTS = 100 # Corner features tracked per ROI
+TRACK_MIN_POINTS = 4 # A box with fewer features than this cannot be tracked and is re-detected
+TRACK_MIN_QUALITY = 0.6 # Re-detect when a box keeps less than this fraction of its features
+TRACK_MOTION_PIXELS = 2.0 # Displacement (pixels) for a background feature to count as moving
+TRACK_MOTION_SPIKE = 0.2 # Re-detect when more than this fraction of background features moves
+
+#---------------------------------------------------------------------------------------
+
+# Queues between modules (ModulosGenerales/bounded_queue.py)
+# Policies: "drop_oldest", "keep_latest" or "block" (wait up to the timeout, then drop the new item)
+FRAME_QUEUE_MAXSIZE = 2 # Frames are ~0.9 MB each: never keep more than a couple of them
+FRAME_QUEUE_POLICY = "drop_oldest" # Newest frames win; keep_latest would let one camera lane starve the others
+AUDIO_QUEUE_MAXSIZE = 8 # Pending audio cues
+AUDIO_QUEUE_POLICY = "block" # Audio cues are not dropped unless the player is stuck
+AUDIO_QUEUE_TIMEOUT = 0.5 # Seconds a producer may wait for room in the audio queue
+
+# Audio cue scheduling (ModulosGenerales/audio_service.py)
+# A cue waiting longer than its time to live is dropped instead of played late.
+AUDIO_TTL_EMERGENCY = 10.0 # Seconds an emergency cue stays valid
+AUDIO_TTL_ALARM = 1.5 # Seconds a navigation (alarm) cue stays valid: later it would point the wrong way
+AUDIO_TTL_NORMAL = 3.0 # Seconds any other cue stays valid
+
+#---------------------------------------------------------------------------------------
+
+# Staged pipeline (ModulosGenerales/pipeline.py, TareasFlujoPrincipal/orquestador.py)
+PIPELINE_CHANNEL_SIZE = 2 # Capacity of the channels created between stages
+PIPELINE_POLL_INTERVAL = 0.2 # Seconds a worker waits for input before checking the stop event
+PIPELINE_REPORT_INTERVAL = 30 # Seconds between stage metrics reports in the log
+INFERENCE_WORKERS = 1 # Workers of the infer stage (more only helps if the backend releases the GIL)
+MODEL_WEIGHTS = "best.pt" # YOLO weights loaded by the orchestrator
+MODEL_IMGSZ = 640 # Inference input size
+CONFIDENCE_THRESHOLD = 0.83 # Minimum confidence of a detection
+ALARM_COOLDOWN = 3 # Seconds after an alarm during which no new alarm is raised ("enfriamiento_alarma" overrides it)
+
+# Cameras, ROIs, correlation rules and sounds of every entry point (ModulosGenerales/camera_registry.py)
+SYSTEM_CONFIG_PATH = "config/config_sistema.json" # Keys "camaras", "reglas_correlacion" and "sonidos"
+
+# Per-camera lanes (ModulosGenerales/camera_lanes.py)
+CAMERA_STALL_TIMEOUT = 3.0 # Seconds without a new frame before a camera is considered down and reopened
+CAMERA_RECONNECT_BASE_DELAY = 1.0 # First wait before reopening a camera that is down
+CAMERA_RECONNECT_MAX_DELAY = 30.0 # The wait doubles after every failed attempt up to this value
+
+#---------------------------------------------------------------------------------------
+
+# Detection event store (ModulosGenerales/event_store.py)
+EVENT_STORE_PATH = "logs/eventos.db" # SQLite database (WAL mode) with the detections and alarms
+EVENT_STORE_BATCH_SIZE = 100 # Events written per transaction
+EVENT_STORE_FLUSH_INTERVAL = 1.0 # Longest time (s) an event waits for its batch to be written
+EVENT_STORE_QUEUE_SIZE = 1000 # Events waiting for the writer; when full the oldest are dropped
+EVENT_STORE_RETENTION_DAYS = 30 # Older events are deleted (checked every hour)
+
+#---------------------------------------------------------------------------------------
+
+# Preview windows (ModulosGenerales/preview.py)
+PREVIEW_FPS = 5 # Maximum rate of the preview windows, rendered off the detection path
+
+# MJPEG preview server (ModulosGenerales/mjpeg_server.py)
+MJPEG_FPS = 5 # Maximum frames per second sent to the viewers
+MJPEG_QUALITY = 80 # Initial (and maximum) JPEG quality
+MJPEG_MIN_QUALITY = 40 # Quality is lowered down to this value before the frames are scaled down
+MJPEG_MIN_SCALE = 0.5 # Smallest scale applied to the frames when encoding is too slow
+MJPEG_ENCODE_BUDGET_MS = 20 # Target encoding time per frame; quality and size adapt to stay under it
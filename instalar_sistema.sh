@@ -81,7 +81,9 @@ pip3 install \
     numpy \
     pillow \
     torch \
-    torchvision
+    torchvision \
+    onnx \
+    onnxruntime
 
 # Configurar GPIO
 print_status "Configurando GPIO..."
@@ -3,7 +3,14 @@
 import logging
 import ModulosGenerales.modulo_logging as modulo_logging 
 import threading
-import queue
+from ModulosGenerales.bounded_queue import BoundedQueue
+from config import (
+    FRAME_QUEUE_MAXSIZE,
+    FRAME_QUEUE_POLICY,
+    AUDIO_QUEUE_MAXSIZE,
+    AUDIO_QUEUE_POLICY,
+    AUDIO_QUEUE_TIMEOUT,
+)
 
 """ Modules import"""
 #---------------------------------------------------------
@@ -18,8 +25,9 @@ from TareasSegundoPlano import oled_module
 """ Variables globales """
 #---------------------------------------------------------
 
-cola_frames = queue.Queue()
-cola_audio = queue.Queue()
+# Bounded queues: a slow consumer drops items instead of growing memory without limit
+cola_frames = BoundedQueue("frames", FRAME_QUEUE_MAXSIZE, FRAME_QUEUE_POLICY)
+cola_audio = BoundedQueue("audio", AUDIO_QUEUE_MAXSIZE, AUDIO_QUEUE_POLICY, timeout=AUDIO_QUEUE_TIMEOUT)
 
 #---------------------------------------------------------
 
@@ -105,6 +113,7 @@ def main():
         
     
     main_logger.info("Application has been shut down")
+    modulo_logging.shutdown_logging() # Write the records still queued before exiting
 
 
     #------------------------------------------------------
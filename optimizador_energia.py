@@ -9,15 +9,114 @@ import logging
 import subprocess       # Biblioteca para ejecutar comandos en la terminal
 import psutil           # Biblioteca para leer estado del sistema (Bateria, CPU, Memoria, etc.)
 import os
+import threading
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 import json
 
+
+@dataclass(frozen=True)
+class PuntoOperacion:
+    """Punto de operación del pipeline de detección"""
+    nombre: str
+    fps_inferencia: float       # Tasa máxima de inferencias por segundo
+    tamano_entrada: int         # Tamaño de entrada del modelo
+    resolucion: tuple           # Resolución de captura (ancho, alto)
+
+
+# Ordenados de menor a mayor ahorro
+PUNTOS_OPERACION_DEFAULT = [
+    {"nombre": "rendimiento", "fps_inferencia": 15, "tamano_entrada": 640, "resolucion": [640, 480]},
+    {"nombre": "normal", "fps_inferencia": 10, "tamano_entrada": 480, "resolucion": [640, 480]},
+    {"nombre": "ahorro", "fps_inferencia": 5, "tamano_entrada": 320, "resolucion": [320, 240]},
+    {"nombre": "critico", "fps_inferencia": 2, "tamano_entrada": 320, "resolucion": [320, 240]},
+]
+
+
+class ControladorTasaInferencia:
+    """
+    Controlador en lazo cerrado de la tasa de inferencia.
+    
+    Con cada lectura de evaluar_estado_sistema elige un punto de operación
+    (tasa de inferencia, tamaño de entrada y resolución de captura). Se mueve un
+    nivel por lectura: hacia más ahorro de inmediato, hacia más rendimiento solo
+    después de varias lecturas seguidas que lo permitan (histéresis), para bajar
+    el consumo de forma gradual antes de que el CPU se estrangule por temperatura.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.puntos = [
+            PuntoOperacion(p['nombre'], p['fps_inferencia'], p['tamano_entrada'], tuple(p['resolucion']))
+            for p in config.get('puntos_operacion', PUNTOS_OPERACION_DEFAULT)
+        ]
+        self.confirmaciones = config.get('confirmaciones_histeresis', 3)
+        self.margen_temperatura = config.get('margen_temperatura', 5)
+        self.nivel = 0
+        self.lecturas_relajar = 0       # Lecturas seguidas que permiten menos ahorro
+        self.suscriptores = []
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def nivel_deseado(self, estado):
+        """Nivel de ahorro que pide el estado actual del sistema"""
+        temperatura_max = self.config['temperatura_max']
+        ultimo = len(self.puntos) - 1
+        if (estado['bateria'] < self.config['bateria_minima'] / 2 or
+                estado['temperatura'] > temperatura_max + self.margen_temperatura):
+            return ultimo
+        if estado['necesita_ahorro']:
+            return min(2, ultimo)
+        if estado['puede_rendimiento']:
+            return 0
+        return min(1, ultimo)
+
+    def actualizar(self, estado):
+        """Ajusta el punto de operación con una nueva lectura y lo devuelve"""
+        deseado = self.nivel_deseado(estado)
+
+        with self.lock:
+            anterior = self.nivel
+            if deseado > self.nivel:
+                # Más ahorro: de inmediato, un nivel por lectura
+                self.nivel += 1
+                self.lecturas_relajar = 0
+            elif deseado < self.nivel and estado['temperatura'] < self.config['temperatura_max'] - self.margen_temperatura:
+                # Menos ahorro: solo tras varias lecturas seguidas y con margen de temperatura
+                self.lecturas_relajar += 1
+                if self.lecturas_relajar >= self.confirmaciones:
+                    self.nivel -= 1
+                    self.lecturas_relajar = 0
+            else:
+                self.lecturas_relajar = 0
+            punto = self.puntos[self.nivel]
+
+        if self.nivel != anterior:
+            self.logger.info(f"Punto de operación: {self.puntos[anterior].nombre} -> {punto.nombre} "
+                             f"({punto.fps_inferencia} fps, entrada {punto.tamano_entrada}, {punto.resolucion})")
+            for callback in list(self.suscriptores):
+                try:
+                    callback(punto)
+                except Exception as e:
+                    self.logger.error(f"Error aplicando punto de operación: {e}")
+        return punto
+
+    def punto_actual(self):
+        """Punto de operación vigente"""
+        with self.lock:
+            return self.puntos[self.nivel]
+
+    def suscribir(self, callback):
+        """Registra una función que recibe el nuevo PuntoOperacion cada vez que cambia"""
+        self.suscriptores.append(callback)
+
 class OptimizadorEnergia:
     def __init__(self, config_file="config/config_energia.json"):
         self.config = self.cargar_configuracion(config_file)
         self.setup_logging()
         self.estado_ahorro = False
         self.ultimo_ajuste = time.time()
+        self.controlador = ControladorTasaInferencia(self.config)
         
     def cargar_configuracion(self, config_file):
         """Carga configuración de optimización energética"""
@@ -246,19 +345,11 @@ class OptimizadorEnergia:
     def ajustar_configuracion_camara(self, estado_sistema):
         """Ajusta configuración de cámara según estado del sistema"""
         try:
-            if estado_sistema['necesita_ahorro']:
-                # Configuración de ahorro
-                fps = self.config['fps_ahorro']
-                resolucion = self.config['resolucion_ahorro']
-                self.logger.info(f"Ajustando cámara para ahorro: {fps}fps, {resolucion}")
-            else:
-                # Configuración normal
-                fps = 15
-                resolucion = [640, 480]
-                self.logger.info(f"Ajustando cámara para rendimiento: {fps}fps, {resolucion}")
-            
-            # Aquí se actualizaría la configuración de la cámara
-            # Esto se integraría con el sistema principal
+            # El controlador aplica el punto de operación a los suscriptores (pipeline en vivo)
+            punto = self.controlador.actualizar(estado_sistema)
+            fps = punto.fps_inferencia
+            resolucion = list(punto.resolucion)
+            self.logger.info(f"Ajustando cámara ({punto.nombre}): {fps}fps, {resolucion}")
             
             return fps, resolucion
             
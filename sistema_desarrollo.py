@@ -14,10 +14,20 @@ import json
 import datetime
 import psutil
 from pathlib import Path
-from ultralytics import YOLO
-import cv2
 import pygame
-import numpy as np
+from ModulosGenerales.alarm_correlator import RuleCorrelator
+from ModulosGenerales.batch_inference import BatchDetector
+from ModulosGenerales.audio_service import AudioService, SoundBank, PRIORITY_ALARM
+from ModulosGenerales.camera_health import CameraHealthMonitor
+from ModulosGenerales.camera_lanes import DeviceLane
+from ModulosGenerales.camera_registry import CameraRegistry
+from ModulosGenerales.detection_filter import DetectionFilter
+from ModulosGenerales.event_store import EventStore
+from ModulosGenerales.inference_backend import load_backend
+from ModulosGenerales.motion_gate import MotionGate
+from ModulosGenerales.mjpeg_server import MjpegServer
+from ModulosGenerales.preview import PreviewRenderer
+from ModulosGenerales.roi_tracker import RoiTracker
 
 class SistemaVigilanciaDesarrollo:
     def __init__(self):
@@ -33,22 +43,61 @@ class SistemaVigilanciaDesarrollo:
         
         # Componentes del sistema
         self.modelo = None
-        self.camara1 = None
-        self.camara2 = None
-        self.lock = threading.Lock()
+        self.detector_lote = None
+        # Compuerta de movimiento: evita correr YOLO sobre ROIs estáticas
+        self.compuerta_movimiento = None
+        if self.config.get('compuerta_movimiento', True):
+            self.compuerta_movimiento = MotionGate(
+                refresh_interval=self.config.get('intervalo_refresco_movimiento', 2.0)
+            )
+        # Vista previa en su propio hilo y a tasa limitada; en modo headless no se dibuja nada
+        self.vista_previa = PreviewRenderer(
+            fps=self.config.get('fps_vista_previa', 5),
+            headless=self.config.get('modo_headless') if self.config.get('vista_previa', True) else True
+        )
+        # Registro de cámaras: dispositivos, ROIs y reglas de correlación salen de config_sistema.json
+        self.registro = CameraRegistry.from_config(self.config)
+        self.rois = self.registro.rois
+        # Servidor MJPEG para ver las cámaras desde un navegador (solo codifica con clientes conectados)
+        self.servidor_mjpeg = None
+        opciones_mjpeg = self.config.get('servidor_mjpeg', {})
+        if opciones_mjpeg.get('habilitado', False):
+            self.servidor_mjpeg = MjpegServer(
+                self.vista_previa,
+                host=opciones_mjpeg.get('host', '127.0.0.1'),
+                port=opciones_mjpeg.get('puerto', 8080),
+                cameras=list(self.rois)
+            )
+        # Umbrales de confianza por clase y por cámara, aplicados sobre todas las cajas a la vez
+        self.filtro_detecciones = DetectionFilter(
+            self.config.get('umbral_confianza', 0.83),
+            class_thresholds=self.config.get('umbrales_clase'),
+            camera_thresholds=self.config.get('umbrales_camara')
+        )
+        # Detectar y seguir: el detector corre en keyframes y el flujo óptico mueve las cajas entre ellos
+        self.seguimiento = None
+        if self.config.get('modo_seguimiento', True):
+            self.seguimiento = RoiTracker(keyframe_interval=self.config.get('intervalo_keyframe', 5))
+        self.carriles = {}  # Dispositivo -> DeviceLane (captura y procesamiento propios)
+        self.en_pausa = False  # Fuera de horario o sin ninguna cámara utilizable los carriles no detectan
+        self.camaras_excluidas = set()  # Cámaras caídas u obstruidas; las demás siguen detectando
         
-        # Configuración de cámaras y ROIs
-        self.rois = {
-            "camara1": (400, 0, 640, 480),
-            "camara2": (0, 0, 300, 480)
-        }
-        self.ultimo_evento = {"camara1": None, "camara2": None}
-        self.detecto = {"camara1": False, "camara2": False}
-        self.sound_path = {
+        self.sound_path = self.config.get('sonidos', {
             "camara1": "sonido_prueva0.mp3", 
-            "camara2": "sonido_prueva2.mp3"
-        }
-        self.umbral_obstruccion = 5000  # umbral para comprobar si hay obstruccion en las camaras
+            "camara2": "sonido_prueva2.mp3",
+            "emergencia": "sonido_emergencia.mp3"
+        })
+        self.servicio_audio = None  # Sonidos decodificados en memoria, reproducidos por un hilo propio
+        
+        # Correlación entre cámaras por eventos: cada regla dice qué ROIs deben detectar juntas
+        self.correlador = RuleCorrelator(
+            self.registro.rule_windows(),
+            cooldown=self.config.get('enfriamiento_alarma', 3),
+            on_alarm=self.alarma_disparada
+        )
+        # Métricas de salud de las cámaras (oscuridad, desenfoque, lente tapada, imagen congelada).
+        # Se alimenta con los frames de cada carril; los umbrales están en config.py
+        self.salud_camaras = CameraHealthMonitor()
         # Almacena el tiempo donde se hizo el ultimo chequeo de las camaras
         self.ultimo_chequeo = time.time() 
         # Tiempo en segundos de cada cuando se debe de hacer un chequeo de las camaras
@@ -114,12 +163,13 @@ class SistemaVigilanciaDesarrollo:
         self.logger.addHandler(file_handler)
         self.logger.addHandler(console_handler)
         
-        # Logger para detecciones
-        self.detection_logger = logging.getLogger('detecciones_desarrollo')
-        detection_handler = logging.FileHandler(log_dir / 'detecciones_desarrollo.log')
-        detection_handler.setFormatter(formatter)
-        self.detection_logger.addHandler(detection_handler)
-        self.detection_logger.setLevel(logging.INFO)
+        # Eventos de detección y alarma: base SQLite indexada por tiempo y cámara, escrita por lotes desde un hilo propio
+        # (consultas: python -m ModulosGenerales.event_store alarms --camera camara2 --since 7d)
+        self.eventos = EventStore(
+            self.config.get('base_eventos', 'logs/eventos_desarrollo.db'),
+            retention_days=self.config.get('retencion_eventos_dias', 30)
+        )
+        self.eventos.start()
 
 ################################################################################
 #                            MÓDULO DE CÁMARAS                                 #
@@ -129,53 +179,78 @@ class SistemaVigilanciaDesarrollo:
     def inicializar_componentes(self):
         """Inicializa todos los componentes del sistema"""
         try:
-            # Inicializar pygame para audio
+            # Inicializar pygame para audio y decodificar todos los sonidos una sola vez
             pygame.mixer.init()
+            self.servicio_audio = AudioService(SoundBank(self.sound_path))
+            self.servicio_audio.start()
             
-            # Cargar modelo YOLO
-            self.modelo = YOLO('best.pt')
-            self.logger.info("Modelo YOLO cargado correctamente")
-            
-            # Inicializar cámara
-            self.camara1 = cv2.VideoCapture(0)
-            if not self.camara1.isOpened():
-                raise Exception("No se pudo abrir la cámara 1")
-            else:
-                self.camara2 = self.camara1
-                if not self.camara2.isOpened():
-                    raise Exception("No se pudo abrir la cámara 2")
+            # Cargar modelo YOLO con el runtime más rápido disponible (OpenVINO / ONNX Runtime / PyTorch)
+            tamano_entrada = self.config.get('tamano_entrada', 640)
+            self.modelo = load_backend(
+                'best.pt',
+                imgsz=tamano_entrada,
+                preferred=self.config.get('backend_inferencia', 'auto')
+            )
+            self.detector_lote = BatchDetector(
+                self.modelo,
+                imgsz=tamano_entrada,
+                rect=self.config.get('entrada_rectangular_roi', True)  # Entrada rectangular común a las ROIs del lote
+            )
+            self.logger.info(f"Modelo YOLO cargado correctamente (backend: {self.modelo.name})")
             
-            # Configurar camara1
-            self.camara1.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camara1.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.camara1.set(cv2.CAP_PROP_FPS, 15)
-            # Configurar camara2
-            self.camara2.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camara2.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.camara2.set(cv2.CAP_PROP_FPS, 15)
+            # Un carril por dispositivo: hilo lector y hilo de procesamiento propios
+            for dispositivo, spec in self.registro.devices.items():
+                carril = DeviceLane(
+                    dispositivo,
+                    self.registro.rois_of(dispositivo),
+                    lambda dispositivo=dispositivo: self.registro.open(dispositivo),
+                    self.procesar_carril,
+                    reference_size=(spec.width, spec.height)
+                )
+                carril.start()
+                self.carriles[dispositivo] = carril
             
-            self.logger.info("Cámara inicializada correctamente")
+            self.logger.info(f"Cámaras inicializadas correctamente: {sorted(self.carriles)}")
             
         except Exception as e:
             self.logger.error(f"Error inicializando componentes: {e}")
             raise
     
-    def tomar_frame(self):
-        """Captura frame de la cámara"""
-        try:
-            ret1, frame1 = self.camara1.read()
-            if not ret1:
-                raise Exception("Error capturando frame de la camara 1")
-            ret2, frame2 = self.camara2.read()
-            if not ret2: 
-                raise Exception("Error capturando frame de la camara 2")
-            return {
-                "camara1": frame1.copy(),
-                "camara2": frame2.copy()
-            }
-        except Exception as e:
-            self.logger.error(f"Error tomando frame: {e}")
-            return None
+    def procesar_carril(self, dispositivo, vistas):
+        """Procesa un frame nuevo de un dispositivo (se llama desde el hilo de su carril)"""
+        # Alimentar el detector de obstrucción con el frame ya capturado, también en pausa
+        # (así se nota cuando se libera la cámara)
+        self.salud_camaras.update(dispositivo, next(iter(vistas.values())).frame)
+        if self.en_pausa or dispositivo in self.camaras_excluidas:
+            return
+        
+        # Detección de todas las ROIs del dispositivo en un solo lote
+        resultados = self.deteccion_lote(vistas)
+        
+        for cam_name, vista in vistas.items():
+            results = resultados.get(cam_name)
+            if results is None:
+                continue
+            
+            # Frame de solo lectura compartido; la vista previa copia solo si dibuja
+            self.dibujar_ventanas(cam_name, vista.frame, results, *vista.roi)
+            
+            # Procesar detecciones: como máximo un evento por cámara y frame (la caja de mayor confianza)
+            if not results:
+                continue
+            evento = self.filtro_detecciones.select(cam_name, results[0].boxes)
+            if evento is None:
+                continue
+            
+            # Mientras haya detección la compuerta no debe cerrarse (persona quieta)
+            if self.compuerta_movimiento:
+                self.compuerta_movimiento.keep_open(cam_name)
+            
+            self.eventos.record_detection(evento, vista.captured.timestamp)
+            if not self.correlador.is_active(cam_name):
+                self.logger.info(f"Clase detectada con {evento.conf*100:.2f}% de confianza en {cam_name}")
+                print(f"🎯 Detección en {cam_name}: {evento.conf*100:.1f}% confianza")
+            self.correlador.detection(cam_name, vista.captured.timestamp)
 
     def deteccion_roi(self, frame, roi_x1, roi_y1, roi_x2, roi_y2):
         """Realiza detección en región de interés"""
@@ -190,75 +265,62 @@ class SistemaVigilanciaDesarrollo:
     def limpiar_recursos(self):
         """Limpia todos los recursos del sistema"""
         try:
-            if self.camara1:
-                self.camara1.release()
-            # Despues de hacer pruebas y tener las 2 camaras funcionando, vamos a cambiar este if por solo "if self.camara2:"
-            if self.camara2 and self.camara2 != self.camara2:
-                self.camara2.release()
-            cv2.destroyAllWindows()
+            for carril in self.carriles.values():
+                carril.stop()
+            self.carriles = {}
+            if self.servicio_audio:
+                self.servicio_audio.stop()
+                self.servicio_audio = None
+            self.vista_previa.stop()  # Cierra las ventanas desde el hilo que las abrió
+            self.eventos.stop()  # Escribe los eventos pendientes antes de cerrar la base
+            if self.servidor_mjpeg:
+                self.servidor_mjpeg.stop()
+                self.servidor_mjpeg = None
             self.logger.info("Recursos limpiados correctamente")
         except Exception as e:
             self.logger.error(f"Error limpiando recursos: {e}")
 
     # Funcion para comprobar si hay obstrucciones
-    def obstruccion(self, camara):
+    def obstruccion(self, cam_name):
 
-        #Captura de 2 frames en distintos periodos de tiempo
-        ret1, frame1 = camara.read()
-        if not ret1:
-            self.logger.error("Error leyendo primer frame para obstrucción")
+        #Consulta el estado de las métricas de salud (no captura frames ni espera)
+        estado = self.salud_camaras.state(cam_name)
+        if estado is None:
+            self.logger.error(f"Sin frames de {cam_name} para comprobar obstrucción")
             return True
-        time.sleep(0.1)
-        ret2, frame2 = camara.read()
-        if not ret2:
-            self.logger.error("Error leyendo segundo frame para obstrucción")
-            return True
-        
-        escalagrises1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-        escalagrises2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
 
-        #Calculo del cambio de valores (pixeles) entre cada frame
-        diferencia = cv2.absdiff(escalagrises1, escalagrises2)
-        total_cambio = np.sum(diferencia)
+        # Sirve para ajustar los umbrales de config.py segun las condiciones de nuestro proyecto
+        self.logger.debug(f"Salud de {cam_name}: {estado}")
 
-        #Print para buscar el THRESHOLD perfecto segun las condiciones de nuestro proyecto. 
-        # Este print es temporal Y SERA ELIMINADO
-        self.logger.debug(f"Cambio detectado en cámara: {total_cambio}")
+        # Problemas que no impiden detectar, solo se reportan
+        for problema in set(estado['problems']) & {"dark", "blurred"}:
+            self.logger.warning(f"{cam_name}: imagen con problema '{problema}'")
 
         #Comprobacion de obstruccion
-        return self.umbral_obstruccion > total_cambio
+        return estado['obstructed']
 
-    #Funcion para revisar si hay problemas en las camaras
-    def verificar_camaras(self, cam1, cam2):
+    #Funcion para revisar si hay problemas en las camaras. Las camaras caidas u obstruidas se excluyen de la
+    #deteccion y las demas siguen a tasa completa; solo devuelve False si no queda ninguna utilizable
+    def verificar_camaras(self):
 
-        #Error al abrir ambas camaras
-        if not cam1.isOpened() and not cam2.isOpened():
-            self.logger.error("Ninguna de las camaras se pudo abrir")
-            return False
-        #Error al abrir la camara 1
-        elif not cam1.isOpened():
-            self.logger.warning("Camara 1 no se pudo abrir")
-            return False
-        #Error al abrir la camara 2
-        elif not cam2.isOpened():
-            self.logger.warning("Camara 2 no se pudo abrir")
-            return False
+        #Camaras caidas: su carril las reabre en segundo plano con espera exponencial
+        caidas = [dispositivo for dispositivo, carril in self.carriles.items() if not carril.healthy]
+        if caidas:
+            self.logger.warning(f"Modo degradado, camaras reconectando: {caidas}")
 
-        #Comprobacion de obstruccion en ambas camaras
-        obstruccion_cam1 = self.obstruccion(cam1)
-        obstruccion_cam2 = self.obstruccion(cam2)
+        #Comprobacion de obstruccion en las camaras que siguen entregando frames
+        obstruidas = [dispositivo for dispositivo in self.carriles if dispositivo not in caidas and self.obstruccion(dispositivo)]
+        if obstruidas:
+            self.logger.error(f"Camaras obstruidas: {obstruidas}")
 
-        #Error de obstrucion en ambas camaras
-        if obstruccion_cam1 and obstruccion_cam2:
-            self.logger.critical("Ambas camaras obstruidas")
+        self.camaras_excluidas = set(caidas) | set(obstruidas)
+
+        #Ninguna camara utilizable
+        if not caidas and len(obstruidas) == len(self.carriles):
+            self.logger.critical("Todas las camaras obstruidas")
             return False
-        #Error de obstrucion en camara 1
-        elif obstruccion_cam1:
-            self.logger.error("Camara 1 obstruida")
-            return False  
-        #Error de obstrucion en camara 2
-        elif obstruccion_cam2:
-            self.logger.error("Camara 2 obstruida")
+        elif len(self.camaras_excluidas) == len(self.carriles):
+            self.logger.error("Ninguna camara utilizable")
             return False
         else:
             return True 
@@ -318,54 +380,49 @@ class SistemaVigilanciaDesarrollo:
         self.limpiar_recursos()
         sys.exit(0)
 
-    def dibujar_ventanas(self, cam_name, frame, results, roi_x1, roi_y1, roi_x2, roi_y2):
-        """Dibuja ventanas de visualización"""
+    def deteccion_lote(self, vistas):
+        """Realiza la detección de todas las ROIs de un dispositivo en una sola llamada al modelo"""
         try:
-            # Dibujar ROI
-            cv2.rectangle(frame, (roi_x1, roi_y1), (roi_x2, roi_y2), (0, 255, 0), 2)
-            
-            if results and len(results) > 0:
-                annotated_frame = results[0].plot()
-                cv2.imshow(f"{cam_name} - ROI", annotated_frame)
-            
-            cv2.imshow(f"{cam_name} - Frame completo", frame)
-            
+            recortes = {}
+            seguidos = {}
+            for cam_name, vista in vistas.items():
+                recorte = vista.crop  # Vista de solo lectura del frame compartido
+                # Sin movimiento en la ROI (y sin refresco pendiente) no se corre el detector
+                if self.compuerta_movimiento and not self.compuerta_movimiento.should_run(cam_name, recorte):
+                    if self.seguimiento:
+                        self.seguimiento.drop(cam_name)
+                    continue
+                # Entre keyframes las cajas se propagan con flujo óptico en lugar de correr el detector
+                if self.seguimiento and not self.seguimiento.needs_detection(cam_name, recorte):
+                    resultado = self.seguimiento.track(cam_name, recorte)
+                    if resultado is not None:
+                        seguidos[cam_name] = resultado
+                        continue
+                recortes[cam_name] = recorte
+            resultados = self.detector_lote.detect(recortes)
+            if self.seguimiento:
+                for cam_name, results in resultados.items():
+                    self.seguimiento.reset(cam_name, recortes[cam_name], results[0])
+            resultados.update(seguidos)
+            return resultados
         except Exception as e:
-            self.logger.error(f"Error dibujando ventanas: {e}")
+            self.logger.error(f"Error en detección por lote: {e}")
+            return {}
 
-    def protocolo_deteccion(self, cam_name, ventana_tiempo):
-        """Protocolo de detección con coordinación entre cámaras"""
-        try:
-            otra = "camara2" if cam_name == "camara1" else "camara1"
-            self.detecto[cam_name] = True
-            contador = 0
-
-            with self.lock:
-                while self.detecto[cam_name] and contador < ventana_tiempo:
-                    time.sleep(1)
-                    contador += 1
-
-                    if self.detecto[cam_name] and self.detecto[otra]:
-                        self.detection_logger.info(f"🚨 Alarma disparada con {contador}s (última detección en {cam_name})")
-                        
-                        # Reproducir sonido
-                        try:
-                            pygame.mixer.music.load(self.sound_path[cam_name])
-                            pygame.mixer.music.play()
-                            while pygame.mixer.music.get_busy():
-                                pygame.time.Clock().tick(10)
-                        except Exception as e:
-                            self.logger.error(f"Error reproduciendo sonido: {e}")
-                        
-                        self.detecto[cam_name] = False
-                        self.detecto[otra] = False
-                        break
-
-                self.detecto[cam_name] = False
-                self.detecto[otra] = False
-                
-        except Exception as e:
-            self.logger.error(f"Error en protocolo de detección: {e}")
+    def dibujar_ventanas(self, cam_name, frame, results, roi_x1, roi_y1, roi_x2, roi_y2):
+        """Publica el último frame y resultados para la vista previa (el dibujo ocurre en su propio hilo)"""
+        self.vista_previa.publish(cam_name, frame, (roi_x1, roi_y1, roi_x2, roi_y2), results)
+
+    def alarma_disparada(self, alarma):
+        """Recibe la alarma del correlador y pide su sonido (el de la cámara que detectó primero) sin bloquear"""
+        espera = alarma.timestamp - alarma.first_seen[alarma.camera]
+        alarma_id = self.eventos.record_alarm(alarma)
+        self.logger.info(
+            f"🚨 Alarma {alarma_id} ({alarma.rule}) disparada con {espera:.3f}s (primera detección en {alarma.camera}, "
+            f"última en {alarma.last_camera}, decisión en {alarma.latency * 1000:.2f} ms)"
+        )
+        if self.servicio_audio:
+            self.servicio_audio.play(alarma.camera, PRIORITY_ALARM, created=alarma.timestamp)
 
     def heartbeat(self):
         """Sistema de heartbeat para monitoreo"""
@@ -377,6 +434,23 @@ class SistemaVigilanciaDesarrollo:
                 if not self.verificar_estado_sistema():
                     self.logger.warning("Problemas detectados en el sistema")
                 
+                if self.detector_lote:
+                    self.logger.debug(f"Latencia de inferencia por lote: {self.detector_lote.stats()}")
+                
+                if self.compuerta_movimiento:
+                    self.logger.debug(f"Inferencias omitidas / ejecutadas: {self.compuerta_movimiento.stats()}")
+                
+                if self.seguimiento:
+                    self.logger.debug(f"Frames detectados / seguidos: {self.seguimiento.stats()}")
+                
+                self.correlador.tick()
+                if self.servicio_audio:
+                    self.logger.debug(f"Servicio de audio: {self.servicio_audio.stats()}")
+                self.logger.debug(f"Correlación de alarmas: {self.correlador.stats()}")
+                
+                for dispositivo, carril in self.carriles.items():
+                    self.logger.debug(f"Carril {dispositivo}: {carril.stats()}")
+                
                 self.ultimo_heartbeat = time.time()
                 time.sleep(self.config.get('heartbeat_interval', 30))
                 
@@ -391,66 +465,49 @@ class SistemaVigilanciaDesarrollo:
             heartbeat_thread = threading.Thread(target=self.heartbeat, daemon=True)
             heartbeat_thread.start()
             
+            # Iniciar thread de vista previa (no hace nada en modo headless)
+            self.vista_previa.start()
+            if self.servidor_mjpeg:
+                try:
+                    self.servidor_mjpeg.start()
+                except Exception as e:
+                    self.logger.error(f"No se pudo iniciar el servidor MJPEG: {e}")
+                    self.servidor_mjpeg = None
+            
             self.logger.info("Sistema iniciado correctamente")
             print("🎯 Sistema de Vigilancia Snow - Modo Desarrollo")
             print("📋 Presiona ESC para salir")
             print("🔍 Monitoreando detecciones...")
             
+            # La captura y la detección corren en los carriles de cada cámara; este bucle solo supervisa
             while self.sistema_activo:
                 try:
 
-                    # Verificar si hay problemas en las camaras
+                    # Verificar si hay problemas en las camaras (los carriles siguen alimentando las métricas de salud)
                     if time.time() - self.ultimo_chequeo > self.intervalo_chequeo:
-                        if not self.verificar_camaras(self.camara1, self.camara2):
+                        if not self.verificar_camaras():
+                            self.en_pausa = True
                             time.sleep(2)
                             continue
                         self.ultimo_chequeo = time.time()
+                        if self.camaras_excluidas:
+                            # Con cámaras excluidas se vuelve a revisar en 2 s para reincorporarlas cuanto antes
+                            self.ultimo_chequeo -= self.intervalo_chequeo - 2
 
                     # Verificar si es horario activo
                     if not self.es_horario_activo():
+                        self.en_pausa = True
                         self.logger.info("Fuera del horario activo, sistema en standby")
                         print("🌙 Fuera del horario activo (6 AM - 8 PM)")
                         time.sleep(60)  # Esperar 1 minuto
                         continue
+                    self.en_pausa = False
                     
-                    # Capturar frames
-                    cola_frames = self.tomar_frame()
-                    if cola_frames is None:
-                        self.logger.error("Error capturando frame, reintentando...")
-                        time.sleep(1)
-                        continue
-                    
-                    # Procesar cada cámara
-                    for cam_name, frame in cola_frames.items():
-                        roi_x1, roi_y1, roi_x2, roi_y2 = self.rois[cam_name]
-                        results = self.deteccion_roi(frame, roi_x1, roi_y1, roi_x2, roi_y2)
-                        
-                        if results is None:
-                            continue
-                        
-                        self.dibujar_ventanas(cam_name, frame, results, roi_x1, roi_y1, roi_x2, roi_y2)
-                        
-                        # Procesar detecciones
-                        if results and len(results) > 0 and results[0].boxes is not None:
-                            for box in results[0].boxes:
-                                conf = float(box.conf[0])
-                                umbral = self.config.get('umbral_confianza', 0.83)
-                                
-                                if conf > umbral and not self.detecto[cam_name]:
-                                    self.detection_logger.info(f"Clase detectada con {conf*100:.2f}% de confianza en {cam_name}")
-                                    print(f"🎯 Detección en {cam_name}: {conf*100:.1f}% confianza")
-                                    
-                                    ventana_tiempo = self.config.get('ventana_tiempo', 5)
-                                    t = threading.Thread(
-                                        target=self.protocolo_deteccion, 
-                                        args=(cam_name, ventana_tiempo), 
-                                        daemon=True
-                                    )
-                                    t.start()
-                    
-                    # Verificar tecla ESC para salir
-                    if cv2.waitKey(1) & 0xFF == 27:
+                    # Verificar tecla ESC para salir (la atiende el hilo de vista previa)
+                    if self.vista_previa.quit_requested():
                         break
+                    
+                    time.sleep(0.5)
                         
                 except Exception as e:
                     self.logger.error(f"Error en bucle principal: {e}")
@@ -16,9 +16,22 @@ import datetime
 import json
 import psutil
 from pathlib import Path
-from ultralytics import YOLO
-import cv2
 import pygame
+from ModulosGenerales.alarm_correlator import RuleCorrelator
+from ModulosGenerales.batch_inference import BatchDetector
+from ModulosGenerales.audio_service import AudioService, SoundBank, PRIORITY_ALARM, PRIORITY_EMERGENCY
+from ModulosGenerales.camera_health import CameraHealthMonitor
+from ModulosGenerales.camera_lanes import DeviceLane
+from ModulosGenerales.camera_registry import CameraRegistry
+from ModulosGenerales.detection_filter import DetectionFilter
+from ModulosGenerales.event_store import EventStore
+from ModulosGenerales.component_recovery import ComponentSupervisor
+from ModulosGenerales.inference_worker import InferencePool, InferenceWorker, load_configured_backend
+from ModulosGenerales.motion_gate import MotionGate
+from ModulosGenerales.mjpeg_server import MjpegServer
+from ModulosGenerales.preview import PreviewRenderer
+from ModulosGenerales.roi_tracker import RoiTracker
+from optimizador_energia import OptimizadorEnergia
 try:
     import RPi.GPIO as GPIO  # Para control de hardware en Raspberry Pi
     RASPBERRY_PI = True
@@ -31,30 +44,81 @@ class SistemaVigilanciaAutonomo:
         # Configuración inicial
         self.config = self.cargar_configuracion()
         self.setup_logging()
-        self.setup_gpio()
         
         # Estado del sistema
         self.sistema_activo = True
         self.ultimo_heartbeat = time.time()
-        self.contador_reinicios = 0
-        self.max_reinicios = 5
+        self.max_reinicios = self.config.get('max_reinicios', 5)
+        self.gpio_activo = False
+        
+        # Recuperación por componente: solo se reinicia lo que falló, con espera exponencial
+        self.supervisor = ComponentSupervisor(
+            base_delay=self.config.get('espera_base_reinicio', 1.0),
+            max_delay=self.config.get('espera_maxima_reinicio', 60.0),
+            max_failures=self.max_reinicios
+        )
         
         # Componentes del sistema
         self.modelo = None
-        self.cap = None
-        self.lock = threading.Lock()
+        self.detector_lote = None
+        # Compuerta de movimiento: evita correr YOLO sobre ROIs estáticas
+        self.compuerta_movimiento = None
+        if self.config.get('compuerta_movimiento', True):
+            self.compuerta_movimiento = MotionGate(
+                refresh_interval=self.config.get('intervalo_refresco_movimiento', 2.0)
+            )
+        # Vista previa en su propio hilo y a tasa limitada; en modo headless no se dibuja nada
+        self.vista_previa = PreviewRenderer(
+            fps=self.config.get('fps_vista_previa', 5),
+            headless=self.config.get('modo_headless') if self.config.get('vista_previa', True) else True
+        )
+        # Registro de cámaras: dispositivos, ROIs y reglas de correlación salen de config_sistema.json
+        self.registro = CameraRegistry.from_config(self.config)
+        self.rois = self.registro.rois
+        # Servidor MJPEG para ver las cámaras desde un navegador (solo codifica con clientes conectados)
+        self.servidor_mjpeg = None
+        opciones_mjpeg = self.config.get('servidor_mjpeg', {})
+        if opciones_mjpeg.get('habilitado', False):
+            self.servidor_mjpeg = MjpegServer(
+                self.vista_previa,
+                host=opciones_mjpeg.get('host', '127.0.0.1'),
+                port=opciones_mjpeg.get('puerto', 8080),
+                cameras=list(self.rois)
+            )
+        # Umbrales de confianza por clase y por cámara, aplicados sobre todas las cajas a la vez
+        self.filtro_detecciones = DetectionFilter(
+            self.config.get('umbral_confianza', 0.83),
+            class_thresholds=self.config.get('umbrales_clase'),
+            camera_thresholds=self.config.get('umbrales_camara')
+        )
+        # Detectar y seguir: el detector corre en keyframes y el flujo óptico mueve las cajas entre ellos
+        self.seguimiento = None
+        if self.config.get('modo_seguimiento', True):
+            self.seguimiento = RoiTracker(keyframe_interval=self.config.get('intervalo_keyframe', 5))
+        self.carriles = {}  # Dispositivo -> DeviceLane (captura y procesamiento propios)
+        self.salud_camaras = CameraHealthMonitor()
+        self.en_espera = False  # Fuera del horario activo los carriles no procesan
         
-        # Configuración de cámaras y ROIs
-        self.rois = {
-            "camara1": (400, 0, 640, 480),
-            "camara2": (0, 0, 300, 480)
-        }
-        self.ultimo_evento = {"camara1": None, "camara2": None}
-        self.detecto = {"camara1": False, "camara2": False}
-        self.sound_path = {
+        self.sound_path = self.config.get('sonidos', {
             "camara1": "sonido_prueva0.mp3", 
-            "camara2": "sonido_prueva2.mp3"
-        }
+            "camara2": "sonido_prueva2.mp3",
+            "emergencia": "sonido_emergencia.mp3"
+        })
+        self.servicio_audio = None  # Sonidos decodificados en memoria, reproducidos por un hilo propio
+        
+        # Correlación entre cámaras por eventos: cada regla dice qué ROIs deben detectar juntas
+        self.correlador = RuleCorrelator(
+            self.registro.rule_windows(),
+            cooldown=self.config.get('enfriamiento_alarma', 3),
+            on_alarm=self.alarma_disparada
+        )
+        
+        # Control adaptativo de la tasa de inferencia (batería / temperatura)
+        self.periodo_inferencia = 0.0  # Segundos mínimos entre ciclos de detección (0 = sin límite)
+        self.optimizador = None
+        if self.config.get('control_tasa_adaptativo', True):
+            self.optimizador = OptimizadorEnergia()
+            self.optimizador.controlador.suscribir(self.aplicar_punto_operacion)
         
         # Configuración de horarios
         self.hora_inicio = self.config.get('hora_inicio', 6)  # 6 AM
@@ -127,16 +191,13 @@ class SistemaVigilanciaAutonomo:
         self.logger.addHandler(file_handler)
         self.logger.addHandler(console_handler)
         
-        # Logger para detecciones
-        self.detection_logger = logging.getLogger('detecciones')
-        detection_handler = RotatingFileHandler(
-            log_dir / 'detecciones.log',
-            maxBytes=5*1024*1024,  # 5MB
-            backupCount=3
+        # Eventos de detección y alarma: base SQLite indexada por tiempo y cámara, escrita por lotes desde un hilo propio
+        # (consultas: python -m ModulosGenerales.event_store alarms --camera camara2 --since 7d)
+        self.eventos = EventStore(
+            self.config.get('base_eventos', 'logs/eventos.db'),
+            retention_days=self.config.get('retencion_eventos_dias', 30)
         )
-        detection_handler.setFormatter(formatter)
-        self.detection_logger.addHandler(detection_handler)
-        self.detection_logger.setLevel(logging.INFO)
+        self.eventos.start()
 
     def setup_gpio(self):
         """Configura pines GPIO para Raspberry Pi"""
@@ -145,6 +206,7 @@ class SistemaVigilanciaAutonomo:
             self.pin_led = self.config.get('pin_led_status', 18)
             self.pin_boton = self.config.get('pin_boton_emergencia', 24)
             self.pin_buzzer = self.config.get('pin_buzzer', 25)
+            self.gpio_activo = True
             return
             
         try:
@@ -166,36 +228,135 @@ class SistemaVigilanciaAutonomo:
             self.pin_buzzer = self.config.get('pin_buzzer', 25)
             GPIO.setup(self.pin_buzzer, GPIO.OUT)
             
+            self.gpio_activo = True
             self.logger.info("GPIO configurado correctamente")
         except Exception as e:
+            self.gpio_activo = False
             self.logger.error(f"Error configurando GPIO: {e}")
 
+    def liberar_gpio(self):
+        """Libera los pines GPIO"""
+        if RASPBERRY_PI and self.gpio_activo:
+            GPIO.cleanup()
+        self.gpio_activo = False
+
+    def verificar_gpio(self):
+        """Indica si los pines GPIO están configurados"""
+        return self.gpio_activo
+
     def inicializar_componentes(self):
-        """Inicializa todos los componentes del sistema"""
+        """Registra cada componente con su rutina de inicio, parada y verificación, y los inicia"""
         try:
-            # Inicializar pygame para audio
-            pygame.mixer.init()
-            
-            # Cargar modelo YOLO
-            self.modelo = YOLO('best.pt')
-            self.logger.info("Modelo YOLO cargado correctamente")
-            
-            # Inicializar cámara
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
-                raise Exception("No se pudo abrir la cámara")
-            
-            # Configurar cámara para mejor rendimiento
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.cap.set(cv2.CAP_PROP_FPS, 15)  # Reducir FPS para ahorrar energía
-            
-            self.logger.info("Cámara inicializada correctamente")
-            
+            self.supervisor.register("gpio", self.setup_gpio, self.liberar_gpio, self.verificar_gpio)
+            self.supervisor.register("audio", self.inicializar_audio, self.liberar_audio, self.verificar_audio)
+            self.supervisor.register("modelo", self.inicializar_modelo, self.liberar_modelo, self.verificar_modelo)
+            self.supervisor.register("camara", self.inicializar_camara, self.liberar_camara, self.verificar_camara)
+            self.supervisor.start_all()
         except Exception as e:
             self.logger.error(f"Error inicializando componentes: {e}")
             raise
 
+    def inicializar_audio(self):
+        """Inicializa pygame para audio y decodifica todos los sonidos una sola vez"""
+        pygame.mixer.init()
+        self.servicio_audio = AudioService(SoundBank(self.sound_path))
+        self.servicio_audio.start()
+
+    def liberar_audio(self):
+        """Detiene el servicio de audio y cierra el mezclador"""
+        if self.servicio_audio:
+            self.servicio_audio.stop()
+            self.servicio_audio = None
+        if pygame.mixer.get_init():
+            pygame.mixer.quit()
+
+    def verificar_audio(self):
+        """Indica si el mezclador está inicializado y el hilo de reproducción sigue vivo"""
+        return pygame.mixer.get_init() is not None and self.servicio_audio is not None and self.servicio_audio.is_alive()
+
+    def inicializar_modelo(self):
+        """Carga el modelo YOLO con el runtime más rápido disponible (OpenVINO / ONNX Runtime / PyTorch)"""
+        # El modelo INT8 solo se activa si no pierde detecciones frente a FP32
+        opciones_modelo = {
+            "weights": 'best.pt',
+            "imgsz": self.config.get('tamano_entrada', 640),
+            "preferred": self.config.get('backend_inferencia', 'auto'),
+            "int8": self.config.get('modo_int8', False),
+            "threshold": self.config.get('umbral_confianza', 0.83),
+            "tolerance": self.config.get('tolerancia_recall_int8', 0.02),
+            "min_boxes": self.config.get('min_cajas_int8', 20),  # Detecciones FP32 mínimas para que la validación cuente
+            "calibration_dir": self.config.get('directorio_calibracion', 'calibracion'),
+            "rect": self.config.get('entrada_rectangular_roi', True),
+        }
+        procesos = self.config.get('procesos_inferencia', 1)
+        if self.config.get('inferencia_en_proceso', True):
+            # Inferencia en procesos dedicados: no compite por el GIL con audio, GPIO y captura.
+            # Con más de un proceso los carriles de cámara infieren en paralelo en distintos núcleos
+            self.modelo = None
+            # Un slot del anillo de memoria compartida por ROI: un lote nunca se queda sin sitio
+            ranuras = max(1, len(self.registro.rois))
+            self.detector_lote = (
+                InferencePool(opciones_modelo, procesos, slots=ranuras) if procesos > 1
+                else InferenceWorker(opciones_modelo, slots=ranuras)
+            )
+            self.detector_lote.start()
+            backend = self.detector_lote.name
+        else:
+            self.modelo = load_configured_backend(opciones_modelo)
+            self.detector_lote = BatchDetector(self.modelo, imgsz=opciones_modelo["imgsz"], rect=opciones_modelo["rect"])
+            backend = self.modelo.name
+        
+        # Reaplicar el tamaño de entrada del punto de operación vigente
+        if self.optimizador:
+            self.detector_lote.imgsz = self.optimizador.controlador.punto_actual().tamano_entrada
+        self.logger.info(f"Modelo YOLO cargado correctamente (backend: {backend})")
+
+    def liberar_modelo(self):
+        """Cierra el detector (termina el proceso de inferencia si existe)"""
+        if self.detector_lote:
+            self.detector_lote.close()
+            self.detector_lote = None
+        self.modelo = None
+
+    def verificar_modelo(self):
+        """Indica si el detector está cargado y, en modo proceso, si el proceso sigue vivo"""
+        if self.detector_lote is None:
+            return False
+        return not isinstance(self.detector_lote, (InferenceWorker, InferencePool)) or self.detector_lote.is_alive()
+
+    def inicializar_camara(self):
+        """Arranca un carril (hilo lector + hilo de procesamiento) por cada dispositivo del registro.
+        Cada carril abre su cámara y la reabre con espera exponencial si se cae, sin frenar a los demás"""
+        for dispositivo, spec in self.registro.devices.items():
+            carril = DeviceLane(
+                dispositivo,
+                self.registro.rois_of(dispositivo),
+                lambda dispositivo=dispositivo: self.registro.open(dispositivo),
+                self.procesar_carril,
+                reference_size=(spec.width, spec.height),
+                period=self.periodo_inferencia
+            )
+            # Resolución del punto de operación vigente (se reaplica en cada reconexión)
+            if self.optimizador:
+                carril.set_resolution(*self.optimizador.controlador.punto_actual().resolucion)
+            carril.start()
+            self.carriles[dispositivo] = carril
+        
+        self.logger.info(f"Carriles de cámara iniciados: {sorted(self.carriles)}")
+
+    def liberar_camara(self):
+        """Detiene los carriles y libera los dispositivos"""
+        for carril in self.carriles.values():
+            carril.stop()
+        self.carriles = {}
+        if self.seguimiento:
+            for cam_name in self.rois:
+                self.seguimiento.drop(cam_name)
+
+    def verificar_camara(self):
+        """Indica si todos los carriles siguen vivos (una cámara caída la reabre su propio carril)"""
+        return bool(self.carriles) and all(carril.is_alive() for carril in self.carriles.values())
+
     def es_horario_activo(self):
         """Verifica si el sistema debe estar activo según la hora"""
         hora_actual = datetime.datetime.now().hour
@@ -286,10 +447,8 @@ class SistemaVigilanciaAutonomo:
     def reproducir_sonido_emergencia(self):
         """Reproduce sonido de emergencia"""
         try:
-            pygame.mixer.music.load("sonido_emergencia.mp3")
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
+            if self.servicio_audio:
+                self.servicio_audio.play("emergencia", PRIORITY_EMERGENCY)
         except Exception as e:
             self.logger.error(f"Error reproduciendo sonido de emergencia: {e}")
 
@@ -303,111 +462,146 @@ class SistemaVigilanciaAutonomo:
     def limpiar_recursos(self):
         """Limpia todos los recursos del sistema"""
         try:
-            if self.cap:
-                self.cap.release()
-            cv2.destroyAllWindows()
-            if RASPBERRY_PI:
-                GPIO.cleanup()
+            self.supervisor.stop_all()
+            self.vista_previa.stop()  # Cierra las ventanas desde el hilo que las abrió
+            self.eventos.stop()  # Escribe los eventos pendientes antes de cerrar la base
+            if self.servidor_mjpeg:
+                self.servidor_mjpeg.stop()
+                self.servidor_mjpeg = None
             self.logger.info("Recursos limpiados correctamente")
         except Exception as e:
             self.logger.error(f"Error limpiando recursos: {e}")
 
-    def reiniciar_sistema(self):
-        """Reinicia el sistema automáticamente"""
-        self.contador_reinicios += 1
-        self.logger.warning(f"Reiniciando sistema (intento {self.contador_reinicios}/{self.max_reinicios})")
+    def reiniciar_sistema(self, componente=None):
+        """Reinicia solo los componentes caídos; el resto (p. ej. el modelo ya cargado) sigue en marcha"""
+        if componente:
+            self.supervisor.mark_failed(componente)
+        caidos = self.supervisor.check()
+        if not caidos:
+            return True
         
-        if self.contador_reinicios >= self.max_reinicios:
-            self.logger.critical("Máximo número de reinicios alcanzado, activando señal de emergencia")
+        agotados = self.supervisor.exhausted()
+        if agotados:
+            self.logger.critical(f"Máximo número de reinicios alcanzado en {agotados}, activando señal de emergencia")
             self.activar_senal_emergencia()
             return False
         
-        # Limpiar recursos actuales
-        self.limpiar_recursos()
-        time.sleep(5)  # Esperar antes de reiniciar
-        
-        # Reinicializar componentes
-        try:
-            self.inicializar_componentes()
-            self.contador_reinicios = 0  # Reset contador si reinicio exitoso
-            return True
-        except Exception as e:
-            self.logger.error(f"Error en reinicio: {e}")
-            return False
+        pendientes = self.supervisor.recover()
+        recuperados = [nombre for nombre in caidos if nombre not in pendientes]
+        if recuperados:
+            self.logger.warning(f"Componentes recuperados: {recuperados}")
+        return True
 
-    def tomar_frame(self):
-        """Captura frame de la cámara"""
-        try:
-            ret, frame = self.cap.read()
-            if not ret:
-                raise Exception("Error capturando frame")
+    def procesar_carril(self, dispositivo, vistas):
+        """Procesa un frame nuevo de un dispositivo (se llama desde el hilo de su carril)"""
+        if self.en_espera:
+            return
+        
+        # Métricas de salud sobre el frame ya capturado (una vez por dispositivo)
+        self.salud_camaras.update(dispositivo, next(iter(vistas.values())).frame)
+        
+        # Detección de todas las ROIs del dispositivo en un solo lote
+        resultados = self.deteccion_lote(vistas)
+        
+        for cam_name, vista in vistas.items():
+            results = resultados.get(cam_name)
+            if results is None:
+                continue
             
-            return {
-                "camara1": frame.copy(),
-                "camara2": frame.copy()
-            }
-        except Exception as e:
-            self.logger.error(f"Error tomando frame: {e}")
-            return None
+            # Frame de solo lectura compartido; la vista previa copia solo si dibuja
+            self.dibujar_ventanas(cam_name, vista.frame, results, *vista.roi)
+            
+            # Procesar detecciones: como máximo un evento por cámara y frame (la caja de mayor confianza)
+            if not results:
+                continue
+            evento = self.filtro_detecciones.select(cam_name, results[0].boxes)
+            if evento is None:
+                continue
+            
+            # Mientras haya detección la compuerta no debe cerrarse (persona quieta)
+            if self.compuerta_movimiento:
+                self.compuerta_movimiento.keep_open(cam_name)
+            
+            self.eventos.record_detection(evento, vista.captured.timestamp)
+            if not self.correlador.is_active(cam_name):
+                self.logger.info(f"Clase detectada con {evento.conf*100:.2f}% de confianza en {cam_name}")
+            self.correlador.detection(cam_name, vista.captured.timestamp)
 
     def deteccion_roi(self, frame, roi_x1, roi_y1, roi_x2, roi_y2):
         """Realiza detección en región de interés"""
         try:
             frame_roi = frame[roi_y1:roi_y2, roi_x1:roi_x2]
-            results = self.modelo(frame_roi)
+            results = self.detector_lote.detect({"roi": frame_roi})["roi"]
             return results
         except Exception as e:
             self.logger.error(f"Error en detección ROI: {e}")
             return None
 
-    def dibujar_ventanas(self, cam_name, frame, results, roi_x1, roi_y1, roi_x2, roi_y2):
-        """Dibuja ventanas de visualización"""
+    def deteccion_lote(self, vistas):
+        """Realiza la detección de todas las ROIs de un dispositivo en una sola llamada al modelo"""
         try:
-            # Dibujar ROI
-            cv2.rectangle(frame, (roi_x1, roi_y1), (roi_x2, roi_y2), (0, 255, 0), 2)
-            
-            if results and len(results) > 0:
-                annotated_frame = results[0].plot()
-                cv2.imshow(f"{cam_name} - ROI", annotated_frame)
-            
-            cv2.imshow(f"{cam_name} - Frame completo", frame)
-            
+            recortes = {}
+            seguidos = {}
+            for cam_name, vista in vistas.items():
+                recorte = vista.crop  # Vista de solo lectura del frame compartido, ya escalada a su resolución
+                # Sin movimiento en la ROI (y sin refresco pendiente) no se corre el detector
+                if self.compuerta_movimiento and not self.compuerta_movimiento.should_run(cam_name, recorte):
+                    if self.seguimiento:
+                        self.seguimiento.drop(cam_name)
+                    continue
+                # Entre keyframes las cajas se propagan con flujo óptico en lugar de correr el detector
+                if self.seguimiento and not self.seguimiento.needs_detection(cam_name, recorte):
+                    resultado = self.seguimiento.track(cam_name, recorte)
+                    if resultado is not None:
+                        seguidos[cam_name] = resultado
+                        continue
+                recortes[cam_name] = recorte
+            resultados = self.detector_lote.detect(recortes)
+            if self.seguimiento:
+                for cam_name, results in resultados.items():
+                    self.seguimiento.reset(cam_name, recortes[cam_name], results[0])
+            resultados.update(seguidos)
+            return resultados
         except Exception as e:
-            self.logger.error(f"Error dibujando ventanas: {e}")
+            self.logger.error(f"Error en detección por lote: {e}")
+            return {}
 
-    def protocolo_deteccion(self, cam_name, ventana_tiempo):
-        """Protocolo de detección con coordinación entre cámaras"""
-        try:
-            otra = "camara2" if cam_name == "camara1" else "camara1"
-            self.detecto[cam_name] = True
-            contador = 0
+    def dibujar_ventanas(self, cam_name, frame, results, roi_x1, roi_y1, roi_x2, roi_y2):
+        """Publica el último frame y resultados para la vista previa (el dibujo ocurre en su propio hilo)"""
+        self.vista_previa.publish(cam_name, frame, (roi_x1, roi_y1, roi_x2, roi_y2), results)
 
-            with self.lock:
-                while self.detecto[cam_name] and contador < ventana_tiempo:
-                    time.sleep(1)
-                    contador += 1
+    def alarma_disparada(self, alarma):
+        """Recibe la alarma del correlador y pide su sonido (el de la cámara que detectó primero) sin bloquear"""
+        espera = alarma.timestamp - alarma.first_seen[alarma.camera]
+        alarma_id = self.eventos.record_alarm(alarma)
+        self.logger.info(
+            f"🚨 Alarma {alarma_id} ({alarma.rule}) disparada con {espera:.3f}s (primera detección en {alarma.camera}, "
+            f"última en {alarma.last_camera}, decisión en {alarma.latency * 1000:.2f} ms)"
+        )
+        if self.servicio_audio:
+            self.servicio_audio.play(alarma.camera, PRIORITY_ALARM, created=alarma.timestamp)
 
-                    if self.detecto[cam_name] and self.detecto[otra]:
-                        self.detection_logger.info(f"🚨 Alarma disparada con {contador}s (última detección en {cam_name})")
-                        
-                        # Reproducir sonido
-                        try:
-                            pygame.mixer.music.load(self.sound_path[cam_name])
-                            pygame.mixer.music.play()
-                            while pygame.mixer.music.get_busy():
-                                pygame.time.Clock().tick(10)
-                        except Exception as e:
-                            self.logger.error(f"Error reproduciendo sonido: {e}")
-                        
-                        self.detecto[cam_name] = False
-                        self.detecto[otra] = False
-                        break
+    def aplicar_punto_operacion(self, punto):
+        """Aplica al pipeline en vivo el punto de operación publicado por el controlador"""
+        self.periodo_inferencia = 1.0 / punto.fps_inferencia if punto.fps_inferencia > 0 else 0.0
+        if self.detector_lote:
+            self.detector_lote.imgsz = punto.tamano_entrada
+        for carril in self.carriles.values():
+            carril.period = self.periodo_inferencia
+            carril.set_resolution(*punto.resolucion)
+        self.logger.info(f"Punto de operación aplicado: {punto}")
 
-                self.detecto[cam_name] = False
-                self.detecto[otra] = False
-                
-        except Exception as e:
-            self.logger.error(f"Error en protocolo de detección: {e}")
+    def control_tasa(self):
+        """Lazo de control: lee el estado de energía y ajusta el punto de operación"""
+        while self.sistema_activo:
+            try:
+                estado = self.optimizador.evaluar_estado_sistema()
+                if estado:
+                    self.optimizador.controlador.actualizar(estado)
+                time.sleep(self.optimizador.config.get('monitoreo_intervalo', 30))
+            except Exception as e:
+                self.logger.error(f"Error en control de tasa: {e}")
+                time.sleep(10)
 
     def heartbeat(self):
         """Sistema de heartbeat para monitoreo"""
@@ -426,6 +620,31 @@ class SistemaVigilanciaAutonomo:
                 if not self.verificar_estado_sistema():
                     self.logger.warning("Problemas detectados en el sistema")
                 
+                if self.detector_lote:
+                    self.logger.debug(f"Latencia de inferencia por lote: {self.detector_lote.stats()}")
+                
+                if self.compuerta_movimiento:
+                    self.logger.debug(f"Inferencias omitidas / ejecutadas: {self.compuerta_movimiento.stats()}")
+                
+                if self.seguimiento:
+                    self.logger.debug(f"Frames detectados / seguidos: {self.seguimiento.stats()}")
+                
+                self.correlador.tick()
+                if self.servicio_audio:
+                    self.logger.debug(f"Servicio de audio: {self.servicio_audio.stats()}")
+                self.logger.debug(f"Correlación de alarmas: {self.correlador.stats()}")
+                
+                self.logger.debug(f"Estado de componentes: {self.supervisor.state()}")
+                
+                caidas = [dispositivo for dispositivo, carril in self.carriles.items() if not carril.healthy]
+                if caidas:
+                    self.logger.warning(f"Modo degradado, cámaras reconectando: {caidas}")
+                for dispositivo, carril in self.carriles.items():
+                    self.logger.debug(f"Carril {dispositivo}: {carril.stats()}")
+                    problemas = self.salud_camaras.problems(dispositivo)
+                    if problemas:
+                        self.logger.warning(f"Cámara {dispositivo} con problemas: {sorted(problemas)}")
+                
                 self.ultimo_heartbeat = time.time()
                 time.sleep(self.config.get('heartbeat_interval', 30))
                 
@@ -440,59 +659,49 @@ class SistemaVigilanciaAutonomo:
             heartbeat_thread = threading.Thread(target=self.heartbeat, daemon=True)
             heartbeat_thread.start()
             
+            # Iniciar thread de vista previa (no hace nada en modo headless)
+            self.vista_previa.start()
+            if self.servidor_mjpeg:
+                try:
+                    self.servidor_mjpeg.start()
+                except Exception as e:
+                    self.logger.error(f"No se pudo iniciar el servidor MJPEG: {e}")
+                    self.servidor_mjpeg = None
+            
+            # Iniciar thread del control adaptativo de tasa
+            if self.optimizador:
+                control_thread = threading.Thread(target=self.control_tasa, daemon=True)
+                control_thread.start()
+            
             self.logger.info("Sistema iniciado correctamente")
             
+            # La captura y la detección corren en los carriles de cada cámara; este bucle solo supervisa
             while self.sistema_activo:
                 try:
+                    # Recuperar solo los componentes caídos (p. ej. el proceso de inferencia o un carril)
+                    if not self.reiniciar_sistema():
+                        break
+                    
                     # Verificar si es horario activo
                     if not self.es_horario_activo():
-                        self.logger.info("Fuera del horario activo, sistema en standby")
+                        if not self.en_espera:
+                            self.logger.info("Fuera del horario activo, sistema en standby")
+                        self.en_espera = True
                         time.sleep(60)  # Esperar 1 minuto
                         continue
+                    self.en_espera = False
                     
-                    # Capturar frames
-                    cola_frames = self.tomar_frame()
-                    if cola_frames is None:
-                        self.logger.error("Error capturando frame, reintentando...")
-                        time.sleep(1)
-                        continue
-                    
-                    # Procesar cada cámara
-                    for cam_name, frame in cola_frames.items():
-                        roi_x1, roi_y1, roi_x2, roi_y2 = self.rois[cam_name]
-                        results = self.deteccion_roi(frame, roi_x1, roi_y1, roi_x2, roi_y2)
-                        
-                        if results is None:
-                            continue
-                        
-                        self.dibujar_ventanas(cam_name, frame, results, roi_x1, roi_y1, roi_x2, roi_y2)
-                        
-                        # Procesar detecciones
-                        if results and len(results) > 0 and results[0].boxes is not None:
-                            for box in results[0].boxes:
-                                conf = float(box.conf[0])
-                                umbral = self.config.get('umbral_confianza', 0.83)
-                                
-                                if conf > umbral and not self.detecto[cam_name]:
-                                    self.detection_logger.info(f"Clase detectada con {conf*100:.2f}% de confianza en {cam_name}")
-                                    
-                                    ventana_tiempo = self.config.get('ventana_tiempo', 5)
-                                    t = threading.Thread(
-                                        target=self.protocolo_deteccion, 
-                                        args=(cam_name, ventana_tiempo), 
-                                        daemon=True
-                                    )
-                                    t.start()
-                    
-                    # Verificar tecla ESC para salir
-                    if cv2.waitKey(1) & 0xFF == 27:
+                    # Verificar tecla ESC para salir (la atiende el hilo de vista previa)
+                    if self.vista_previa.quit_requested():
                         break
+                    
+                    time.sleep(0.5)
                         
                 except Exception as e:
                     self.logger.error(f"Error en bucle principal: {e}")
                     if not self.reiniciar_sistema():
                         break
-                    time.sleep(5)
+                    time.sleep(1)
                     
         except Exception as e:
             self.logger.critical(f"Error crítico en sistema: {e}")
@@ -0,0 +1,162 @@
+from ModulosGenerales.alarm_correlator import AlarmCorrelator, RuleCorrelator, TimerWheel
+
+# The correlator is driven step by step with a fake clock. Times and resolutions are
+# powers of two fractions, so slot boundaries are exact in floating point.
+
+
+class FakeClock:
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_correlator(clock, window=5.0, cooldown=0.0, resolution=0.5):
+    alarms = []
+    correlator = AlarmCorrelator(["camara1", "camara2"], window, cooldown, alarms.append, clock, resolution)
+    return correlator, alarms
+
+
+def test_alarm_when_both_cameras_detect_within_the_window():
+    clock = FakeClock()
+    correlator, alarms = make_correlator(clock)
+
+    assert correlator.detection("camara1") is None
+    clock.now = 4.5
+    alarm = correlator.detection("camara2")
+
+    assert alarm is not None and alarms == [alarm]
+    assert (alarm.camera, alarm.last_camera) == ("camara1", "camara2")
+    assert alarm.first_seen == {"camara1": 0.0, "camara2": 4.5}
+    assert alarm.latency == 0.0
+
+
+def test_window_expires_exactly_at_the_slot_boundary():
+    clock = FakeClock()
+    correlator, alarms = make_correlator(clock)
+
+    correlator.detection("camara1")
+    clock.now = 4.5 # Last slot before the deadline
+    correlator.tick()
+    assert correlator.is_active("camara1")
+
+    clock.now = 5.0 # Deadline of the window, on a slot boundary
+    assert correlator.detection("camara2") is None
+    assert not correlator.is_active("camara1")
+    assert correlator.is_active("camara2")
+    assert alarms == []
+    assert correlator.stats()["expired_windows"] == 1
+
+
+def test_window_of_an_old_event_is_shortened():
+    clock = FakeClock(10.0)
+    correlator, alarms = make_correlator(clock)
+
+    correlator.detection("camara1", timestamp=7.0) # Seen 3 s ago: 2 s of window left
+    clock.now = 11.5
+    assert correlator.is_active("camara1")
+    clock.now = 12.0
+    assert not correlator.is_active("camara1")
+
+    assert correlator.detection("camara1", timestamp=6.5) is None # Already older than the window
+    assert not correlator.is_active("camara1")
+
+
+def test_alarm_rearms_after_the_cooldown():
+    clock = FakeClock()
+    correlator, alarms = make_correlator(clock, cooldown=3.0)
+
+    correlator.detection("camara1")
+    clock.now = 1.0
+    assert correlator.detection("camara2") is not None
+    assert not correlator.is_active("camara1") # Windows are consumed by the alarm
+
+    clock.now = 2.0
+    assert correlator.detection("camara1") is None
+    clock.now = 3.5
+    assert correlator.detection("camara2") is None
+    assert correlator.stats()["suppressed"] == 2
+
+    clock.now = 4.0 # Cooldown over
+    assert correlator.detection("camara1") is None
+    clock.now = 4.5
+    assert correlator.detection("camara2") is not None
+    assert len(alarms) == 2
+
+
+def test_calls_advance_the_wheel_without_tick():
+    clock = FakeClock()
+    correlator, alarms = make_correlator(clock)
+
+    correlator.detection("camara1")
+    clock.now = 6.0
+    assert not correlator.is_active("camara1") # is_active() expires the window by itself
+
+    correlator.detection("camara2")
+    clock.now = 12.0
+    assert correlator.detection("camara1") is None # detection() expires camara2 first
+    assert correlator.stats()["open_windows"] == ["camara1"]
+    assert correlator.stats()["expired_windows"] == 2
+    assert alarms == []
+
+
+def test_wheel_keeps_timers_of_later_revolutions():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=1.0, slots=4, clock=clock)
+    fired = []
+
+    wheel.schedule(10.0, fired.append, "late") # Same slot as tick 2 and tick 6
+    for now in (2.0, 6.0, 9.0):
+        assert wheel.advance(now) == 0
+    assert len(wheel) == 1
+
+    assert wheel.advance(10.0) == 1
+    assert fired == ["late"] and len(wheel) == 0
+
+
+def test_wheel_gap_longer_than_a_revolution_fires_in_deadline_order():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=1.0, slots=4, clock=clock)
+    fired = []
+
+    for delay in (9.0, 1.0, 3.0, 6.0):
+        wheel.schedule(delay, fired.append, delay)
+    cancelled = wheel.schedule(2.0, fired.append, "cancelled")
+    cancelled.cancel()
+
+    assert wheel.advance(100.0) == 4
+    assert fired == [1.0, 3.0, 6.0, 9.0]
+    assert len(wheel) == 0
+
+
+def test_wheel_wraparound_with_the_correlator():
+    clock = FakeClock()
+    correlator = AlarmCorrelator(["camara1", "camara2"], 5.0, clock=clock, resolution=0.5, slots=4) # Window of 10 ticks over 4 slots
+
+    correlator.detection("camara1")
+    for now in (1.0, 2.0, 3.0, 4.5): # Visits the slot of the deadline before its revolution
+        clock.now = now
+        assert correlator.is_active("camara1")
+    clock.now = 5.0
+    assert not correlator.is_active("camara1")
+
+
+def test_rules_are_independent():
+    clock = FakeClock()
+    alarms = []
+    correlator = RuleCorrelator(
+        {"paso": (["camara1", "camara2"], 5.0), "salida": (["camara2", "camara3"], 1.0)},
+        on_alarm=alarms.append,
+        clock=clock,
+    )
+
+    correlator.detection("camara2")
+    clock.now = 2.0
+    assert correlator.detection("camara3") is None # Outside the 1 s window of "salida"
+    alarm = correlator.detection("camara1")
+
+    assert alarm is not None and alarm.rule == "paso"
+    assert [a.rule for a in alarms] == ["paso"]
+    assert correlator.is_active("camara3")